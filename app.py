@@ -2,12 +2,18 @@ import streamlit as st
 
 import os
 
+from recommender import warmup
 from db import databricks_preflight, missing_credentials
-from recommender import logic as rlogic
-from recommender import ui_helpers as uihelpers
+from recommender import profiling
 
+# recommender.logic and ui_helpers pull in pandas and the recommender core
+# (about half a second cold); they are imported where a search, a Generate
+# click or the profiler first needs them, so the input form renders without.
 
 st.set_page_config(page_title="Playlist Recommender — Input", layout="wide")
+if profiling.enabled(st.query_params):
+    from recommender import ui_helpers as uihelpers
+    uihelpers.profile_page(__file__, "Input")
 
 st.title("Playlist Recommender")
 st.caption(
@@ -25,6 +31,9 @@ if missing:
     )
     st.stop()
 
+# Once per process: connections, gold probe, popularity head and stats in the background.
+warmup.start_warmup()
+
 
 def _ensure_databricks_reachable() -> bool:
     # Cache the preflight result per session to avoid repeated socket checks,
@@ -40,6 +49,19 @@ def _ensure_databricks_reachable() -> bool:
     st.session_state["db_preflight_host"] = host
     return bool(ok)
 
+
+def _check_gold_tables():
+    # Without gold tables, popularity and stats fall back to full fact-table
+    # scans, so make that visible instead of silently slow. The warm-up thread
+    # probes the manifest once per process; until it has, nothing is shown.
+    probe = warmup.startup_report()["phases"].get("gold_probe", {})
+    if probe.get("status") == "error":
+        st.caption(f"Gold tables unavailable — popularity uses the slow fact-table fallback. {probe.get('error', '')}")
+
+
+if _ensure_databricks_reachable():
+    _check_gold_tables()
+
 seed_mode = st.radio(
     "Choose a seed type",
     ["Track name", "Artist name", "Playlist name"],
@@ -75,8 +97,11 @@ if seed_mode == "Track name":
                 st.caption("Check internet/VPN/firewall. You can also test connectivity with `Test-NetConnection <hostname> -Port 443`.")
                 matches = None
                 raise RuntimeError("Databricks preflight failed")
+            from recommender import logic as rlogic
+            from recommender import ui_helpers as uihelpers
+
             with st.spinner("Searching tracks..."):
-                matches = rlogic.search_tracks_by_title(q, limit=25)
+                matches = uihelpers.run_superseding("search", rlogic.search_tracks_by_title, q, limit=25)
         except Exception as e:
             if "Databricks preflight failed" not in str(e):
                 st.error("Track search failed.")
@@ -126,8 +151,11 @@ elif seed_mode == "Artist name":
                 st.caption("Check internet/VPN/firewall. You can also test connectivity with `Test-NetConnection <hostname> -Port 443`.")
                 df = None
                 raise RuntimeError("Databricks preflight failed")
+            from recommender import logic as rlogic
+            from recommender import ui_helpers as uihelpers
+
             with st.spinner("Searching artist tracks..."):
-                df = rlogic.search_artist_top_tracks(q, limit=40)
+                df = uihelpers.run_superseding("search", rlogic.search_artist_top_tracks, q, limit=40)
         except Exception as e:
             if "Databricks preflight failed" not in str(e):
                 st.error("Artist search failed.")
@@ -183,8 +211,11 @@ else:  # Playlist name
                 st.caption("Check internet/VPN/firewall. You can also test connectivity with `Test-NetConnection <hostname> -Port 443`.")
                 pls = None
                 raise RuntimeError("Databricks preflight failed")
+            from recommender import logic as rlogic
+            from recommender import ui_helpers as uihelpers
+
             with st.spinner("Searching playlists..."):
-                pls = rlogic.search_playlists_by_name(q, limit=25)
+                pls = uihelpers.run_superseding("search", rlogic.search_playlists_by_name, q, limit=25)
         except Exception as e:
             if "Databricks preflight failed" not in str(e):
                 st.error("Playlist search failed.")
@@ -206,8 +237,9 @@ else:  # Playlist name
 
 st.divider()
 
+# st.json rather than st.write: st.write imports pandas to sniff for dataframes.
 with st.expander("Ready to generate?", expanded=False):
-    st.write(
+    st.json(
         {
             "seed_mode": seed_mode,
             "model": model,
@@ -221,6 +253,8 @@ if st.button("Generate recommendations", type="primary"):
     if (not seed_track_uris) and (not playlist_id):
         st.error("Select a seed track (Track/Artist mode) or choose a playlist (Playlist mode) before generating.")
         st.stop()
+    from recommender import ui_helpers as uihelpers
+
     uihelpers.save_inputs_to_session(
         seed_track_uris=seed_track_uris,
         playlist_id=playlist_id,
@@ -232,15 +266,23 @@ if st.button("Generate recommendations", type="primary"):
     try:
         with st.spinner("Generating recommendations and caching explanation signals..."):
             uihelpers.run_recommender_and_store()
+        if uihelpers.get_served_by() == "approximate":
+            st.warning("The exact query would not fit the time budget, so an approximate result was stored. See page 2 for details.")
+        elif uihelpers.get_served_by() != "exact":
+            st.warning("The backend ran out of time, so a fallback result was stored. See page 2 for details.")
         st.success(
             "Done. Open '2 — Recommendation Results' for the ranked list, then '3 — Explanation / Relationships' to see why items were recommended."
         )
 
+        run_id = uihelpers.get_run_id()
+        link_params = {"run": run_id} if run_id else None
         c1, c2 = st.columns(2)
         with c1:
-            st.page_link("pages/2_Recommendation_Results.py", label="Go to Recommendation Results")
+            st.page_link("pages/2_Recommendation_Results.py", label="Go to Recommendation Results", query_params=link_params)
         with c2:
-            st.page_link("pages/3_Explanation_Relationships.py", label="Go to Explanation / Relationships")
+            st.page_link("pages/3_Explanation_Relationships.py", label="Go to Explanation / Relationships", query_params=link_params)
+        if run_id:
+            st.caption(f"Run `{run_id}` is saved: pages 2–4 reopen it from a link with `?run={run_id}`.")
     except Exception as e:
         st.error("Recommendation failed.")
         st.exception(e)
@@ -249,3 +291,7 @@ st.caption(
     "No plots or metrics are shown here by design. "
     "This page only captures inputs and generates a session-scoped recommendation run."
 )
+
+warmup.mark_interactive()
+with st.expander("Startup timings", expanded=False):
+    st.json(warmup.startup_report())
@@ -1,6 +1,25 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import importlib
 import os
-import pandas as pd
+import re
+import threading
 import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
 
 
 try:
@@ -8,16 +27,69 @@ try:
 except Exception:
     load_dotenv = None
 
-try:
-    from databricks import sql
-except Exception:
-    sql = None
+
+# pandas, the Databricks connector and DuckDB are imported on first use so that
+# importing db (every page does) stays cheap; the warm-up thread pre-imports them.
+_MISSING = object()
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def _optional_module(name: str):
+    mod = _modules.get(name, _MISSING)
+    if mod is _MISSING:
+        with _modules_lock:
+            mod = _modules.get(name, _MISSING)
+            if mod is _MISSING:
+                try:
+                    mod = importlib.import_module(name)
+                except Exception:
+                    mod = None
+                _modules[name] = mod
+    return mod
+
+
+def _pd():
+    return importlib.import_module('pandas')
+
+
+def _databricks_sql():
+    return _optional_module('databricks.sql')
+
+
+def _duckdb():
+    return _optional_module('duckdb')
+
+
+def preload_modules():
+    """Import the heavy backend modules now (e.g. from a background thread)."""
+    _pd()
+    if get_backend() == 'local':
+        _duckdb()
+    else:
+        _databricks_sql()
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Star-schema tables the local backend exposes under the `default` schema.
+LOCAL_TABLES = ('fact_playlist_track', 'dim_track', 'dim_playlist')
+
+# Materialized gold tables (see recommender/materialize.py). They are exposed both
+# unqualified and under `default` because queries use both spellings.
+GOLD_TABLES = (
+    'gold_track_summary',
+    'gold_artist_top_tracks',
+    'gold_artist_neighbors',
+    'gold_dataset_stats',
+    'gold_track_neighbors',
+)
 
 
 if load_dotenv is not None:
     # Allow local development via a .env file. Make the path deterministic
     # so running Streamlit from a different working directory still works.
-    base_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = BASE_DIR
     root_env = os.path.join(base_dir, ".env")
     frontend_env = os.path.join(base_dir, "Frontend", ".env")
 
@@ -45,7 +117,38 @@ def _get_credential(name: str):
     return None
 
 
+def get_backend() -> str:
+    """Return the configured query backend: 'databricks' (default) or 'local'.
+
+    The local backend runs the same SQL with DuckDB over Parquet files in
+    `local_data_dir()`, so the app can be developed and load-tested offline.
+    """
+    v = (_get_credential('RECOMMENDER_BACKEND') or 'databricks').strip().lower()
+    return 'local' if v in ('local', 'duckdb', 'offline') else 'databricks'
+
+
+def local_data_dir() -> str:
+    v = _get_credential('RECOMMENDER_LOCAL_DIR')
+    return os.path.abspath(v) if v else os.path.join(BASE_DIR, 'data')
+
+
+def local_table_source(name: str, data_dir: str = None):
+    """Resolve a local table to a Parquet file or a glob over a partitioned directory."""
+    data_dir = data_dir or local_data_dir()
+    for base in (data_dir, os.path.join(data_dir, 'gold')):
+        single = os.path.join(base, f"{name}.parquet")
+        if os.path.isfile(single):
+            return single
+        folder = os.path.join(base, name)
+        if os.path.isdir(folder):
+            return os.path.join(folder, '**', '*.parquet')
+    return None
+
+
 def missing_credentials():
+    if get_backend() == 'local':
+        # No warehouse credentials needed; the preflight checks the data directory.
+        return []
     required = [
         'DATABRICKS_SERVER_HOSTNAME',
         'DATABRICKS_HTTP_PATH',
@@ -59,6 +162,14 @@ def databricks_preflight(timeout_seconds: float = 3.0):
 
     Returns (ok: bool, message: str).
     """
+    if get_backend() == 'local':
+        if _duckdb() is None:
+            return False, "duckdb is not installed (required for RECOMMENDER_BACKEND=local)."
+        absent = [t for t in LOCAL_TABLES if local_table_source(t) is None]
+        if absent:
+            return False, f"Local data missing in {local_data_dir()}: {', '.join(absent)}"
+        return True, ""
+
     missing = missing_credentials()
     if missing:
         return False, f"Missing credentials: {', '.join(missing)}"
@@ -91,6 +202,7 @@ def _get_connection_uncached():
         missing = missing_credentials()
         hint = ", ".join(missing) if missing else "(unknown)"
         raise RuntimeError(f"Databricks credentials not found. Missing: {hint}")
+    sql = _databricks_sql()
     if sql is None:
         raise RuntimeError('databricks-sql-connector is not installed.')
     return sql.connect(server_hostname=host, http_path=path, access_token=token)
@@ -113,25 +225,492 @@ def get_connection():
     return _get_connection_cached()
 
 
-def execute_sql(query: str, params=None) -> pd.DataFrame:
+_local_conn = None
+_local_conn_lock = threading.Lock()
+
+
+def _register_local_views(conn, data_dir: str):
+    conn.execute('CREATE SCHEMA IF NOT EXISTS "default"')
+    for name in LOCAL_TABLES + GOLD_TABLES:
+        src = local_table_source(name, data_dir)
+        if src is None:
+            continue
+        path = src.replace("'", "''")
+        conn.execute(f'CREATE OR REPLACE VIEW "default".{name} AS SELECT * FROM read_parquet(\'{path}\')')
+        if name in GOLD_TABLES:
+            conn.execute(f'CREATE OR REPLACE VIEW main.{name} AS SELECT * FROM "default".{name}')
+
+
+def open_local_connection(data_dir: str = None):
+    """New DuckDB connection with views over the Parquet tables in `data_dir`."""
+    duckdb = _duckdb()
+    if duckdb is None:
+        raise RuntimeError('duckdb is not installed (required for RECOMMENDER_BACKEND=local).')
+    conn = duckdb.connect()
+    _register_local_views(conn, data_dir or local_data_dir())
+    return conn
+
+
+def get_local_connection():
+    """Process-wide DuckDB connection shared by all local-backend queries."""
+    global _local_conn
+    with _local_conn_lock:
+        if _local_conn is None:
+            _local_conn = open_local_connection()
+        return _local_conn
+
+
+def refresh_local_views():
+    """Re-register local views, e.g. after new gold tables were materialized."""
+    with _local_conn_lock:
+        if _local_conn is not None:
+            _register_local_views(_local_conn, local_data_dir())
+
+
+# --- Cancellation ---
+#
+# Work submitted with `submit()` runs on a worker thread inside a CancelScope.
+# execute_sql registers the active cursor's cancel hook with the scope, so
+# `handle.cancel()` stops the running statement (Databricks `cursor.cancel()`,
+# DuckDB `interrupt()`) and makes further queries in that scope fail fast.
+
+
+class QueryCancelled(RuntimeError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# DuckDB: "Table with name X does not exist"; Databricks: [TABLE_OR_VIEW_NOT_FOUND].
+_MISSING_TABLE_RE = re.compile(r'TABLE_OR_VIEW_NOT_FOUND|Table with name \S+ does not exist|Table or view not found', re.IGNORECASE)
+
+
+def is_missing_table_error(exc: BaseException) -> bool:
+    """True when a query failed because a table or view does not exist (e.g. gold not built)."""
+    return not isinstance(exc, (QueryCancelled, DeadlineExceeded)) and bool(_MISSING_TABLE_RE.search(str(exc)))
+
+
+class CancelScope:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks = {}
+        self._next_id = 0
+        self.cancelled = False
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled('Query was cancelled.')
+
+    def register(self, hook) -> int:
+        with self._lock:
+            self.check()
+            self._next_id += 1
+            self._hooks[self._next_id] = hook
+            return self._next_id
+
+    def unregister(self, token: int):
+        with self._lock:
+            self._hooks.pop(token, None)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            hooks = list(self._hooks.values())
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                pass
+
+
+_current_scope = contextvars.ContextVar('recommender_cancel_scope', default=None)
+
+# Absolute time.monotonic() deadline for queries issued in this context.
+_current_deadline = contextvars.ContextVar('recommender_deadline', default=None)
+_call_timeout = contextvars.ContextVar('recommender_call_timeout', default=None)
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline):
+    """Apply a monotonic deadline to every query in the block (the earliest one wins)."""
+    outer = _current_deadline.get()
+    if deadline is not None and outer is not None:
+        deadline = min(deadline, outer)
+    token = _current_deadline.set(deadline if deadline is not None else outer)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining_budget():
+    """Seconds left before the context deadline, or None when unbounded."""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextlib.contextmanager
+def _cancellable(hook):
+    scope = _current_scope.get()
+    timeout = _call_timeout.get()
+    timer = None
+    fired = threading.Event()
+    if timeout is not None:
+        def _expire():
+            fired.set()
+            hook()
+
+        timer = threading.Timer(max(float(timeout), 0.0), _expire)
+        timer.daemon = True
+        timer.start()
+    token = scope.register(hook) if scope is not None else None
+    try:
+        yield
+    except Exception as e:
+        if fired.is_set():
+            raise DeadlineExceeded(f'Query exceeded its {timeout:.2f}s budget.') from e
+        if scope is not None and scope.cancelled:
+            raise QueryCancelled('Query was cancelled.') from e
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if token is not None:
+            scope.unregister(token)
+
+
+class QueryHandle:
+    """A query (or any backend-calling function) running off the caller's thread."""
+
+    def __init__(self, future, scope: CancelScope):
+        self.future = future
+        self.scope = scope
+
+    def cancel(self):
+        self.future.cancel()
+        self.scope.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.scope.cancelled
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(_get_credential('RECOMMENDER_QUERY_WORKERS') or 8)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recommender-query')
+        return _executor
+
+
+def submit(fn, *args, **kwargs) -> QueryHandle:
+    """Run `fn(*args, **kwargs)` on the query pool inside a fresh CancelScope."""
+    scope = CancelScope()
+
+    def _run():
+        token = _current_scope.set(scope)
+        try:
+            scope.check()
+            return fn(*args, **kwargs)
+        finally:
+            _current_scope.reset(token)
+
+    ctx = contextvars.copy_context()
+    return QueryHandle(_get_executor().submit(ctx.run, _run), scope)
+
+
+def submit_sql(query: str, params=None) -> QueryHandle:
+    return submit(execute_sql, query, params)
+
+
+async def run_async(fn, *args, **kwargs):
+    """Await `fn` on the query pool; cancelling the awaiting task cancels the query."""
+    handle = submit(fn, *args, **kwargs)
+    try:
+        return await asyncio.wrap_future(handle.future)
+    except asyncio.CancelledError:
+        handle.cancel()
+        raise
+
+
+async def execute_sql_async(query: str, params=None) -> pd.DataFrame:
+    return await run_async(execute_sql, query, params)
+
+
+# DuckDB reserves `default`, so schema-qualified names must be quoted.
+_DEFAULT_SCHEMA_RE = re.compile(r'(?<![\w"])default\.')
+
+
+def _execute_local(query: str, params=None) -> pd.DataFrame:
+    # One cursor per call: DuckDB cursors are cheap and safe to use per thread.
+    cur = get_local_connection().cursor()
+    try:
+        q = _DEFAULT_SCHEMA_RE.sub('"default".', query)
+        with _cancellable(cur.interrupt):
+            if params:
+                cur.execute(q, params)
+            else:
+                cur.execute(q)
+            cols = [c[0] for c in cur.description] if cur.description else []
+            rows = cur.fetchall() if cols else []
+        return _pd().DataFrame(rows, columns=cols)
+    finally:
+        cur.close()
+
+
+def execute_sql(query: str, params=None, timeout=None) -> pd.DataFrame:
+    """Run `query` on the configured backend.
+
+    `timeout` (seconds) defaults to the remaining budget of the enclosing
+    `deadline_scope`; when it runs out the statement is cancelled and
+    DeadlineExceeded is raised.
+    """
+    budget = timeout if timeout is not None else remaining_budget()
+    if budget is not None and budget <= 0:
+        raise DeadlineExceeded('Deadline already passed before the query started.')
+    token = _call_timeout.set(budget)
+    try:
+        if single_flight_enabled() and _READ_QUERY_RE.match(query):
+            return _single_flight(query, params)
+        return _execute_sql(query, params)
+    finally:
+        _call_timeout.reset(token)
+
+
+# --- Single-flight ---
+#
+# Identical reads issued concurrently (dataset stats, top artists, a popular
+# playlist right after its cache entry expired) share one execution: the first
+# caller runs the query and the others wait for its result. Callers always get
+# their own DataFrame copy. Set RECOMMENDER_SINGLEFLIGHT_DIR to also coalesce
+# across processes on this host through lock files (POSIX only).
+
+_READ_QUERY_RE = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+_SQL_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+_WHITESPACE_RE = re.compile(r'\s+')
+_FLIGHT_POLL_SECONDS = 0.05
+_FLIGHT_RESULT_MAX_AGE_S = 60.0
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_flight_stats = {'executed': 0, 'coalesced': 0, 'cross_process_hits': 0}
+_last_prune = 0.0
+
+
+def single_flight_enabled() -> bool:
+    return os.environ.get('RECOMMENDER_SINGLE_FLIGHT', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def single_flight_stats() -> dict:
+    with _flights_lock:
+        return dict(_flight_stats, in_flight=len(_flights))
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace outside string literals so formatting differences still coalesce."""
+    parts = _SQL_LITERAL_RE.split(query.strip().rstrip(';').strip())
+    return ''.join(p if i % 2 else _WHITESPACE_RE.sub(' ', p) for i, p in enumerate(parts))
+
+
+def wait_or_raise(poll):
+    """Call `poll()` until it returns True, honouring the caller's cancel scope and budget.
+
+    The budget is the enclosing execute_sql's timeout, else what is left of the
+    caller's deadline_scope (MicroBatcher callers wait outside execute_sql).
+    """
+    scope = _current_scope.get()
+    budget = _call_timeout.get()
+    if budget is None:
+        budget = remaining_budget()
+    deadline = time.monotonic() + budget if budget is not None else None
+    while not poll():
+        if scope is not None:
+            scope.check()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded(f'Query exceeded its {budget:.2f}s budget while waiting for a shared execution.')
+
+
+def _single_flight(query: str, params=None) -> pd.DataFrame:
+    key = (get_backend(), normalize_query(query), repr(params) if params else '')
+    while True:
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = _Flight()
+                _flight_stats['executed'] += 1
+            else:
+                flight.followers += 1
+                _flight_stats['coalesced'] += 1
+
+        if leader:
+            try:
+                df = _cross_process_flight(key, lambda: _execute_sql(query, params))
+            except BaseException as e:
+                with _flights_lock:
+                    del _flights[key]
+                flight.error = e
+                flight.done.set()
+                raise
+            with _flights_lock:
+                del _flights[key]
+                # Keep a private copy only if someone is waiting: the leader may mutate `df`.
+                flight.result = df.copy() if flight.followers else None
+            flight.done.set()
+            return df
+
+        wait_or_raise(lambda: flight.done.wait(_FLIGHT_POLL_SECONDS))
+        if flight.error is None:
+            return flight.result.copy()
+        if isinstance(flight.error, (QueryCancelled, DeadlineExceeded)):
+            # The leader's own cancel/budget ended it, not the query: run it ourselves.
+            continue
+        raise flight.error
+
+
+def _cross_process_flight(key, run):
+    root = os.environ.get('RECOMMENDER_SINGLEFLIGHT_DIR')
+    if not root or fcntl is None:
+        return run()
+    os.makedirs(root, exist_ok=True)
+    digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+    lock_path = os.path.join(root, f'{digest}.lock')
+    result_path = os.path.join(root, f'{digest}.pkl')
+    asked_at = time.time()
+
+    with open(lock_path, 'a+') as fh:
+        def _try_lock():
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                time.sleep(_FLIGHT_POLL_SECONDS)
+                return False
+
+        wait_or_raise(_try_lock)
+        try:
+            # Another process finished the same query while we waited for the lock.
+            try:
+                if os.stat(result_path).st_mtime >= asked_at:
+                    df = _pd().read_pickle(result_path)
+                    with _flights_lock:
+                        _flight_stats['cross_process_hits'] += 1
+                    return df
+            except (FileNotFoundError, EOFError):
+                pass
+            df = run()
+            tmp = f'{result_path}.{os.getpid()}.tmp'
+            df.to_pickle(tmp)
+            os.replace(tmp, result_path)
+            _prune_flight_results(root)
+            return df
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _prune_flight_results(root: str):
+    # Shared results are only useful to callers that were already waiting.
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < _FLIGHT_RESULT_MAX_AGE_S / 2:
+        return
+    _last_prune = now
+    for name in os.listdir(root):
+        if not name.endswith('.pkl'):
+            continue
+        path = os.path.join(root, name)
+        try:
+            if now - os.stat(path).st_mtime > _FLIGHT_RESULT_MAX_AGE_S:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _execute_sql(query: str, params=None) -> pd.DataFrame:
+    if get_backend() == 'local':
+        return _execute_local(query, params)
+
     conn = get_connection()
     try:
-        with conn.cursor() as cur:
+        with conn.cursor() as cur, _cancellable(cur.cancel):
             if params:
                 cur.execute(query, params)
             else:
                 cur.execute(query)
-            cols = [c[0] for c in cur.description]
-            rows = cur.fetchall()
-            return pd.DataFrame(rows, columns=cols)
+            # DDL statements (e.g. gold-table materialization) return no result set.
+            cols = [c[0] for c in cur.description] if cur.description else []
+            rows = cur.fetchall() if cols else []
+            return _pd().DataFrame(rows, columns=cols)
     finally:
-        # If Streamlit cached the connection, do not close it.
-        try:
-            import streamlit as st
+        _release_connection(conn)
+
+
+def _release_connection(conn):
+    # If Streamlit cached the connection, do not close it.
+    try:
+        import streamlit as st
 
-            # When cached, the connection is reused across reruns.
-            # We keep it open and let Streamlit clear it when the cache is cleared.
-            if not st.runtime.exists():
-                conn.close()
-        except Exception:
+        # When cached, the connection is reused across reruns.
+        # We keep it open and let Streamlit clear it when the cache is cleared.
+        if not st.runtime.exists():
             conn.close()
+    except Exception:
+        conn.close()
+
+
+def iter_sql_chunks(query: str, chunk_rows: int = 500_000):
+    """Yield the result of `query` as DataFrames of at most `chunk_rows` rows.
+
+    For background scans that should not hold a whole result in memory; no
+    single-flight, deadline or result caching applies.
+    """
+    if get_backend() == 'local':
+        cur = get_local_connection().cursor()
+        close = cur.close
+        q = _DEFAULT_SCHEMA_RE.sub('"default".', query)
+    else:
+        conn = get_connection()
+        cur = conn.cursor()
+
+        def close():
+            try:
+                cur.close()
+            finally:
+                _release_connection(conn)
+
+        q = query
+    try:
+        with _cancellable(getattr(cur, 'interrupt', None) or cur.cancel):
+            cur.execute(q)
+            cols = [c[0] for c in cur.description] if cur.description else []
+            while cols:
+                rows = cur.fetchmany(int(chunk_rows))
+                if not rows:
+                    break
+                yield _pd().DataFrame(rows, columns=cols)
+    finally:
+        close()
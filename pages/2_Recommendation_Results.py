@@ -6,6 +6,7 @@ from recommender import ui_helpers as uihelpers
 
 
 st.set_page_config(page_title="Recommendation Results", layout="wide")
+uihelpers.profile_page(__file__, "Recommendation Results")
 
 st.title("Recommendation Results")
 st.caption("Page 2/4 — Ranked recommendations (no inputs on this page).")
@@ -16,6 +17,8 @@ if missing:
     st.code("\n".join(missing))
     st.stop()
 
+# ?run=<id> reopens a saved run (reload, new tab, shared link) without backend work.
+uihelpers.hydrate_run_from_url()
 seed_track_uris, playlist_id, playlist_name, seed_mode, model, top_k = uihelpers.load_inputs_from_session()
 recs = uihelpers.get_cached_recommendations()
 
@@ -30,6 +33,20 @@ context = {
 }
 if playlist_id:
     context["Playlist"] = playlist_name or playlist_id
+served_by = uihelpers.get_served_by()
+context["Served by"] = served_by
+run_id = uihelpers.get_run_id()
+if run_id:
+    context["Run ID (share with ?run=)"] = run_id
+
+_DEGRADED_NOTES = {
+    "cache": "The backend ran out of time; showing the most recent result for these seeds.",
+    "popularity_head": "The backend ran out of time; showing globally popular tracks instead.",
+    "partial": "The backend ran out of time; showing a partial result.",
+    "approximate": "The exact query was predicted to overrun the time budget; scores are estimated from part of the seeds' playlists.",
+}
+if served_by in _DEGRADED_NOTES:
+    st.warning(_DEGRADED_NOTES[served_by] + " Generate again to retry.")
 
 with st.expander("Run context", expanded=False):
     st.write(context)
@@ -43,6 +60,13 @@ show = show.rename(columns={"score": score_label})
 st.subheader("Recommended tracks")
 st.dataframe(show, width="stretch", height=520)
 
-seen = uihelpers.get_seen_track_uris()
-if seen:
-    st.caption(f"Already-seen tracks excluded: {len(seen):,}")
+n_pool = uihelpers.get_ranked_pool_size()
+if len(recs) < n_pool:
+    n_next = min(int(top_k), n_pool - len(recs))
+    if st.button(f"Show next {n_next}", help="Served from this run's ranked list; nothing is recomputed."):
+        uihelpers.show_more_recommendations(n_next)
+        st.rerun()
+
+n_seen = uihelpers.get_seen_count()
+if n_seen:
+    st.caption(f"Already-seen tracks excluded: {n_seen:,}")
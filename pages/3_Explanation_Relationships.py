@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
 
 from db import missing_credentials
 from recommender import logic as rlogic
@@ -9,6 +8,7 @@ from recommender import viz
 
 
 st.set_page_config(page_title="Explanation / Relationships", layout="wide")
+uihelpers.profile_page(__file__, "Explanation / Relationships")
 
 st.title("Explanation / Relationships")
 st.caption("Page 3/4 — Relationship-based evidence for why items are recommended.")
@@ -19,6 +19,8 @@ if missing:
     st.code("\n".join(missing))
     st.stop()
 
+# ?run=<id> reopens a saved run (reload, new tab, shared link) without backend work.
+uihelpers.hydrate_run_from_url()
 seed_track_uris, playlist_id, playlist_name, seed_mode, model, top_k = uihelpers.load_inputs_from_session()
 recs = uihelpers.get_cached_recommendations()
 
@@ -28,22 +30,22 @@ if recs is None or recs.empty:
 
 model_l = (model or "").lower()
 
-# For explanation visuals, we intentionally keep the seed set small so the visuals remain readable.
+# Explanations cover the whole seed set; the heatmaps fold long tails into "Other".
 explain_seed_uris = uihelpers.get_explain_seed_track_uris()
 
 if not explain_seed_uris and seed_track_uris:
-    explain_seed_uris = seed_track_uris[:8]
+    explain_seed_uris = list(seed_track_uris)
 
 if not explain_seed_uris:
     st.warning("No seed tracks available to explain relationships. Try using Track or Artist seed input, or a playlist with at least one track.")
     st.stop()
 
-# Candidates to explain (limit to keep charts readable)
-max_candidates = 20
-cand_uris = recs["track_uri"].astype(str).head(max_candidates).tolist()
+# Candidates to explain: every recommendation in the run.
+max_candidates = len(recs)
+cand_uris = recs["track_uri"].astype(str).tolist()
 
-seed_meta = rlogic.fetch_tracks_metadata(explain_seed_uris)
-cand_meta = rlogic.fetch_tracks_metadata(cand_uris)
+seed_meta = uihelpers.run_signal("seed_meta", rlogic.fetch_tracks_metadata, explain_seed_uris)
+cand_meta = uihelpers.run_signal("candidate_meta", rlogic.fetch_tracks_metadata, cand_uris)
 
 seed_label = {
     str(r["track_uri"]): f"{r.get('track_title','')} — {r.get('artist_name','')}"
@@ -54,8 +56,9 @@ cand_label = {
     for _, r in cand_meta.iterrows()
 }
 
-# Base relationship signal: shared playlist counts between each seed track and each recommended track.
-edges_raw = rlogic.seed_candidate_cooccurrence(explain_seed_uris, cand_uris)
+# Base relationship signal: shared playlist counts between each seed track and each recommended track,
+# computed in-process from posting-list intersections.
+edges_raw = uihelpers.run_signal("seed_candidate_edges", rlogic.explain_seed_candidates, explain_seed_uris, cand_uris)
 if edges_raw is None:
     edges_raw = pd.DataFrame()
 
@@ -85,15 +88,12 @@ else:
 
 bar_df = recs.head(max_candidates).copy()
 bar_df["label"] = bar_df["track_title"].astype(str) + " — " + bar_df["artist_name"].astype(str)
-bar = (
-    alt.Chart(bar_df)
-    .mark_bar()
-    .encode(
-        y=alt.Y("label:N", sort='-x', title=None),
-        x=alt.X("score:Q", title=("Shared playlists" if model_l.startswith("co") else "Playlist appearances (global)")),
-        tooltip=["track_title", "artist_name", "score"],
-    )
-    .properties(height=460)
+bar = viz.score_bar(
+    bar_df,
+    label="label",
+    value="score",
+    x_title=("Shared playlists" if model_l.startswith("co") else "Playlist appearances (global)"),
+    tooltip=["track_title", "artist_name", "score"],
 )
 st.altair_chart(bar, width="stretch")
 
@@ -124,7 +124,7 @@ edges = edges_raw.copy()
 if not edges.empty:
     edges = edges.rename(columns={"seed_uri": "src", "cand_uri": "dst", "shared": "weight"})
 
-fig = viz.network_figure(pd.DataFrame(nodes), edges, title="Seed ↔ Recommended relationship network")
+fig = viz.network_figure(pd.DataFrame(nodes), edges, title="Seed ↔ Recommended relationship network", max_edges=2000)
 if fig is None:
     hint = viz.network_deps_hint()
     if hint:
@@ -135,23 +135,38 @@ else:
     st.plotly_chart(fig, use_container_width=True)
 
 st.subheader("Artist–Artist co-occurrence")
-st.caption("Aggregated from the track–track shared-playlist counts above.")
 
 seed_artist = {str(r["track_uri"]): str(r.get("artist_name") or "") for _, r in seed_meta.iterrows()}
 cand_artist = {str(r["track_uri"]): str(r.get("artist_name") or "") for _, r in cand_meta.iterrows()}
 
-artist_edges = edges_raw.copy()
-artist_edges["seed_artist"] = artist_edges["seed_uri"].map(seed_artist).fillna("")
-artist_edges["rec_artist"] = artist_edges["cand_uri"].map(cand_artist).fillna("")
-artist_edges = artist_edges[artist_edges["seed_artist"].ne("") & artist_edges["rec_artist"].ne("")]
-
-if artist_edges.empty:
-    st.info("No artist-level edges available for the current selection.")
+# Prefer the materialized artist layer (whole-catalog shared playlists); fall back
+# to aggregating the track-level counts above.
+seed_artists = sorted({a for a in seed_artist.values() if a})
+rec_artists = {a for a in cand_artist.values() if a}
+gold_aa = uihelpers.run_signal("artist_neighbors", rlogic.artist_neighbors, seed_artists)
+if not gold_aa.empty:
+    gold_aa = gold_aa[gold_aa["neighbor_artist_name"].isin(rec_artists)]
+
+if not gold_aa.empty:
+    st.caption("Playlists shared by any tracks of each artist pair (precomputed over the whole catalog).")
+    aa = gold_aa.rename(columns={"artist_name": "seed_artist", "neighbor_artist_name": "rec_artist"})
+    aa = aa[["seed_artist", "rec_artist", "shared_playlists"]]
+    aa_title = "Artist–artist co-occurrence (shared playlists)"
 else:
+    st.caption("Aggregated from the track–track shared-playlist counts above.")
+    artist_edges = edges_raw.copy()
+    artist_edges["seed_artist"] = artist_edges["seed_uri"].map(seed_artist).fillna("")
+    artist_edges["rec_artist"] = artist_edges["cand_uri"].map(cand_artist).fillna("")
+    artist_edges = artist_edges[artist_edges["seed_artist"].ne("") & artist_edges["rec_artist"].ne("")]
     aa = (
         artist_edges.groupby(["seed_artist", "rec_artist"], as_index=False)["shared"].sum()
         .rename(columns={"shared": "shared_playlists"})
     )
+    aa_title = "Artist–artist co-occurrence (sum of shared playlists across track pairs)"
+
+if aa.empty:
+    st.info("No artist-level edges available for the current selection.")
+else:
     aa = aa.sort_values("shared_playlists", ascending=False)
 
     heat2 = viz.heatmap_rect(
@@ -159,7 +174,7 @@ else:
         x="Seed artist",
         y="Recommended artist",
         value="Shared playlists",
-        title="Artist–artist co-occurrence (sum of shared playlists across track pairs)",
+        title=aa_title,
         height=420,
     )
     if heat2 is not None:
@@ -180,13 +195,13 @@ contrib["seed_track"] = contrib["seed_uri"].map(seed_label).fillna(contrib["seed
 contrib = contrib.sort_values("shared", ascending=False)
 
 if contrib.empty:
-    st.info("No direct shared-playlist evidence found for this item (for the displayed seed subset).")
+    st.info("No direct shared-playlist evidence found for this item.")
 else:
     st.write("Top contributing seed tracks (shared-playlist counts):")
     st.dataframe(contrib[["seed_track", "shared"]].rename(columns={"shared": "shared playlists"}), width="stretch", height=260)
 
 if seed_mode == "Playlist name" and playlist_id:
     st.caption(
-        "Note: for readability, the visuals use only a small subset of tracks from the seed playlist. "
-        "The recommendation ranking itself still uses the full playlist seed in the backend query."
+        f"Explanations cover all {len(explain_seed_uris):,} tracks of the seed playlist. "
+        "Heatmaps show the strongest rows/columns and fold the rest into an 'Other' bucket."
     )
@@ -3,10 +3,12 @@ import pandas as pd
 
 from db import missing_credentials
 from recommender import logic as rlogic
+from recommender import frame_store, router
 from recommender import ui_helpers as uihelpers
 
 
 st.set_page_config(page_title="Recommender Metrics", layout="wide")
+uihelpers.profile_page(__file__, "Recommender Metrics")
 
 st.title("Recommender Metrics")
 st.caption("Page 4/4 — Lightweight metrics to sanity-check the recommendation run.")
@@ -17,6 +19,8 @@ if missing:
     st.code("\n".join(missing))
     st.stop()
 
+# ?run=<id> reopens a saved run (reload, new tab, shared link) without backend work.
+uihelpers.hydrate_run_from_url()
 seed_track_uris, playlist_id, playlist_name, seed_mode, model, top_k = uihelpers.load_inputs_from_session()
 recs = uihelpers.get_cached_recommendations()
 
@@ -42,8 +46,8 @@ st.subheader("Coverage")
 # Artist coverage is an interpretable proxy for diversity.
 artist_coverage = unique_artists / max(len(recs), 1)
 
-seed_for_metrics = uihelpers.get_explain_seed_track_uris() or (seed_track_uris[:8] if seed_track_uris else [])
-seed_meta = rlogic.fetch_tracks_metadata(seed_for_metrics) if seed_for_metrics else pd.DataFrame()
+seed_for_metrics = uihelpers.get_explain_seed_track_uris() or (list(seed_track_uris) if seed_track_uris else [])
+seed_meta = uihelpers.run_signal("seed_meta", rlogic.fetch_tracks_metadata, seed_for_metrics) if seed_for_metrics else pd.DataFrame()
 seed_artists = set(seed_meta.get("artist_name", pd.Series([], dtype=str)).dropna().astype(str).tolist())
 rec_artists = set(recs["artist_name"].dropna().astype(str).tolist())
 new_artist_rate = (len(rec_artists - seed_artists) / max(len(rec_artists), 1)) if rec_artists else 0.0
@@ -58,20 +62,27 @@ st.write(
 st.divider()
 
 st.subheader("Popularity bias (indication)")
-st.caption("Compares average playlist reach of recommendations vs. the seed subset.")
+st.caption("Compares playlist reach of recommendations vs. the seed subset; percentiles are among all tracks in any playlist.")
 
-pop_recs = rlogic.track_popularity_for_uris(rec_track_uris)
-pop_seeds = rlogic.track_popularity_for_uris(seed_for_metrics) if seed_for_metrics else pd.DataFrame(columns=["track_uri", "popularity"])
+pop_recs = rlogic.popularity_summary(rec_track_uris)
+pop_seeds = rlogic.popularity_summary(seed_for_metrics)
 
-avg_pop_recs = float(pop_recs["popularity"].mean()) if not pop_recs.empty else 0.0
-avg_pop_seeds = float(pop_seeds["popularity"].mean()) if not pop_seeds.empty else 0.0
+avg_pop_recs = pop_recs["mean"]
+avg_pop_seeds = pop_seeds["mean"]
 ratio = (avg_pop_recs / avg_pop_seeds) if avg_pop_seeds > 0 else None
 
+
+def _pct(v):
+    return round(v, 1) if v is not None else "n/a"
+
+
 st.write(
     {
         "avg_popularity_recommendations": round(avg_pop_recs, 2),
         "avg_popularity_seed_subset": round(avg_pop_seeds, 2),
         "ratio (recs / seeds)": (round(ratio, 2) if ratio is not None else "n/a"),
+        "median_popularity_percentile_recommendations": _pct(pop_recs["median_percentile"]),
+        "median_popularity_percentile_seed_subset": _pct(pop_seeds["median_percentile"]),
     }
 )
 
@@ -99,5 +110,29 @@ else:
 
 if seed_mode == "Playlist name" and playlist_id:
     st.caption(
-        "Note: for metrics that compare against a seed set, we use a small seed subset for practicality and readability."
+        "Note: metrics that compare against a seed set use every track of the seed playlist."
+    )
+
+st.divider()
+
+with st.expander("Cache memory (this process)", expanded=False):
+    report = uihelpers.cache_memory_report()
+    fs = report["frame_store"]
+    st.caption(
+        f"Result frames: {fs['bytes'] / 1e6:.1f} MB of {fs['max_bytes'] / 1e6:.0f} MB in {fs['entries']:,} entries "
+        f"({fs['format']})."
+    )
+    ns = pd.DataFrame.from_dict(fs["namespaces"], orient="index")
+    if not ns.empty:
+        st.dataframe(ns, width="stretch")
+    st.dataframe(frame_store.entries(limit=50), width="stretch", height=260)
+    st.write({k: v for k, v in report.items() if k != "frame_store"})
+
+with st.expander("Query routing (this process)", expanded=False):
+    st.caption(
+        "Co-occurrence requests go to the posting store, SQL or a budgeted approximation by predicted latency. "
+        "Latency models (fixed cost + cost per seed playlist) are fitted to recorded runs."
     )
+    st.dataframe(router.models(), width="stretch")
+    st.write({f"SQL ({backend}) beats the posting store past (seed playlists)": fanout for backend, fanout in router.thresholds().items()})
+    st.dataframe(router.recent(limit=20), width="stretch")
@@ -96,6 +96,45 @@ def cooccurrence_sql(seed_track_uris, top_k: int) -> str:
     """
 
 
+def batched_cooccurrence_sql(seed_sets, top_k: int) -> str:
+    """Co-occurrence for several seed sets in one pass, tagged by `req_id` (list position).
+
+    Returns (req_id, track_uri, track_title, artist_name, score), top_k per request.
+    """
+    values = ",".join(
+        "(" + str(i) + ", '" + str(u).replace("'", "''") + "')"
+        for i, seeds in enumerate(seed_sets) for u in seeds
+    )
+    return f"""
+    WITH seeds AS (
+        SELECT * FROM (VALUES {values}) AS v(req_id, track_uri)
+    ),
+    seed_playlists AS (
+        SELECT DISTINCT s.req_id, f.playlist_id
+        FROM default.fact_playlist_track f
+        JOIN seeds s ON f.track_uri = s.track_uri
+    ),
+    candidate_counts AS (
+        SELECT sp.req_id, f.track_uri, COUNT(DISTINCT f.playlist_id) AS cnt
+        FROM default.fact_playlist_track f
+        JOIN seed_playlists sp ON f.playlist_id = sp.playlist_id
+        LEFT JOIN seeds s ON s.req_id = sp.req_id AND s.track_uri = f.track_uri
+        WHERE s.track_uri IS NULL
+        GROUP BY sp.req_id, f.track_uri
+    ),
+    ranked AS (
+        SELECT req_id, track_uri, cnt,
+               ROW_NUMBER() OVER (PARTITION BY req_id ORDER BY cnt DESC, track_uri) AS rn
+        FROM candidate_counts
+    )
+    SELECT r.req_id, t.track_uri, t.track_title, t.artist_name, r.cnt AS score
+    FROM ranked r
+    JOIN default.dim_track t ON r.track_uri = t.track_uri
+    WHERE r.rn <= {int(top_k)}
+    ORDER BY r.req_id, score DESC, t.track_uri
+    """
+
+
 def cooccurrence_from_playlist_sql(playlist_id: str, top_k: int) -> str:
     p = playlist_id.replace("'", "''")
     return f"""
@@ -147,6 +186,32 @@ def search_artist_top_tracks_sql(artist_name: str, limit: int = 10) -> str:
     """
 
 
+def search_artist_top_tracks_from_gold_sql(
+    artist_name: str, limit: int = 10, table_name: str = "default.gold_artist_top_tracks"
+) -> str:
+    """Artist search over the per-artist top-N table instead of the fact table."""
+    a = artist_name.replace("'", "''")
+    return f"""
+    SELECT track_uri, track_title, artist_name, playlists_count AS score
+    FROM {table_name}
+    WHERE artist_name ILIKE '%{a}%'
+    ORDER BY score DESC, track_uri
+    LIMIT {int(limit)}
+    """
+
+
+def artist_neighbors_sql(artist_names, table_name: str = "default.gold_artist_neighbors") -> str:
+    """Precomputed artist x artist shared-playlist counts for the given artists."""
+    if not artist_names:
+        return f"SELECT artist_name, neighbor_artist_name, shared_playlists, neighbor_rank FROM {table_name} WHERE 1 = 0"
+    quoted = ",".join(["'" + str(a).replace("'", "''") + "'" for a in artist_names])
+    return f"""
+    SELECT artist_name, neighbor_artist_name, shared_playlists, neighbor_rank
+    FROM {table_name}
+    WHERE artist_name IN ({quoted})
+    """
+
+
 def search_playlists_by_name_sql(name: str, limit: int = 10) -> str:
     n = name.replace("'", "''")
     return f"""
@@ -157,6 +222,28 @@ def search_playlists_by_name_sql(name: str, limit: int = 10) -> str:
     """
 
 
+def track_catalog_sql(limit: int = 50000) -> str:
+    """Track titles and artists ranked by playlist count (load-test seed catalog)."""
+    return f"""
+    SELECT t.track_title, t.artist_name, COUNT(*) AS n_rows
+    FROM default.fact_playlist_track f
+    JOIN default.dim_track t ON f.track_uri = t.track_uri
+    WHERE t.track_title IS NOT NULL
+    GROUP BY t.track_title, t.artist_name
+    ORDER BY n_rows DESC
+    LIMIT {limit}
+    """
+
+
+def playlist_names_sql(limit: int = 50000) -> str:
+    return f"""
+    SELECT DISTINCT playlist_name
+    FROM default.dim_playlist
+    WHERE playlist_name IS NOT NULL
+    LIMIT {limit}
+    """
+
+
 def stats_sql() -> str:
     return """
     SELECT
@@ -177,6 +264,24 @@ def top_artists_sql(limit: int = 10) -> str:
     """
 
 
+def dim_track_artists_sql(dim_table: str = "default.dim_track") -> str:
+    return f"SELECT DISTINCT track_uri, artist_name FROM {dim_table}"
+
+
+def distinct_playlists_sql(fact_table: str = "default.fact_playlist_track") -> str:
+    return f"SELECT DISTINCT playlist_id FROM {fact_table}"
+
+
+def played_track_artists_sql(fact_table: str = "default.fact_playlist_track", dim_table: str = "default.dim_track") -> str:
+    """Distinct (track, artist) for tracks that appear in at least one playlist."""
+    return f"""
+    SELECT DISTINCT f.track_uri, t.artist_name
+    FROM {fact_table} f
+    JOIN {dim_table} t ON f.track_uri = t.track_uri
+    WHERE t.artist_name IS NOT NULL
+    """
+
+
 def cooccurrence_pairs_sql(seed_track_uri: str, limit: int = 100) -> str:
         s = seed_track_uri.replace("'", "''")
         return f"""
@@ -222,6 +327,55 @@ def track_popularity_for_uris_sql(track_uris) -> str:
     """
 
 
+def track_popularity_all_sql(table_name: str = None) -> str:
+    """Playlist count for every track: from a gold summary table if given, else the fact table."""
+    if table_name:
+        return f"SELECT track_uri, playlists_count AS popularity FROM {table_name}"
+    return """
+    SELECT track_uri, COUNT(DISTINCT playlist_id) AS popularity
+    FROM default.fact_playlist_track
+    GROUP BY track_uri
+    """
+
+
+def track_playlists_sql(track_uris) -> str:
+    """(track_uri, playlist_id) membership rows for the given tracks."""
+    if not track_uris:
+        return """
+        SELECT CAST(NULL AS STRING) AS track_uri, CAST(NULL AS STRING) AS playlist_id
+        WHERE 1 = 0
+        """
+    quoted = ",".join(["'" + str(u).replace("'", "''") + "'" for u in track_uris])
+    return f"""
+    SELECT DISTINCT track_uri, playlist_id
+    FROM default.fact_playlist_track
+    WHERE track_uri IN ({quoted})
+    """
+
+
+def seed_neighborhoods_sql(seed_track_uris, limit=None) -> str:
+    """(seed_track_uri, playlist_id, track_uri) for every playlist containing a seed."""
+    if not seed_track_uris:
+        return """
+        SELECT CAST(NULL AS STRING) AS seed_track_uri, CAST(NULL AS STRING) AS playlist_id,
+               CAST(NULL AS STRING) AS track_uri
+        WHERE 1 = 0
+        """
+    quoted = ",".join(["'" + str(u).replace("'", "''") + "'" for u in seed_track_uris])
+    lim = f"LIMIT {int(limit)}" if limit else ""
+    return f"""
+    WITH seed_playlists AS (
+        SELECT DISTINCT track_uri AS seed_track_uri, playlist_id
+        FROM default.fact_playlist_track
+        WHERE track_uri IN ({quoted})
+    )
+    SELECT DISTINCT s.seed_track_uri, f.playlist_id, f.track_uri
+    FROM seed_playlists s
+    JOIN default.fact_playlist_track f ON f.playlist_id = s.playlist_id
+    {lim}
+    """
+
+
 def seed_candidate_cooccurrence_sql(seed_track_uris, candidate_track_uris) -> str:
     if not seed_track_uris or not candidate_track_uris:
         return """
@@ -255,3 +409,145 @@ def seed_candidate_cooccurrence_sql(seed_track_uris, candidate_track_uris) -> st
     GROUP BY s.seed_track_uri, c.candidate_track_uri
     """
 
+
+
+# --- Gold-table materialization (see recommender/materialize.py) ---
+
+def gold_track_summary_create_sql(table_name: str = "default.gold_track_summary") -> str:
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    SELECT
+        t.track_uri,
+        t.track_title,
+        t.artist_name,
+        CAST(COUNT(DISTINCT f.playlist_id) AS BIGINT) AS playlists_count
+    FROM default.fact_playlist_track f
+    JOIN default.dim_track t ON f.track_uri = t.track_uri
+    GROUP BY t.track_uri, t.track_title, t.artist_name
+    """
+
+
+def gold_artist_top_tracks_create_sql(table_name: str = "default.gold_artist_top_tracks", per_artist: int = 50) -> str:
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    SELECT artist_name, track_uri, track_title, playlists_count, artist_rank
+    FROM (
+        SELECT
+            t.artist_name,
+            t.track_uri,
+            t.track_title,
+            CAST(COUNT(DISTINCT f.playlist_id) AS BIGINT) AS playlists_count,
+            ROW_NUMBER() OVER (
+                PARTITION BY t.artist_name
+                ORDER BY COUNT(DISTINCT f.playlist_id) DESC, t.track_uri
+            ) AS artist_rank
+        FROM default.fact_playlist_track f
+        JOIN default.dim_track t ON f.track_uri = t.track_uri
+        GROUP BY t.artist_name, t.track_uri, t.track_title
+    ) ranked
+    WHERE artist_rank <= {int(per_artist)}
+    """
+
+
+def gold_artist_neighbors_create_sql(table_name: str = "default.gold_artist_neighbors", top_n: int = 50) -> str:
+    """Top-N co-occurring artists per artist, by distinct shared playlists."""
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    WITH playlist_artists AS (
+        SELECT DISTINCT f.playlist_id, t.artist_name
+        FROM default.fact_playlist_track f
+        JOIN default.dim_track t ON f.track_uri = t.track_uri
+        WHERE t.artist_name IS NOT NULL
+    )
+    SELECT artist_name, neighbor_artist_name, shared_playlists, neighbor_rank
+    FROM (
+        SELECT
+            a.artist_name,
+            b.artist_name AS neighbor_artist_name,
+            CAST(COUNT(*) AS BIGINT) AS shared_playlists,
+            ROW_NUMBER() OVER (
+                PARTITION BY a.artist_name
+                ORDER BY COUNT(*) DESC, b.artist_name
+            ) AS neighbor_rank
+        FROM playlist_artists a
+        JOIN playlist_artists b
+          ON a.playlist_id = b.playlist_id AND a.artist_name != b.artist_name
+        GROUP BY a.artist_name, b.artist_name
+    ) ranked
+    WHERE neighbor_rank <= {int(top_n)}
+    """
+
+
+def gold_dataset_stats_create_sql(table_name: str = "default.gold_dataset_stats") -> str:
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    {stats_sql()}
+    """
+
+
+def gold_track_neighbors_create_sql(table_name: str = "default.gold_track_neighbors") -> str:
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} (
+        track_uri STRING,
+        neighbor_track_uri STRING,
+        shared_playlists BIGINT,
+        neighbor_rank INT
+    )
+    """
+
+
+def gold_track_neighbors_insert_sql(
+    partition: int,
+    n_partitions: int,
+    top_n: int = 100,
+    table_name: str = "default.gold_track_neighbors",
+) -> str:
+    """Top-N neighbors for the slice of source tracks hashing to `partition`.
+
+    Partitioning on the source track keeps each track's full neighbor counts inside
+    one statement, so the top-N cut is exact and partitions can run in parallel.
+    """
+    return f"""
+    INSERT INTO {table_name}
+    SELECT track_uri, neighbor_track_uri, shared_playlists, neighbor_rank
+    FROM (
+        SELECT
+            track_uri,
+            neighbor_track_uri,
+            shared_playlists,
+            ROW_NUMBER() OVER (
+                PARTITION BY track_uri
+                ORDER BY shared_playlists DESC, neighbor_track_uri
+            ) AS neighbor_rank
+        FROM (
+            SELECT
+                f1.track_uri,
+                f2.track_uri AS neighbor_track_uri,
+                CAST(COUNT(DISTINCT f1.playlist_id) AS BIGINT) AS shared_playlists
+            FROM default.fact_playlist_track f1
+            JOIN default.fact_playlist_track f2
+              ON f1.playlist_id = f2.playlist_id AND f1.track_uri != f2.track_uri
+            WHERE pmod(hash(f1.track_uri), {int(n_partitions)}) = {int(partition)}
+            GROUP BY f1.track_uri, f2.track_uri
+        ) pairs
+    ) ranked
+    WHERE neighbor_rank <= {int(top_n)}
+    """
+
+
+def gold_manifest_create_sql(version: str, built_at: str, details_json: str, table_name: str = "default.gold_manifest") -> str:
+    v = version.replace("'", "''")
+    b = built_at.replace("'", "''")
+    d = details_json.replace("'", "''")
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    SELECT '{v}' AS version, '{b}' AS built_at, '{d}' AS details
+    """
+
+
+def gold_manifest_sql(table_name: str = "default.gold_manifest") -> str:
+    return f"SELECT version, built_at, details FROM {table_name}"
+
+
+def stats_from_gold_sql(table_name: str = "default.gold_dataset_stats") -> str:
+    return f"SELECT tracks, playlists, artists FROM {table_name}"
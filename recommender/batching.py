@@ -0,0 +1,207 @@
+"""Micro-batching of concurrent co-occurrence requests.
+
+Requests that arrive within a short window are evaluated together on the SQL
+backends:
+
+- the uncached seed neighborhoods of every request in the batch are fetched in
+  one query (recommender/seed_cache.py) and each request is assembled from them;
+- if that would pull too many rows, the whole batch runs as one aggregation
+  grouped by request ID (queries.batched_cooccurrence_sql).
+
+Results are scattered back to each waiting caller. The posting-store path is
+already in-process and does not go through the batcher.
+
+Knobs (environment):
+    RECOMMENDER_BATCH_WINDOW_MS   collection window after the first request (default 5; 0 disables)
+    RECOMMENDER_BATCH_MAX         requests per batch (default 32)
+    RECOMMENDER_BATCH_WORKERS     batches evaluated concurrently (default 2)
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from db import deadline_scope, execute_sql, remaining_budget, wait_or_raise
+from queries import batched_cooccurrence_sql
+from recommender import seed_cache
+
+
+_LATENCY_SAMPLES = 2048
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+class MicroBatcher:
+    """Collect items for up to `window_ms` (or `max_batch` items) and evaluate them together.
+
+    `fn(items) -> results` must return one result per item, in order.
+    """
+
+    def __init__(self, fn: Callable[[List], List], window_ms: float = 5.0, max_batch: int = 32,
+                 workers: int = 2, name: str = "batcher"):
+        self.fn = fn
+        self.window_ms = float(window_ms)
+        self.max_batch = max(1, int(max_batch))
+        self.name = name
+        self._pending: List[tuple] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix=name)
+        self._stats_lock = threading.Lock()
+        self._started_at = time.time()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    def submit(self, item, deadline: Optional[float] = None) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            self._pending.append((item, fut, time.perf_counter(), deadline))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-collector", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return fut
+
+    def __call__(self, item):
+        """Submit `item` and wait for its result within the caller's deadline and cancel scope."""
+        budget = remaining_budget()
+        fut = self.submit(item, time.monotonic() + budget if budget is not None else None)
+        wait_or_raise(lambda: bool(futures_wait([fut], timeout=0.05).done))
+        return fut.result()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                first_at = self._pending[0][2]
+                while len(self._pending) < self.max_batch:
+                    left = first_at + self.window_ms / 1000.0 - time.perf_counter()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._pool.submit(self._run, batch)
+
+    def _run(self, batch: List[tuple]):
+        items = [b[0] for b in batch]
+        deadlines = [b[3] for b in batch]
+        # The batch may run as long as its most patient caller; others stop waiting on their own.
+        deadline = None if any(d is None for d in deadlines) else max(deadlines)
+        try:
+            with deadline_scope(deadline):
+                results = self.fn(items)
+        except BaseException as e:
+            with self._stats_lock:
+                self._errors += 1
+            for _, fut, _, _ in batch:
+                fut.set_exception(e)
+            return
+        done_at = time.perf_counter()
+        for (_, fut, _, _), res in zip(batch, results):
+            fut.set_result(res)
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._latencies.extend(done_at - b[2] for b in batch)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lat = np.array(self._latencies, dtype=float)
+            elapsed = max(time.time() - self._started_at, 1e-9)
+            out = {
+                "window_ms": self.window_ms,
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "requests": self._items,
+                "errors": self._errors,
+                "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "throughput_rps": round(self._items / elapsed, 2),
+            }
+        with self._cond:
+            out["queued"] = len(self._pending)
+        if lat.size:
+            p50, p95, p99 = np.percentile(lat, [50, 95, 99]) * 1000
+            out.update(latency_p50_ms=round(float(p50), 2), latency_p95_ms=round(float(p95), 2),
+                       latency_p99_ms=round(float(p99), 2))
+        return out
+
+
+# --- Co-occurrence batch evaluation ---
+
+RESULT_COLUMNS = ["track_uri", "track_title", "artist_name", "score"]
+
+
+def _evaluate_cooccurrence(requests: Sequence[Tuple[Tuple[str, ...], int]]) -> List[pd.DataFrame]:
+    union = seed_cache.canonical_seeds(itertools.chain.from_iterable(s for s, _ in requests))
+    pieces = seed_cache.neighborhood_pieces(union)
+    if pieces is not None:
+        frames = [seed_cache.assemble_cooccurrence(seeds, pieces, k) for seeds, k in requests]
+        uris = pd.unique(pd.concat([f["track_uri"] for f in frames], ignore_index=True)) if frames else []
+        if len(uris) == 0:
+            return [pd.DataFrame(columns=RESULT_COLUMNS) for _ in frames]
+        meta = seed_cache.tracks_metadata(uris).drop_duplicates("track_uri")
+        return [f.merge(meta, on="track_uri", how="inner")[RESULT_COLUMNS] for f in frames]
+
+    df = execute_sql(batched_cooccurrence_sql([s for s, _ in requests], max(k for _, k in requests)))
+    groups = df.groupby("req_id").indices if not df.empty else {}
+    out = []
+    for i, (_, k) in enumerate(requests):
+        idx = groups.get(i)
+        part = df.iloc[idx].head(k) if idx is not None else pd.DataFrame(columns=RESULT_COLUMNS)
+        part = part[RESULT_COLUMNS].reset_index(drop=True)
+        part["score"] = part["score"].astype(np.int64)
+        out.append(part)
+    return out
+
+
+_cooccurrence_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _env_float("RECOMMENDER_BATCH_WINDOW_MS", 5.0) > 0
+
+
+def _get_batcher() -> MicroBatcher:
+    global _cooccurrence_batcher
+    with _batcher_lock:
+        if _cooccurrence_batcher is None:
+            _cooccurrence_batcher = MicroBatcher(
+                _evaluate_cooccurrence,
+                window_ms=_env_float("RECOMMENDER_BATCH_WINDOW_MS", 5.0),
+                max_batch=int(_env_float("RECOMMENDER_BATCH_MAX", 32)),
+                workers=int(_env_float("RECOMMENDER_BATCH_WORKERS", 2)),
+                name="recommender-cooc-batch",
+            )
+        return _cooccurrence_batcher
+
+
+def cooccurrence(seed_track_uris: Sequence[str], top_k: int) -> pd.DataFrame:
+    """Co-occurrence recommendations (RESULT_COLUMNS) evaluated in a micro-batch."""
+    seeds = seed_cache.canonical_seeds(seed_track_uris)
+    if not seeds:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return _get_batcher()((seeds, int(top_k)))
+
+
+def stats() -> dict:
+    b = _cooccurrence_batcher
+    return b.stats() if b is not None else {"batches": 0, "requests": 0}
@@ -0,0 +1,316 @@
+"""Parallel top-N item-item co-occurrence from playlist -> item CSR arrays.
+
+Work is O(sum of playlist length^2), so it is split map/reduce style across a
+process pool:
+
+- inputs: CSR arrays (playlist offsets, int32 item codes) are copied once into
+  multiprocessing.shared_memory; workers attach by name instead of receiving
+  pickled frames;
+- map: playlists are cut into chunks of roughly equal pair work; a worker
+  expands each chunk into (item, neighbor) pairs in bounded batches, counts
+  them, and writes sorted partial counts per shard (item code % shards) to
+  .npy files;
+- reduce: each shard's k sorted partials are merged (a stable sort of k sorted
+  runs, i.e. a k-way merge), summed, and cut to the top N neighbors per item,
+  ties broken by the lower neighbor code.
+
+Both phases parallelize over independent units. How wall time scales with
+workers (chunk skew, memory bandwidth) has not been measured yet; the CLI
+benchmark reports map and reduce times per run to check it. `progress(stage,
+done, total)` is called as units finish; the report includes the peak RSS of
+the parent and of the largest worker.
+
+Usage (benchmark on the local fact table):
+    python -m recommender.cooccurrence --workers 8 --top-n 100
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+_PAIR_BATCH = 4_000_000      # pairs expanded at once inside a worker
+_LOW32 = np.uint64(0xFFFFFFFF)
+
+
+def _peak_rss_mb(children: bool = False) -> float:
+    """Peak RSS of this process (or its reaped children); 0 where `resource` is unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def csr_from_pairs(groups: pd.Series, items: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(offsets int64, item codes int32, item values) from (group, item) rows.
+
+    Item codes follow the sorted order of item values, so ties broken by code
+    match ties broken by value. Duplicate (group, item) rows are dropped.
+    """
+    df = pd.DataFrame({"g": groups.to_numpy(), "i": items.to_numpy()}).dropna().drop_duplicates()
+    values = np.sort(df["i"].unique())
+    codes = np.searchsorted(values, df["i"].to_numpy()).astype(np.int32)
+    g_codes, _ = pd.factorize(df["g"], sort=False)
+    order = np.argsort(g_codes, kind="stable")
+    counts = np.bincount(g_codes, minlength=int(g_codes.max()) + 1 if len(g_codes) else 0)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, codes[order], values
+
+
+# --- Shared-memory inputs ---
+
+_shared: Dict[str, np.ndarray] = {}
+_shm_handles: list = []
+
+
+def _share(arrays: Dict[str, np.ndarray]):
+    from multiprocessing import shared_memory
+
+    blocks, spec = [], {}
+    for name, arr in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        blocks.append(shm)
+        spec[name] = (shm.name, arr.shape, arr.dtype.str)
+    return blocks, spec
+
+
+def _attach(spec: dict):
+    """Pool initializer: map the parent's shared arrays without copying.
+
+    Pool workers share the parent's resource tracker, and the parent unlinks
+    the blocks once the build is done.
+    """
+    from multiprocessing import shared_memory
+
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shm_handles.append(shm)
+        _shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+# --- Map ---
+
+def _expand_pairs(offsets: np.ndarray, items: np.ndarray, a: int, b: int) -> np.ndarray:
+    """Ordered (item << 32 | neighbor) keys for every pair within playlists [a, b)."""
+    starts = offsets[a:b]
+    lens = offsets[a + 1:b + 1] - starts
+    sq = lens * lens
+    total = int(sq.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.uint64)
+    blk = np.repeat(np.arange(b - a), sq)
+    pos = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(sq) - sq, sq)
+    length = lens[blk]
+    base = starts[blk]
+    src = items[base + pos // length]
+    dst = items[base + pos % length]
+    keep = src != dst
+    return (src[keep].astype(np.uint64) << np.uint64(32)) | dst[keep].astype(np.uint64)
+
+
+def _reduce_sorted(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum counts of equal keys; `keys` may be a concatenation of sorted runs."""
+    if len(keys) == 0:
+        return keys, counts
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(counts, starts).astype(np.int32)
+
+
+def _map_chunk(a: int, b: int, shards: int, out_dir: str, chunk_id: int) -> Tuple[List[str], float]:
+    offsets, items = _shared["offsets"], _shared["items"]
+    lens = offsets[a + 1:b + 1] - offsets[a:b]
+    work = np.cumsum(lens * lens)
+    parts: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in range(shards)]
+    lo = a
+    while lo < b:
+        done = int(work[lo - a - 1]) if lo > a else 0
+        hi = a + int(np.searchsorted(work, done + _PAIR_BATCH, side="right"))
+        hi = min(max(hi, lo + 1), b)
+        keys, counts = np.unique(_expand_pairs(offsets, items, lo, hi), return_counts=True)
+        shard_of = ((keys >> np.uint64(32)) % np.uint64(shards)).astype(np.int64)
+        for s in range(shards):
+            m = shard_of == s
+            if m.any():
+                parts[s].append((keys[m], counts[m].astype(np.int32)))
+        lo = hi
+
+    paths = []
+    for s, runs in enumerate(parts):
+        if not runs:
+            continue
+        keys, counts = _reduce_sorted(np.concatenate([k for k, _ in runs]), np.concatenate([c for _, c in runs]))
+        path = os.path.join(out_dir, f"s{s:04d}_c{chunk_id:05d}.npz")
+        np.savez(path, keys=keys, counts=counts)
+        paths.append(path)
+    return paths, _peak_rss_mb()
+
+
+# --- Reduce ---
+
+def _top_n(keys: np.ndarray, counts: np.ndarray, top_n: int) -> Tuple[np.ndarray, ...]:
+    src = (keys >> np.uint64(32)).astype(np.int32)
+    dst = (keys & _LOW32).astype(np.int32)
+    order = np.lexsort((dst, -counts.astype(np.int64), src))
+    src, dst, counts = src[order], dst[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]]) if len(src) else np.zeros(0, dtype=np.int64)
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(src)]))
+    rank = (np.arange(len(src)) - group_start + 1).astype(np.int32)
+    keep = rank <= int(top_n)
+    return src[keep], dst[keep], counts[keep], rank[keep]
+
+
+def _reduce_shard(paths: List[str], top_n: int) -> Tuple[Tuple[np.ndarray, ...], float]:
+    keys, counts = [], []
+    for p in paths:
+        with np.load(p) as z:
+            keys.append(z["keys"])
+            counts.append(z["counts"])
+    merged = _reduce_sorted(np.concatenate(keys), np.concatenate(counts)) if keys else (
+        np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int32))
+    return _top_n(*merged, top_n), _peak_rss_mb()
+
+
+def _chunk_bounds(offsets: np.ndarray, n_chunks: int) -> List[Tuple[int, int]]:
+    """Split playlists into contiguous chunks of roughly equal pair work."""
+    lens = np.diff(offsets)
+    work = np.cumsum(lens * lens)
+    if len(work) == 0:
+        return []
+    targets = work[-1] * np.arange(1, n_chunks) / n_chunks
+    cuts = np.unique(np.r_[0, np.searchsorted(work, targets, side="right"), len(lens)])
+    return [(int(a), int(b)) for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+
+
+def _print_progress(stage: str, done: int, total: int):
+    print(f"\r{stage}: {done}/{total}", end="\n" if done == total else "", file=sys.stderr, flush=True)
+
+
+def build_topn(offsets: np.ndarray,
+               items: np.ndarray,
+               top_n: int = 100,
+               workers: Optional[int] = None,
+               chunks: Optional[int] = None,
+               shards: Optional[int] = None,
+               tmp_dir: Optional[str] = None,
+               progress: Optional[Callable[[str, int, int], None]] = _print_progress) -> Tuple[pd.DataFrame, dict]:
+    """Top `top_n` co-occurring items per item code.
+
+    Returns (frame of item, neighbor, shared, rank as int32 codes, report).
+    """
+    started = time.perf_counter()
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    chunks = int(chunks or workers * 4)
+    shards = int(shards or workers * 2)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    items = np.ascontiguousarray(items, dtype=np.int32)
+    bounds = _chunk_bounds(offsets, chunks)
+    progress = progress or (lambda *_: None)
+
+    work_dir = tempfile.mkdtemp(prefix="cooc_", dir=tmp_dir)
+    blocks, spec = _share({"offsets": offsets, "items": items})
+    worker_peak = 0.0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(spec,)) as pool:
+            t_map = time.perf_counter()
+            shard_paths: Dict[int, List[str]] = {}
+            futures = [pool.submit(_map_chunk, a, b, shards, work_dir, i) for i, (a, b) in enumerate(bounds)]
+            for done, fut in enumerate(as_completed(futures), 1):
+                paths, peak = fut.result()
+                worker_peak = max(worker_peak, peak)
+                for p in paths:
+                    shard_paths.setdefault(int(os.path.basename(p)[1:5]), []).append(p)
+                progress("map", done, len(futures))
+            map_s = time.perf_counter() - t_map
+
+            t_reduce = time.perf_counter()
+            futures = [pool.submit(_reduce_shard, paths, top_n) for _, paths in sorted(shard_paths.items())]
+            results = []
+            for done, fut in enumerate(as_completed(futures), 1):
+                arrays, peak = fut.result()
+                worker_peak = max(worker_peak, peak)
+                results.append(arrays)
+                progress("reduce", done, len(futures))
+            reduce_s = time.perf_counter() - t_reduce
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    cols = [np.concatenate([r[i] for r in results]) if results else np.zeros(0, dtype=np.int32) for i in range(4)]
+    out = pd.DataFrame({"item": cols[0], "neighbor": cols[1], "shared": cols[2], "rank": cols[3]})
+    out = out.sort_values(["item", "rank"], ignore_index=True)
+    lens = np.diff(offsets)
+    report = {
+        "playlists": int(len(lens)),
+        "pair_work": int((lens * lens).sum()),
+        "rows": int(len(out)),
+        "workers": workers,
+        "chunks": len(bounds),
+        "shards": shards,
+        "map_s": round(map_s, 3),
+        "reduce_s": round(reduce_s, 3),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_worker_rss_mb": round(max(worker_peak, _peak_rss_mb(children=True)), 1),
+    }
+    return out, report
+
+
+def neighbors_frame(groups: pd.Series, items: pd.Series, key: str, top_n: int, **kwargs) -> Tuple[pd.DataFrame, dict]:
+    """Top-N neighbors per value of `items` over `groups`, as gold-table columns:
+    `key`, `neighbor_<key>`, shared_playlists, neighbor_rank."""
+    offsets, codes, values = csr_from_pairs(groups, items)
+    out, report = build_topn(offsets, codes, top_n=top_n, **kwargs)
+    frame = pd.DataFrame({
+        key: values[out["item"].to_numpy()],
+        f"neighbor_{key}": values[out["neighbor"].to_numpy()],
+        "shared_playlists": out["shared"].to_numpy(dtype=np.int64),
+        "neighbor_rank": out["rank"].to_numpy(dtype=np.int64),
+    })
+    return frame, report
+
+
+def main(argv: Optional[List[str]] = None):
+    from db import local_data_dir, open_local_connection
+
+    p = argparse.ArgumentParser(description="Build top-N track co-occurrence from the local fact table (benchmark).")
+    p.add_argument("--data-dir", default=None)
+    p.add_argument("--top-n", type=int, default=100)
+    p.add_argument("--workers", default=None, help="Worker count, or a comma list to compare scaling (e.g. 1,2,4,8).")
+    p.add_argument("--chunks", type=int, default=None)
+    args = p.parse_args(argv)
+
+    conn = open_local_connection(args.data_dir or local_data_dir())
+    try:
+        fact = conn.execute('SELECT playlist_id, track_uri FROM "default".fact_playlist_track').df()
+    finally:
+        conn.close()
+    offsets, codes, _ = csr_from_pairs(fact["playlist_id"], fact["track_uri"])
+    print(f"{len(offsets) - 1:,} playlists, {len(codes):,} distinct (playlist, track) rows", file=sys.stderr)
+
+    base = None
+    for w in ([int(x) for x in args.workers.split(",")] if args.workers else [None]):
+        _, report = build_topn(offsets, codes, top_n=args.top_n, workers=w, chunks=args.chunks)
+        base = base or report["elapsed_s"]
+        report["speedup"] = round(base / report["elapsed_s"], 2) if report["elapsed_s"] else None
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
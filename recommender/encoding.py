@@ -0,0 +1,121 @@
+"""Dense int32 dictionary encoding for track URIs and playlist IDs.
+
+Track URIs are ~36-character strings; carrying them through every DataFrame,
+session list and set costs memory and makes membership tests slow. Values are
+encoded once when they enter the recommender (backend results, user input)
+and decoded only where the UI renders them. Pure lookups (is this URI known,
+what is its popularity) use `lookup`, which never grows the dictionary.
+
+Codes are process-local and append-only: a code never changes meaning for the
+lifetime of the process, so encoded values are safe to keep in st.cache_data
+and st.session_state.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+class IdDictionary:
+    """Thread-safe, append-only mapping str <-> dense int32 code."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._codes: dict = {}
+        self._values: List[str] = []
+        self._decode_cache = np.empty(0, dtype=object)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def encode(self, values: Iterable) -> np.ndarray:
+        s = pd.Series(list(values) if not isinstance(values, pd.Series) else values, dtype=object).astype(str)
+        if s.empty:
+            return np.zeros(0, dtype=np.int32)
+        codes = s.map(self._codes)
+        missing = codes.isna()
+        if missing.any():
+            with self._lock:
+                for v in pd.unique(s[missing]):
+                    if v not in self._codes:
+                        self._codes[v] = len(self._values)
+                        self._values.append(v)
+            codes = s.map(self._codes)
+        return codes.to_numpy(dtype=np.int32)
+
+    def lookup(self, values: Iterable) -> np.ndarray:
+        """Codes of already-known values, -1 for unknown ones; never inserts."""
+        s = pd.Series(list(values) if not isinstance(values, pd.Series) else values, dtype=object).astype(str)
+        if s.empty:
+            return np.zeros(0, dtype=np.int32)
+        return s.map(self._codes).fillna(-1).to_numpy(dtype=np.int32)
+
+    def encode_one(self, value) -> int:
+        return int(self.encode([value])[0])
+
+    def _decoder(self) -> np.ndarray:
+        arr = self._decode_cache
+        if len(arr) != len(self._values):
+            with self._lock:
+                arr = np.array(self._values, dtype=object)
+                self._decode_cache = arr
+        return arr
+
+    def decode(self, codes) -> np.ndarray:
+        codes = np.asarray(codes, dtype=np.int64)
+        if codes.size == 0:
+            return np.empty(0, dtype=object)
+        return self._decoder()[codes]
+
+    def decode_list(self, codes) -> List[str]:
+        return self.decode(codes).tolist()
+
+
+TRACKS = IdDictionary("track_uri")
+PLAYLISTS = IdDictionary("playlist_id")
+
+
+def encode_tracks(track_uris: Iterable) -> np.ndarray:
+    return TRACKS.encode(track_uris)
+
+
+def decode_tracks(codes) -> List[str]:
+    return TRACKS.decode_list(codes)
+
+
+def encode_playlist(playlist_id) -> int:
+    return PLAYLISTS.encode_one(playlist_id)
+
+
+def decode_playlist(code) -> str:
+    return PLAYLISTS.decode_list([code])[0]
+
+
+def encode_frame(df: pd.DataFrame, uri_col: str = "track_uri", code_col: str = "track_code") -> pd.DataFrame:
+    """Replace a URI column with int32 codes; low-cardinality text becomes categorical."""
+    if df is None or df.empty or uri_col not in df.columns:
+        return df
+    out = df.copy()
+    out.insert(out.columns.get_loc(uri_col), code_col, TRACKS.encode(out[uri_col]))
+    out = out.drop(columns=[uri_col])
+    for c in ("track_title", "artist_name"):
+        if c in out.columns:
+            out[c] = out[c].astype("category")
+    return out
+
+
+def decode_frame(df: pd.DataFrame, code_col: str = "track_code", uri_col: str = "track_uri") -> pd.DataFrame:
+    """Inverse of `encode_frame` for the UI: codes back to URIs, plain object text."""
+    if df is None or df.empty or code_col not in df.columns:
+        return df
+    out = df.copy()
+    out.insert(out.columns.get_loc(code_col), uri_col, TRACKS.decode(out[code_col].to_numpy()))
+    out = out.drop(columns=[code_col])
+    for c in ("track_title", "artist_name"):
+        if c in out.columns and isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype(object)
+    return out
@@ -0,0 +1,227 @@
+"""Byte-bounded, process-wide store for cached result DataFrames.
+
+Recommendation results used to live as pandas frames in st.cache_data,
+st.session_state and two module-level LRUs, bounded by entry count at best.
+Here every entry is serialized to Arrow IPC (string columns dictionary-encoded,
+LZ4-compressed when available) and all namespaces share one LRU byte budget,
+RECOMMENDER_FRAME_CACHE_MB (default 256). Without pyarrow, entries are pickled
+with text columns as categoricals.
+
+Callers must treat a miss as normal: an evicted entry is recomputed.
+`stats()` and `entries()` report what the store holds, per namespace.
+"""
+from __future__ import annotations
+
+import io
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except Exception:  # pragma: no cover
+    pa = None
+
+
+_DICTIONARY_MAX_RATIO = 0.5   # dictionary-encode text columns with at most this share of distinct values
+
+
+def _is_text(s: pd.Series) -> bool:
+    # pandas 3 infers StringDtype for text; older versions and mixed columns use object.
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return False
+    return pd.api.types.is_string_dtype(s.dtype) or pd.api.types.is_object_dtype(s.dtype)
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    out = df
+    for col in df.columns:
+        s = df[col]
+        if _is_text(s) and len(s) and s.nunique(dropna=True) <= _DICTIONARY_MAX_RATIO * len(s):
+            if out is df:
+                out = df.copy()
+            out[col] = s.astype("category")
+    return out
+
+
+def _ipc_options():
+    try:
+        return pa.ipc.IpcWriteOptions(compression="lz4")
+    except Exception:
+        return pa.ipc.IpcWriteOptions()
+
+
+def pack(df: pd.DataFrame) -> bytes:
+    df = _compact(df.reset_index(drop=True))
+    if pa is None:
+        return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema, options=_ipc_options()) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def unpack(blob: bytes) -> pd.DataFrame:
+    if pa is None:
+        return pickle.loads(blob)
+    return pa.ipc.open_stream(pa.py_buffer(blob)).read_all().to_pandas()
+
+
+class _Entry:
+    __slots__ = ("blob", "attrs", "rows", "created", "last_used", "ttl_s")
+
+    def __init__(self, blob: bytes, attrs: dict, rows: int, ttl_s: Optional[float]):
+        self.blob = blob
+        self.attrs = attrs
+        self.rows = rows
+        self.created = self.last_used = time.time()
+        self.ttl_s = ttl_s
+
+
+class FrameStore:
+    """Thread-safe LRU of packed DataFrames keyed by (namespace, key), bounded by total bytes.
+
+    `limits` optionally caps the entry count of a namespace as well.
+    """
+
+    def __init__(self, max_bytes: int, limits: Optional[Dict[str, int]] = None):
+        self.max_bytes = int(max_bytes)
+        self.limits = dict(limits or {})
+        self._items: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        # Keys of each namespace in the same LRU order, so a namespace cap
+        # evicts without scanning every entry under the lock.
+        self._ns_keys: Dict[str, "OrderedDict[Hashable, None]"] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, namespace: str, name: str):
+        c = self._counters.setdefault(namespace, {"hits": 0, "misses": 0, "evictions": 0, "puts": 0})
+        c[name] += 1
+
+    def _drop(self, k: tuple, evicted: bool):
+        entry = self._items.pop(k)
+        self._bytes -= len(entry.blob)
+        order = self._ns_keys[k[0]]
+        del order[k[1]]
+        if not order:
+            del self._ns_keys[k[0]]
+        if evicted:
+            self._count(k[0], "evictions")
+
+    def put(self, namespace: str, key: Hashable, df: pd.DataFrame, ttl_s: Optional[float] = None) -> bool:
+        """Store `df` (and its attrs); False if it alone exceeds a quarter of the budget."""
+        blob = pack(df)
+        if len(blob) > self.max_bytes // 4:
+            return False
+        entry = _Entry(blob, dict(df.attrs), len(df), ttl_s)
+        k = (namespace, key)
+        with self._lock:
+            if k in self._items:
+                self._drop(k, evicted=False)
+            self._items[k] = entry
+            order = self._ns_keys.setdefault(namespace, OrderedDict())
+            order[key] = None
+            self._bytes += len(blob)
+            self._count(namespace, "puts")
+            cap = self.limits.get(namespace)
+            if cap is not None:
+                while len(order) > cap:
+                    self._drop((namespace, next(iter(order))), evicted=True)
+            while self._bytes > self.max_bytes and self._items:
+                self._drop(next(iter(self._items)), evicted=True)
+        return True
+
+    def get(self, namespace: str, key: Hashable) -> Optional[pd.DataFrame]:
+        k = (namespace, key)
+        with self._lock:
+            entry = self._items.get(k)
+            if entry is not None and entry.ttl_s is not None and time.time() - entry.created > entry.ttl_s:
+                self._drop(k, evicted=True)
+                entry = None
+            if entry is None:
+                self._count(namespace, "misses")
+                return None
+            self._items.move_to_end(k)
+            self._ns_keys[namespace].move_to_end(key)
+            entry.last_used = time.time()
+            self._count(namespace, "hits")
+        df = unpack(entry.blob)
+        df.attrs.update(entry.attrs)
+        return df
+
+    def rows(self, namespace: str, key: Hashable) -> Optional[int]:
+        """Row count of an entry without unpacking it (None if absent)."""
+        with self._lock:
+            entry = self._items.get((namespace, key))
+            return entry.rows if entry is not None else None
+
+    def discard(self, namespace: str, key: Hashable):
+        with self._lock:
+            if (namespace, key) in self._items:
+                self._drop((namespace, key), evicted=False)
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            if namespace is None:
+                keys = list(self._items)
+            else:
+                keys = [(namespace, key) for key in self._ns_keys.get(namespace, ())]
+            for k in keys:
+                self._drop(k, evicted=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_ns: Dict[str, dict] = {}
+            for (ns, _), entry in self._items.items():
+                d = per_ns.setdefault(ns, {"entries": 0, "bytes": 0, "rows": 0})
+                d["entries"] += 1
+                d["bytes"] += len(entry.blob)
+                d["rows"] += entry.rows
+            for ns, counters in self._counters.items():
+                per_ns.setdefault(ns, {"entries": 0, "bytes": 0, "rows": 0}).update(counters)
+            return {
+                "format": "arrow_ipc" if pa is not None else "pickle",
+                "max_bytes": self.max_bytes,
+                "bytes": self._bytes,
+                "entries": len(self._items),
+                "namespaces": per_ns,
+            }
+
+    def entries(self, namespace: Optional[str] = None, limit: int = 200) -> pd.DataFrame:
+        """Most recently used entries first: namespace, key, rows, bytes, ages."""
+        now = time.time()
+        with self._lock:
+            items = [(k, e) for k, e in reversed(self._items.items()) if namespace is None or k[0] == namespace]
+        rows = [
+            {
+                "namespace": k[0],
+                "key": repr(k[1])[:120],
+                "rows": e.rows,
+                "bytes": len(e.blob),
+                "age_s": round(now - e.created, 1),
+                "idle_s": round(now - e.last_used, 1),
+            }
+            for k, e in items[:int(limit)]
+        ]
+        return pd.DataFrame(rows, columns=["namespace", "key", "rows", "bytes", "age_s", "idle_s"])
+
+
+_MAX_BYTES = int(float(os.environ.get("RECOMMENDER_FRAME_CACHE_MB", "256")) * 1024 * 1024)
+
+# Shared by every session and the HTTP service in this process.
+STORE = FrameStore(_MAX_BYTES)
+
+
+def stats() -> dict:
+    return STORE.stats()
+
+
+def entries(namespace: Optional[str] = None, limit: int = 200) -> pd.DataFrame:
+    return STORE.entries(namespace, limit)
@@ -0,0 +1,331 @@
+"""Load Million Playlist Dataset (MPD) JSON slices into the local star schema.
+
+Each slice file (`mpd.slice.<a>-<b>.json`: {"info": ..., "playlists": [...]})
+is parsed in a worker process (orjson when installed, else json) and becomes
+one Parquet file per table under the local data directory:
+
+- fact_playlist_track/<slice>.parquet: playlist_id, track_uri, track_position
+- dim_track/<slice>.parquet: tracks first seen in this slice
+- dim_playlist/<slice>.parquet: playlist_id, playlist_name
+
+The parent process dedups tracks and playlists across slices, in slice order,
+so the dims stay unique however many workers run. A slice is recorded as done
+in `_ingest/<slice>.json` only after its files are written; a rerun skips done
+slices (unless the source file changed) and redoes the rest, so an
+interrupted load resumes where it stopped. Afterwards the gold tables are
+rebuilt (recommender.materialize), and so is the posting store if one exists.
+
+Usage:
+    python -m recommender.ingest /path/to/mpd/data --workers 8
+    python -m recommender.ingest mpd.slice.0-999.json mpd.slice.1000-1999.json --no-gold
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from db import LOCAL_TABLES, local_data_dir
+
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None
+
+
+MARKER_DIR = "_ingest"
+INGEST_FORMAT_VERSION = 1
+
+
+def _loads(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def slice_name(path: str) -> str:
+    name = os.path.basename(path)
+    return name[:-5] if name.endswith(".json") else name
+
+
+def _natural_key(path: str):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", os.path.basename(path))]
+
+
+def find_slices(inputs: List[str]) -> List[str]:
+    """Slice files from file paths, directories (their *.json) or globs, in slice order."""
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found.extend(glob.glob(os.path.join(item, "*.json")))
+        elif os.path.isfile(item):
+            found.append(item)
+        else:
+            found.extend(glob.glob(item))
+    return sorted({os.path.abspath(p) for p in found}, key=_natural_key)
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _table_path(data_dir: str, table: str, name: str) -> str:
+    return os.path.join(data_dir, table, f"{name}.parquet")
+
+
+def parse_slice(path: str, data_dir: str) -> dict:
+    """Worker: parse one slice, write its fact file, return its playlists and distinct tracks."""
+    started = time.perf_counter()
+    with open(path, "rb") as fh:
+        playlists = _loads(fh.read()).get("playlists") or []
+
+    pl_ids, pl_names = [], []
+    fact_pids, fact_uris, fact_pos = [], [], []
+    tracks: Dict[str, tuple] = {}
+    for pl in playlists:
+        pid = str(pl["pid"])
+        pl_ids.append(pid)
+        pl_names.append(pl.get("name"))
+        for i, t in enumerate(pl.get("tracks") or []):
+            uri = t["track_uri"]
+            fact_pids.append(pid)
+            fact_uris.append(uri)
+            fact_pos.append(t.get("pos", i))
+            if uri not in tracks:
+                tracks[uri] = (t.get("track_name"), t.get("artist_name"))
+
+    fact = pd.DataFrame({
+        "playlist_id": fact_pids,
+        "track_uri": fact_uris,
+        "track_position": pd.array(fact_pos, dtype="int64"),
+    })
+    name = slice_name(path)
+    _write_parquet(fact, _table_path(data_dir, "fact_playlist_track", name))
+    return {
+        "slice": name,
+        "playlists": pd.DataFrame({"playlist_id": pl_ids, "playlist_name": pl_names}),
+        "tracks": pd.DataFrame({
+            "track_uri": list(tracks),
+            "track_title": [v[0] for v in tracks.values()],
+            "artist_name": [v[1] for v in tracks.values()],
+        }),
+        "fact_rows": len(fact),
+        "parse_s": time.perf_counter() - started,
+    }
+
+
+# --- Resume state ---
+
+def _source_info(path: str) -> dict:
+    st = os.stat(path)
+    return {"source": path, "size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def _marker_path(data_dir: str, name: str) -> str:
+    return os.path.join(data_dir, MARKER_DIR, f"{name}.json")
+
+
+def _read_marker(data_dir: str, name: str) -> Optional[dict]:
+    try:
+        with open(_marker_path(data_dir, name), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_marker(data_dir: str, name: str, record: dict):
+    path = _marker_path(data_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(record, fh)
+    os.replace(path + ".tmp", path)
+
+
+def _is_done(data_dir: str, path: str) -> bool:
+    marker = _read_marker(data_dir, slice_name(path))
+    if marker is None or marker.get("format_version") != INGEST_FORMAT_VERSION:
+        return False
+    info = _source_info(path)
+    return marker.get("size") == info["size"] and marker.get("mtime") == info["mtime"]
+
+
+def _done_slices(data_dir: str) -> List[str]:
+    folder = os.path.join(data_dir, MARKER_DIR)
+    if not os.path.isdir(folder):
+        return []
+    return [f[:-5] for f in os.listdir(folder) if f.endswith(".json")]
+
+
+def _seen_keys(data_dir: str, table: str, column: str, names: List[str]) -> set:
+    """Keys already written by completed slices (files of unfinished slices are ignored)."""
+    seen = set()
+    for name in names:
+        path = _table_path(data_dir, table, name)
+        if os.path.isfile(path):
+            seen.update(pd.read_parquet(path, columns=[column])[column].tolist())
+    return seen
+
+
+def _check_layout(data_dir: str):
+    # db.local_table_source prefers `<table>.parquet` over a `<table>/` directory,
+    # so ingested partitions would be silently ignored next to single-file tables.
+    clashes = [t for t in LOCAL_TABLES if os.path.isfile(os.path.join(data_dir, f"{t}.parquet"))]
+    if clashes:
+        raise SystemExit(
+            f"{data_dir} already has single-file tables ({', '.join(clashes)}); ingest into another directory "
+            "or move them away first."
+        )
+
+
+def _not_in(values: pd.Series, seen: set) -> np.ndarray:
+    # Per-row membership; Series.isin(set) would copy the whole set every slice.
+    return np.fromiter((v not in seen for v in values), dtype=bool, count=len(values))
+
+
+def _commit_slice(data_dir: str, path: str, part: dict, seen_tracks: set, seen_playlists: set) -> dict:
+    """Dedup a parsed slice against earlier slices, write its dims and mark it done."""
+    name = part["slice"]
+    playlists = part["playlists"].drop_duplicates("playlist_id")
+    dup = ~_not_in(playlists["playlist_id"], seen_playlists)
+    fact_rows = part["fact_rows"]
+    if dup.any():
+        # Playlists already loaded from another slice: keep the first copy only.
+        fact_path = _table_path(data_dir, "fact_playlist_track", name)
+        fact = pd.read_parquet(fact_path)
+        fact = fact[~fact["playlist_id"].isin(set(playlists.loc[dup, "playlist_id"]))]
+        _write_parquet(fact, fact_path)
+        fact_rows = len(fact)
+        playlists = playlists[~dup]
+    tracks = part["tracks"]
+    tracks = tracks[_not_in(tracks["track_uri"], seen_tracks)]
+
+    _write_parquet(playlists, _table_path(data_dir, "dim_playlist", name))
+    _write_parquet(tracks, _table_path(data_dir, "dim_track", name))
+    seen_playlists.update(playlists["playlist_id"].tolist())
+    seen_tracks.update(tracks["track_uri"].tolist())
+
+    record = {
+        "format_version": INGEST_FORMAT_VERSION,
+        **_source_info(path),
+        "playlists": int(len(playlists)),
+        "duplicate_playlists": int(dup.sum()),
+        "new_tracks": int(len(tracks)),
+        "fact_rows": int(fact_rows),
+    }
+    _write_marker(data_dir, name, record)
+    return record
+
+
+def ingest(inputs: List[str],
+           data_dir: Optional[str] = None,
+           workers: Optional[int] = None,
+           force: bool = False,
+           gold: bool = True) -> dict:
+    """Load MPD slices into `data_dir`; returns a throughput report."""
+    started = time.perf_counter()
+    data_dir = os.path.abspath(data_dir or local_data_dir())
+    workers = int(workers or os.cpu_count() or 1)
+    _check_layout(data_dir)
+
+    paths = find_slices(inputs)
+    todo = paths if force else [p for p in paths if not _is_done(data_dir, p)]
+    todo_names = {slice_name(p) for p in todo}
+    done = [n for n in _done_slices(data_dir) if n not in todo_names]
+    seen_tracks = _seen_keys(data_dir, "dim_track", "track_uri", done)
+    seen_playlists = _seen_keys(data_dir, "dim_playlist", "playlist_id", done)
+    print(f"{len(paths)} slice(s) found, {len(paths) - len(todo)} already loaded, {len(todo)} to load "
+          f"with {workers} worker(s) into {data_dir}")
+
+    totals = {"playlists": 0, "fact_rows": 0, "new_tracks": 0, "duplicate_playlists": 0, "bytes": 0}
+    t_load = time.perf_counter()
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A bounded window of slices in flight: parsed frames are released once
+            # committed instead of piling up behind a slow slice.
+            pending = deque()
+            queue = iter(todo)
+            for path in itertools.islice(queue, 2 * workers):
+                pending.append((path, pool.submit(parse_slice, path, data_dir)))
+            i = 0
+            while pending:
+                # Commit in slice order so "first seen" does not depend on worker timing.
+                path, fut = pending.popleft()
+                record = _commit_slice(data_dir, path, fut.result(), seen_tracks, seen_playlists)
+                del fut
+                nxt = next(queue, None)
+                if nxt is not None:
+                    pending.append((nxt, pool.submit(parse_slice, nxt, data_dir)))
+                i += 1
+                for k in ("playlists", "fact_rows", "new_tracks", "duplicate_playlists"):
+                    totals[k] += record[k]
+                totals["bytes"] += record["size"]
+                elapsed = max(time.perf_counter() - t_load, 1e-9)
+                print(f"[{i}/{len(todo)}] {slice_name(path)}: {record['playlists']:,} playlists, "
+                      f"{record['fact_rows']:,} rows, {record['new_tracks']:,} new tracks "
+                      f"({i / elapsed:.2f} files/s, {totals['fact_rows'] / elapsed:,.0f} rows/s)")
+    load_s = time.perf_counter() - t_load
+
+    report = {
+        "data_dir": data_dir,
+        "slices_found": len(paths),
+        "slices_loaded": len(todo),
+        "slices_skipped": len(paths) - len(todo),
+        **totals,
+        "workers": workers,
+        "load_s": round(load_s, 2),
+        "files_per_s": round(len(todo) / load_s, 2) if todo and load_s > 0 else None,
+        "rows_per_s": round(totals["fact_rows"] / load_s) if todo and load_s > 0 else None,
+        "mb_per_s": round(totals["bytes"] / 1e6 / load_s, 1) if todo and load_s > 0 else None,
+        "parser": "orjson" if orjson is not None else "json",
+    }
+
+    if gold and (todo or force):
+        from recommender.materialize import materialize_local
+        from recommender.postings import build_posting_store, store_exists
+
+        t_gold = time.perf_counter()
+        materialize_local(data_dir=data_dir, workers=workers)
+        # A posting store built from the old data would now answer wrongly.
+        postings_dir = os.path.join(data_dir, "postings")
+        if store_exists(postings_dir):
+            from db import open_local_connection
+
+            conn = open_local_connection(data_dir)
+            try:
+                df = conn.execute('SELECT DISTINCT track_uri, playlist_id FROM "default".fact_playlist_track').df()
+            finally:
+                conn.close()
+            build_posting_store(postings_dir, df)
+            print("Posting store rebuilt; running app and service processes switch to it on their next lookup.")
+        report["gold_s"] = round(time.perf_counter() - t_gold, 2)
+
+    report["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Load MPD JSON slices into the local star schema (Parquet).")
+    p.add_argument("inputs", nargs="+", help="Slice files, directories containing them, or globs.")
+    p.add_argument("--data-dir", default=None, help="Local data directory (default: RECOMMENDER_LOCAL_DIR).")
+    p.add_argument("--workers", type=int, default=None, help="Parser processes (default: all cores).")
+    p.add_argument("--force", action="store_true", help="Reload slices that are already loaded.")
+    p.add_argument("--no-gold", action="store_true", help="Skip rebuilding gold tables and the posting store.")
+    args = p.parse_args(argv)
+
+    report = ingest(args.inputs, data_dir=args.data_dir, workers=args.workers, force=args.force, gold=not args.no_gold)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
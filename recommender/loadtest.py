@@ -0,0 +1,390 @@
+"""Multi-session load test of the Streamlit flow against the local backend.
+
+Each simulated session drives the real pages with Streamlit's AppTest, in one
+process, sharing the process-level caches exactly as browser sessions would:
+
+    open    -> load the input page, pick the seed mode and model
+    search  -> type a query on the input page (track, artist or playlist mode)
+    recommend -> click Generate (run_recommender_and_store)
+    explain -> render the Explanation / Relationships page
+    metrics -> render the Recommender Metrics page
+
+Every flow is a fresh session. AppTest keeps the Streamlit runtime in a
+global, so the harness pins it for the duration of the test (see
+_pin_streamlit_runtime). Sessions sleep an exponentially distributed
+think time between steps. Queries are drawn from the catalog ranked by
+playlist count, uniformly or Zipf-distributed (`--seed-dist zipf`), so hot seeds
+can be made to repeat.
+
+Reports throughput, p50/p95/p99 per step, backend query executions (after
+single-flight) and process RSS over time.
+
+Usage:
+    python -m recommender.loadtest --data-dir ./data --sessions 8 --duration 60
+    python -m recommender.loadtest --sessions 16 --flows 5 --think-ms 500 --seed-dist zipf --json report.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+STEPS = ["open", "search", "recommend", "explain", "metrics"]
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    out = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        out[name.strip().lower()] = float(weight or 1)
+    if not out or sum(out.values()) <= 0:
+        raise argparse.ArgumentTypeError(f"Bad mix: {text!r}")
+    return out
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), else peak RSS (POSIX), else 0."""
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+class QueryCounter:
+    """Counts backend executions by wrapping db._execute_sql (after single-flight)."""
+
+    def __init__(self):
+        import db
+
+        self.count = 0
+        self._lock = threading.Lock()
+        inner = db._execute_sql
+
+        def counted(query, params=None):
+            with self._lock:
+                self.count += 1
+            return inner(query, params)
+
+        db._execute_sql = counted
+
+
+def _pin_streamlit_runtime():
+    """Keep a Streamlit runtime visible across concurrent AppTest runs.
+
+    AppTest installs a mock Runtime singleton at the start of every run and
+    clears it at the end, so with concurrent sessions one run's teardown would
+    pull the runtime from under another. Readers go through Runtime.instance()
+    and Runtime.exists(); make those fall back to the last installed mock.
+    """
+    from streamlit.runtime.runtime import Runtime
+
+    if getattr(Runtime, "_loadtest_pinned", False):
+        return
+    last = []
+
+    def instance(cls):
+        inst = cls._instance
+        if inst is not None:
+            last[:] = [inst]
+            return inst
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    def exists(cls):
+        return cls._instance is not None or bool(last)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    Runtime._loadtest_pinned = True
+
+
+class Catalog:
+    def __init__(self, dist: str, zipf_s: float, rng: random.Random):
+        import db
+        from queries import playlist_names_sql, track_catalog_sql
+
+        tracks = db.execute_sql(track_catalog_sql())
+        self.titles = tracks["track_title"].astype(str).tolist()
+        self.artists = list(dict.fromkeys(tracks["artist_name"].dropna().astype(str)))
+        self.playlists = db.execute_sql(playlist_names_sql())["playlist_name"].astype(str).tolist()
+        self.dist = dist
+        self.zipf_s = zipf_s
+        self.rng = rng
+        self._weights: Dict[int, np.ndarray] = {}
+
+    def _pick(self, values: List[str]) -> str:
+        if self.dist == "uniform":
+            return self.rng.choice(values)
+        n = len(values)
+        if n not in self._weights:
+            w = 1.0 / np.arange(1, n + 1) ** self.zipf_s
+            self._weights[n] = np.cumsum(w / w.sum())
+        i = int(np.searchsorted(self._weights[n], self.rng.random(), side="right"))
+        return values[min(i, n - 1)]
+
+    def query(self, mode: str) -> str:
+        return self._pick({"track": self.titles, "artist": self.artists, "playlist": self.playlists}[mode])
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, List[str]] = defaultdict(list)
+        self.flows = 0
+        self.active = 0
+
+    def record(self, step: str, seconds: float, outcome: str, message: Optional[str] = None):
+        with self.lock:
+            if outcome == "ok":
+                self.latencies[step].append(seconds)
+            self.outcomes[step][outcome] += 1
+            if message and len(self.errors[step]) < 5 and message not in self.errors[step]:
+                self.errors[step].append(message)
+
+
+def _outcome(at):
+    if len(at.exception):
+        return "exception", str(at.exception[0].value)[:300]
+    if len(at.error):
+        return "error", str(at.error[0].value)[:300]
+    if not at.main.children:
+        return "empty_render", None
+    return "ok", None
+
+
+def _timed(results: Results, step: str, fn):
+    started = time.perf_counter()
+    try:
+        at = fn()
+    except Exception as e:
+        results.record(step, time.perf_counter() - started, "exception", f"{type(e).__name__}: {e}"[:300])
+        return None
+    outcome, message = _outcome(at)
+    results.record(step, time.perf_counter() - started, outcome, message)
+    return at if outcome == "ok" else None
+
+
+def _run_flow(args, catalog: Catalog, results: Results, rng: random.Random):
+    from streamlit.testing.v1 import AppTest
+
+    def think():
+        if args.think_ms > 0:
+            time.sleep(rng.expovariate(1000.0 / args.think_ms))
+
+    mode = rng.choices(list(args.modes), weights=list(args.modes.values()))[0]
+    model = rng.choices(list(args.models), weights=list(args.models.values()))[0]
+    def open_page():
+        at = AppTest.from_file(os.path.join(args.app_dir, "app.py"), default_timeout=args.timeout).run()
+        if mode != "track":
+            at.radio[0].set_value({"artist": "Artist name", "playlist": "Playlist name"}[mode]).run()
+        if model != "co-occurrence":
+            next(s for s in at.selectbox if s.label == "Model").set_value(model.capitalize()).run()
+        return at
+
+    at = _timed(results, "open", open_page)
+    if at is None:
+        return
+    at = _timed(results, "search", lambda: at.text_input[0].input(catalog.query(mode)).run())
+    if at is None:
+        return
+    if len(at.warning):
+        # "No tracks matched" and friends: the flow ends here, as it would for a user.
+        results.record("recommend", 0.0, "no_match")
+        return
+    think()
+    at = _timed(results, "recommend", lambda: at.button[0].click().run())
+    if at is None or not len(at.success):
+        return
+    think()
+    at = _timed(results, "explain", lambda: at.switch_page("pages/3_Explanation_Relationships.py").run())
+    if at is None:
+        return
+    think()
+    if _timed(results, "metrics", lambda: at.switch_page("pages/4_Recommender_Metrics.py").run()) is not None:
+        with results.lock:
+            results.flows += 1
+
+
+def _session(args, catalog, results, stop_at, index):
+    rng = random.Random(args.random_seed * 1000 + index)
+    time.sleep(args.ramp_s * index / max(args.sessions, 1))
+    with results.lock:
+        results.active += 1
+    try:
+        n = 0
+        while time.monotonic() < stop_at and (args.flows is None or n < args.flows):
+            _run_flow(args, catalog, results, rng)
+            n += 1
+    finally:
+        with results.lock:
+            results.active -= 1
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {
+        "n": len(values),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def run(args) -> dict:
+    os.environ["RECOMMENDER_BACKEND"] = "local"
+    if args.data_dir:
+        os.environ["RECOMMENDER_LOCAL_DIR"] = os.path.abspath(args.data_dir)
+    if args.app_dir not in sys.path:
+        sys.path.insert(0, args.app_dir)
+    os.chdir(args.app_dir)
+
+    import db
+    from recommender import warmup
+
+    rng = random.Random(args.random_seed)
+    catalog = Catalog(args.seed_dist, args.zipf_s, rng)
+    if args.warm:
+        warmup.start_warmup()
+        warmup.wait_for_warmup(120)
+
+    _pin_streamlit_runtime()
+    counter = QueryCounter()
+    results = Results()
+    timeline = []
+    started = time.monotonic()
+    stop_at = started + (args.duration if args.duration else float("inf"))
+    threads = [
+        threading.Thread(target=_session, args=(args, catalog, results, stop_at, i), name=f"loadtest-{i}", daemon=True)
+        for i in range(args.sessions)
+    ]
+    for t in threads:
+        t.start()
+
+    while any(t.is_alive() for t in threads):
+        with results.lock:
+            point = {
+                "t_s": round(time.monotonic() - started, 2),
+                "rss_mb": round(rss_mb(), 1),
+                "active_sessions": results.active,
+                "flows": results.flows,
+                "backend_queries": counter.count,
+            }
+        timeline.append(point)
+        for t in threads:
+            t.join(timeout=args.sample_s / max(len(threads), 1))
+    elapsed = time.monotonic() - started
+
+    with results.lock:
+        steps = {
+            s: {
+                **_percentiles(results.latencies[s]),
+                "outcomes": dict(results.outcomes[s]),
+                "sample_errors": list(results.errors[s]),
+            }
+            for s in STEPS
+        }
+        flows = results.flows
+    rss = [p["rss_mb"] for p in timeline] or [rss_mb()]
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "duration_s": args.duration,
+            "flows_per_session": args.flows,
+            "think_ms": args.think_ms,
+            "seed_dist": args.seed_dist if args.seed_dist == "uniform" else f"zipf(s={args.zipf_s})",
+            "modes": args.modes,
+            "models": args.models,
+            "data_dir": db.local_data_dir(),
+        },
+        "elapsed_s": round(elapsed, 2),
+        "completed_flows": flows,
+        "throughput_flows_per_s": round(flows / elapsed, 3) if elapsed > 0 else 0.0,
+        "steps": steps,
+        "backend_queries": counter.count,
+        "backend_queries_per_flow": round(counter.count / flows, 2) if flows else None,
+        "single_flight": db.single_flight_stats(),
+        "memory": {"start_mb": rss[0], "peak_mb": max(rss), "end_mb": rss[-1]},
+        "timeline": timeline,
+    }
+
+
+def _print_report(report: dict):
+    print(f"{report['completed_flows']} flows in {report['elapsed_s']}s "
+          f"({report['throughput_flows_per_s']} flows/s, {report['config']['sessions']} sessions)")
+    print(f"{'step':<10}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  outcomes")
+    for step, s in report["steps"].items():
+        print(f"{step:<10}{s['n']:>6}{s.get('p50_ms', '-'):>10}{s.get('p95_ms', '-'):>10}"
+              f"{s.get('p99_ms', '-'):>10}{s.get('max_ms', '-'):>10}  {s['outcomes']}")
+        for message in s["sample_errors"]:
+            print(f"{'':<10}! {message}")
+    print(f"backend queries: {report['backend_queries']} ({report['backend_queries_per_flow']} per flow)")
+    m = report["memory"]
+    print(f"rss: start {m['start_mb']} MB, peak {m['peak_mb']} MB, end {m['end_mb']} MB")
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Simulate concurrent app sessions against the local backend.")
+    p.add_argument("--data-dir", default=None, help="Local Parquet directory (default: RECOMMENDER_LOCAL_DIR or ./data).")
+    p.add_argument("--sessions", type=int, default=4, help="Concurrent sessions.")
+    p.add_argument("--duration", type=float, default=60.0, help="Seconds to run (0: until --flows are done).")
+    p.add_argument("--flows", type=int, default=None, help="Flows per session (default: unlimited within --duration).")
+    p.add_argument("--think-ms", type=float, default=1000.0, help="Mean think time between steps (exponential).")
+    p.add_argument("--ramp-s", type=float, default=0.0, help="Spread session starts over this many seconds.")
+    p.add_argument("--seed-dist", choices=["uniform", "zipf"], default="uniform",
+                   help="How queries are drawn from the popularity-ranked catalog.")
+    p.add_argument("--zipf-s", type=float, default=1.1)
+    p.add_argument("--modes", type=_parse_mix, default=_parse_mix("track=0.6,artist=0.3,playlist=0.1"),
+                   help="Seed mode mix, e.g. track=0.6,artist=0.3,playlist=0.1")
+    p.add_argument("--models", type=_parse_mix, default=_parse_mix("co-occurrence=0.8,popularity=0.2"),
+                   help="Model mix, e.g. co-occurrence=0.8,popularity=0.2")
+    p.add_argument("--timeout", type=float, default=120.0, help="Per-step AppTest timeout in seconds.")
+    p.add_argument("--sample-s", type=float, default=1.0, help="Memory/progress sampling interval.")
+    p.add_argument("--no-warm", dest="warm", action="store_false", help="Skip the warm-up before starting.")
+    p.add_argument("--random-seed", type=int, default=0)
+    p.add_argument("--json", default=None, help="Also write the full report (with timeline) to this file.")
+    p.add_argument("--app-dir", default=APP_DIR, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.flows is None and not args.duration:
+        p.error("Pass --duration or --flows.")
+    unknown = set(args.modes) - {"track", "artist", "playlist"}
+    if unknown:
+        p.error(f"Unknown seed modes: {sorted(unknown)}")
+    unknown = set(args.models) - {"co-occurrence", "popularity"}
+    if unknown:
+        p.error(f"Unknown models: {sorted(unknown)}")
+
+    report = run(args)
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
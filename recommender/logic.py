@@ -1,4 +1,9 @@
-from typing import List, Optional
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
 from queries import (
@@ -11,14 +16,19 @@ from queries import (
     cooccurrence_pairs_sql,
     search_tracks_by_title_sql,
     search_artist_top_tracks_sql,
+    search_artist_top_tracks_from_gold_sql,
+    artist_neighbors_sql,
     search_playlists_by_name_sql,
     stats_sql,
+    stats_from_gold_sql,
     top_artists_sql,
-    tracks_metadata_sql,
     track_popularity_for_uris_sql,
     seed_candidate_cooccurrence_sql,
+    track_playlists_sql,
 )
-from db import execute_sql
+from db import DeadlineExceeded, deadline_scope, execute_sql, is_missing_table_error
+from recommender import batching, frame_store, popularity, router, seed_cache, stats_snapshot
+from recommender.postings import get_posting_store, intersection_frame, postings_from_frame, top_counts
 
 
 def fetch_playlist_seed_tracks(playlist_id: str) -> pd.DataFrame:
@@ -32,8 +42,26 @@ def search_tracks_by_title(title: str, limit: int = 10) -> pd.DataFrame:
 
 
 def search_artist_top_tracks(artist_name: str, limit: int = 10) -> pd.DataFrame:
-    q = search_artist_top_tracks_sql(artist_name, limit)
-    return execute_sql(q)
+    # Fast path: per-artist top tracks from recommender/materialize.py. The fact
+    # table is scanned only when the gold table has not been built; an empty
+    # gold result means no artist matches.
+    try:
+        return execute_sql(search_artist_top_tracks_from_gold_sql(artist_name, limit))
+    except Exception as exc:
+        if not is_missing_table_error(exc):
+            raise
+    return execute_sql(search_artist_top_tracks_sql(artist_name, limit))
+
+
+def artist_neighbors(artist_names: List[str]) -> pd.DataFrame:
+    """Precomputed artist x artist shared-playlist counts; empty when the gold table is missing."""
+    names = list(dict.fromkeys(str(a) for a in artist_names if a))
+    try:
+        return execute_sql(artist_neighbors_sql(names))
+    except Exception as exc:
+        if not is_missing_table_error(exc):
+            raise
+        return pd.DataFrame(columns=['artist_name', 'neighbor_artist_name', 'shared_playlists', 'neighbor_rank'])
 
 
 def search_playlists_by_name(name: str, limit: int = 10) -> pd.DataFrame:
@@ -41,22 +69,72 @@ def search_playlists_by_name(name: str, limit: int = 10) -> pd.DataFrame:
     return execute_sql(q)
 
 
-def get_stats() -> dict:
-    q = stats_sql()
-    df = execute_sql(q)
+_stats_snapshot: Optional[dict] = None
+
+
+def load_stats_snapshot(refresh: bool = False) -> dict:
+    """Dataset stats cached for the process lifetime (they only change on data loads)."""
+    global _stats_snapshot
+    if refresh or _stats_snapshot is None:
+        _stats_snapshot = get_stats()
+    return _stats_snapshot
+
+
+def get_stats(exact: bool = False) -> dict:
+    # Fastest path: sketch snapshot from recommender/stats_snapshot.py.
+    if not exact:
+        snap = stats_snapshot.get_snapshot()
+        if snap is not None:
+            return snap.stats()
+    # Then the one-row gold table from recommender/materialize.py.
+    try:
+        df = execute_sql(stats_from_gold_sql())
+    except Exception:
+        df = pd.DataFrame()
+    if df is None or df.empty:
+        df = execute_sql(stats_sql())
     if df.empty:
         return {}
     row = df.iloc[0].to_dict()
     return row
 
 
-def top_artists(limit: int = 10) -> pd.DataFrame:
+def top_artists(limit: int = 10, exact: bool = False) -> pd.DataFrame:
+    snap = None if exact else stats_snapshot.get_snapshot()
+    if snap is not None and limit <= snap.artist_tracks.capacity:
+        return snap.top_artists(limit)
     q = top_artists_sql(limit)
     return execute_sql(q)
 
 
+def _local_cooccurrence(seed_track_uris: List[str], top_k: int) -> Optional[pd.DataFrame]:
+    """Co-occurrence ranking from the posting store; None when no store is built."""
+    if get_posting_store() is None:
+        return None
+    return _decomposed_cooccurrence(seed_track_uris, top_k)
+
+
+def _decomposed_cooccurrence(seed_track_uris: List[str], top_k: int, use_postings: bool = True) -> Optional[pd.DataFrame]:
+    """Co-occurrence assembled from per-seed cached pieces; None if too large to assemble."""
+    df = seed_cache.seed_cooccurrence(seed_track_uris, top_k, use_postings=use_postings)
+    return _with_metadata(df)
+
+
+def _with_metadata(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    if df is None:
+        return None
+    if df.empty:
+        return pd.DataFrame(columns=['track_uri', 'track_title', 'artist_name', 'score'])
+    meta = fetch_tracks_metadata(df['track_uri'].tolist())
+    df = df.merge(meta.drop_duplicates('track_uri'), on='track_uri', how='inner')
+    return df[['track_uri', 'track_title', 'artist_name', 'score']]
+
+
 def fetch_cooccurrence_pairs(seed_track_uri: str, top_k: int = 100) -> pd.DataFrame:
     """Return co-occurring tracks and counts for a given seed track URI."""
+    local = _local_cooccurrence([seed_track_uri], top_k)
+    if local is not None:
+        return local.rename(columns={'score': 'weight'})
     q = cooccurrence_pairs_sql(seed_track_uri, limit=top_k)
     df = execute_sql(q)
     if df.empty:
@@ -80,13 +158,23 @@ def fetch_cooccurrence_pairs(seed_track_uri: str, top_k: int = 100) -> pd.DataFr
 
 
 def fetch_tracks_metadata(track_uris: List[str]) -> pd.DataFrame:
-    q = tracks_metadata_sql(track_uris)
-    return execute_sql(q)
+    # Per-track cache: only URIs not seen before go to the backend.
+    return seed_cache.tracks_metadata(track_uris)
 
 
 def track_popularity_for_uris(track_uris: List[str]) -> pd.DataFrame:
-    q = track_popularity_for_uris_sql(track_uris)
-    return execute_sql(q)
+    # Resident per-track popularity array (recommender/popularity.py); the
+    # per-URI scan is only the fallback if it cannot be built.
+    try:
+        return popularity.popularity_for_uris(track_uris)
+    except Exception:
+        q = track_popularity_for_uris_sql(track_uris)
+        return execute_sql(q)
+
+
+def popularity_summary(track_uris: List[str]) -> dict:
+    """Mean popularity and popularity percentiles for a track set (see recommender/popularity.py)."""
+    return popularity.popularity_summary(track_uris)
 
 
 def seed_candidate_cooccurrence(seed_track_uris: List[str], candidate_track_uris: List[str]) -> pd.DataFrame:
@@ -94,7 +182,77 @@ def seed_candidate_cooccurrence(seed_track_uris: List[str], candidate_track_uris
     return execute_sql(q)
 
 
-def recommend_by_popularity(seed_track_ids: Optional[List[str]], top_k: int) -> pd.DataFrame:
+def fetch_track_postings(track_uris: List[str]) -> Dict[str, np.ndarray]:
+    """Sorted playlist-code arrays for the given tracks.
+
+    Served from the memory-mapped posting store when built, else one fact-table scan.
+    """
+    uris = list(dict.fromkeys(str(u) for u in track_uris))
+    if not uris:
+        return {}
+    store = get_posting_store()
+    if store is not None:
+        return store.postings_for_uris(uris)
+    return postings_from_frame(execute_sql(track_playlists_sql(uris)))
+
+
+def explain_seed_candidates(seed_track_uris: List[str], candidate_track_uris: List[str]) -> pd.DataFrame:
+    """Seed x candidate shared-playlist counts, computed in-process.
+
+    Same columns as `seed_candidate_cooccurrence`, but the join runs locally as
+    vectorized posting-list intersections, so the whole seed playlist and every
+    recommendation can be explained in one call.
+    """
+    seeds = list(dict.fromkeys(str(u) for u in seed_track_uris))
+    cands = list(dict.fromkeys(str(u) for u in candidate_track_uris))
+    if not seeds or not cands:
+        return pd.DataFrame(columns=['seed_track_uri', 'candidate_track_uri', 'shared_playlists'])
+    postings = fetch_track_postings(seeds + cands)
+    df, _ = intersection_frame(seeds, cands, postings)
+    return df
+
+
+# Resident head of the global popularity ranking, loaded by the warm-up thread
+# (recommender/warmup.py) so popularity requests skip the warehouse entirely.
+POPULARITY_HEAD_SIZE = 500
+_popularity_head: Optional[pd.DataFrame] = None
+_popularity_head_complete = False
+_popularity_head_lock = threading.Lock()
+
+
+def load_popularity_head(size: int = POPULARITY_HEAD_SIZE, refresh: bool = False) -> pd.DataFrame:
+    global _popularity_head, _popularity_head_complete
+    with _popularity_head_lock:
+        if refresh or _popularity_head is None or len(_popularity_head) < size and not _popularity_head_complete:
+            head = _query_popularity([], int(size))
+            _popularity_head = head
+            # A short head means the catalogue itself is smaller than `size`.
+            _popularity_head_complete = len(head) < int(size)
+        return _popularity_head
+
+
+def _popularity_from_head(exclude_track_uris: Optional[List[str]], top_k: int, allow_short: bool = False) -> Optional[pd.DataFrame]:
+    head, complete = _popularity_head, _popularity_head_complete
+    if head is None or head.empty:
+        return None
+    if exclude_track_uris:
+        head = head[~head['track_uri'].isin([str(u) for u in exclude_track_uris])]
+    if len(head) < int(top_k) and not (complete or allow_short):
+        return None
+    df = head.head(int(top_k)).copy()
+    df['rank'] = range(1, len(df) + 1)
+    return df.reset_index(drop=True)
+
+
+def recommend_by_popularity(seed_track_ids: Optional[List[str]], top_k: int, deadline: Optional[float] = None) -> pd.DataFrame:
+    df = _popularity_from_head(seed_track_ids, top_k)
+    if df is not None:
+        return df
+    with deadline_scope(deadline):
+        return _query_popularity(seed_track_ids, top_k)
+
+
+def _query_popularity(seed_track_ids: Optional[List[str]], top_k: int) -> pd.DataFrame:
     # Fast path: use gold summary if available; fall back to counting the fact table.
     df = pd.DataFrame()
     try:
@@ -132,9 +290,21 @@ def recommend_global_popularity(top_k: int) -> pd.DataFrame:
     return df
 
 
-def recommend_by_cooccurrence(seed_track_ids: List[str], top_k: int) -> pd.DataFrame:
-    q = cooccurrence_sql(seed_track_ids, top_k)
-    df = execute_sql(q)
+def recommend_by_cooccurrence(seed_track_ids: List[str], top_k: int, deadline: Optional[float] = None,
+                              engine: Optional[str] = None) -> pd.DataFrame:
+    """`engine=router.ENGINE_SQL` skips the posting store; by default it is used when built."""
+    use_postings = engine != router.ENGINE_SQL
+    with deadline_scope(deadline):
+        df = _local_cooccurrence(seed_track_ids, top_k) if use_postings else None
+        if df is None:
+            # SQL backends: concurrent requests are evaluated together.
+            if batching.enabled():
+                df = batching.cooccurrence(seed_track_ids, top_k)
+            else:
+                df = _decomposed_cooccurrence(seed_track_ids, top_k, use_postings=use_postings)
+        if df is None:
+            q = cooccurrence_sql(seed_track_ids, top_k)
+            df = execute_sql(q)
     if df.empty:
         return df
     df = df[['track_uri','track_title','artist_name','score']]
@@ -142,9 +312,26 @@ def recommend_by_cooccurrence(seed_track_ids: List[str], top_k: int) -> pd.DataF
     return df[['rank','track_uri','track_title','artist_name','score']]
 
 
-def recommend_by_cooccurrence_from_playlist(playlist_id: str, top_k: int) -> pd.DataFrame:
-    q = cooccurrence_from_playlist_sql(playlist_id, top_k)
-    df = execute_sql(q)
+def _playlist_tracks_from_store(playlist_id: str) -> Optional[List[str]]:
+    store = get_posting_store()
+    if store is None:
+        return None
+    code = int(store.playlist_codes([str(playlist_id)])[0])
+    if code < 0:
+        return None
+    return store.decode_tracks(store.playlist_tracks_of(code))
+
+
+def recommend_by_cooccurrence_from_playlist(playlist_id: str, top_k: int, deadline: Optional[float] = None,
+                                            engine: Optional[str] = None) -> pd.DataFrame:
+    with deadline_scope(deadline):
+        df = None
+        seeds = _playlist_tracks_from_store(playlist_id) if engine != router.ENGINE_SQL else None
+        if seeds is not None:
+            df = _local_cooccurrence(seeds, top_k)
+        if df is None:
+            q = cooccurrence_from_playlist_sql(playlist_id, top_k)
+            df = execute_sql(q)
     if df.empty:
         return df
     df = df[['track_uri', 'track_title', 'artist_name', 'score']]
@@ -152,30 +339,245 @@ def recommend_by_cooccurrence_from_playlist(playlist_id: str, top_k: int) -> pd.
     return df[['rank', 'track_uri', 'track_title', 'artist_name', 'score']]
 
 
-def recommend_by_popularity_excluding_playlist(playlist_id: str, top_k: int) -> pd.DataFrame:
+def recommend_by_popularity_excluding_playlist(playlist_id: str, top_k: int, deadline: Optional[float] = None) -> pd.DataFrame:
     # Avoid a full-table aggregation with a correlated NOT IN; instead, fetch the
     # playlist tracks and reuse the popularity recommender's exclude list.
-    seeds_df = fetch_playlist_seed_tracks(playlist_id)
-    playlist_tracks = seeds_df['track_uri'].astype(str).tolist() if not seeds_df.empty else []
-    return recommend_by_popularity(playlist_tracks, top_k)
+    with deadline_scope(deadline):
+        seeds_df = fetch_playlist_seed_tracks(playlist_id)
+        playlist_tracks = seeds_df['track_uri'].astype(str).tolist() if not seeds_df.empty else []
+        return recommend_by_popularity(playlist_tracks, top_k)
 
 
-def get_recommendations(seed_track_ids: Optional[List[str]] = None,
-                        playlist_id: Optional[str] = None,
-                        model: str = 'co-occurrence',
-                        top_k: int = 10) -> pd.DataFrame:
-    model_l = (model or '').lower()
+# --- Deadlines and graceful degradation ---
+#
+# get_recommendations(deadline=...) serves from the cheapest tier that can answer
+# once the backend runs out of budget. The tier is reported in df.attrs['served_by'].
+
+SERVED_EXACT = 'exact'
+SERVED_CACHE = 'cache'
+SERVED_POPULARITY_HEAD = 'popularity_head'
+SERVED_PARTIAL = 'partial'
+SERVED_APPROXIMATE = 'approximate'
+
+RESULT_COLUMNS = ['rank', 'track_uri', 'track_title', 'artist_name', 'score']
+
+# Last good result per seed set, held in the shared byte-bounded frame store.
+_RECENT_RESULTS_NS = 'recent_results'
+_RECENT_RESULTS_MAX = 256
+frame_store.STORE.limits.setdefault(_RECENT_RESULTS_NS, _RECENT_RESULTS_MAX)
+
+
+def _result_key(seed_track_ids: Optional[List[str]], playlist_id: Optional[str], model_l: str) -> tuple:
+    family = 'pop' if model_l.startswith('pop') else 'co'
+    seeds = tuple(sorted({str(u) for u in (seed_track_ids or [])}))
+    return (seeds, str(playlist_id or ''), family)
+
+
+def _remember_result(key: tuple, df: pd.DataFrame):
+    prev_rows = frame_store.STORE.rows(_RECENT_RESULTS_NS, key)
+    if prev_rows is None or len(df) >= prev_rows:
+        frame_store.STORE.put(_RECENT_RESULTS_NS, key, df)
+
+
+def _recent_result(key: tuple, top_k: int) -> Optional[pd.DataFrame]:
+    df = frame_store.STORE.get(_RECENT_RESULTS_NS, key)
+    if df is None or df.empty:
+        return None
+    return df.head(int(top_k)).copy()
+
+
+def _partial_result(seed_track_ids: Optional[List[str]], playlist_id: Optional[str], top_k: int) -> pd.DataFrame:
+    """Best-effort co-occurrence from the local posting store, without metadata lookups."""
+    store = get_posting_store()
+    seeds = list(seed_track_ids or [])
+    if not seeds and playlist_id:
+        seeds = _playlist_tracks_from_store(playlist_id) or []
+    if store is None or not seeds:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    counts = store.cooccurrence_counts(store.track_codes([str(u) for u in seeds]))
+    idx, scores = top_counts(counts, top_k)
+    uris = store.decode_tracks(idx)
+    df = pd.DataFrame({'rank': range(1, len(uris) + 1), 'track_uri': uris, 'track_title': uris, 'artist_name': None, 'score': scores.astype(np.int64)})
+    head = _popularity_head
+    if head is not None and not head.empty:
+        known = head.drop_duplicates('track_uri').set_index('track_uri')
+        df['track_title'] = df['track_uri'].map(known['track_title']).fillna(df['track_uri'])
+        df['artist_name'] = df['track_uri'].map(known['artist_name'])
+    return df[RESULT_COLUMNS]
+
+
+def _degraded_recommendations(seed_track_ids, playlist_id, model_l: str, top_k: int) -> pd.DataFrame:
+    cached = _recent_result(_result_key(seed_track_ids, playlist_id, model_l), top_k)
+    if cached is not None:
+        cached.attrs['served_by'] = SERVED_CACHE
+        return cached
+
+    exclude = list(seed_track_ids or []) or (_playlist_tracks_from_store(playlist_id) if playlist_id else None) or []
+    head = _popularity_from_head(exclude, top_k, allow_short=True)
+    if head is not None and not head.empty:
+        head.attrs['served_by'] = SERVED_POPULARITY_HEAD
+        return head
+
+    partial = _partial_result(seed_track_ids, playlist_id, top_k)
+    partial.attrs['served_by'] = SERVED_PARTIAL
+    return partial
+
+
+def _budgeted_cooccurrence(decision: router.Decision, top_k: int) -> pd.DataFrame:
+    """Approximate co-occurrence reading at most `decision.max_fanout` seed playlists.
+
+    With the posting store the playlists are a uniform sample and scores are
+    scaled estimates; on SQL the rarest seeds that fit are kept, so scores
+    count only their playlists.
+    """
+    seeds = [str(u) for u in dict.fromkeys(decision.seeds)]
+    store = get_posting_store()
+    if store is not None:
+        counts, used = store.sampled_cooccurrence_counts(store.track_codes(seeds), decision.max_fanout)
+        idx, scores = top_counts(counts, top_k)
+        decision.fanout_used = used
+        df = _with_metadata(pd.DataFrame({'track_uri': store.decode_tracks(idx), 'score': scores.astype(np.int64)}))
+    else:
+        degrees = router.seed_degrees(seeds)
+        order = np.argsort(degrees, kind='stable')
+        n_keep = max(int(np.searchsorted(np.cumsum(degrees[order]), decision.max_fanout, side='right')), 1)
+        keep = [seeds[i] for i in order[:n_keep]]
+        dropped = set(seeds) - set(keep)
+        decision.fanout_used = int(degrees[order[:n_keep]].sum())
+        df = recommend_by_cooccurrence(keep, top_k + len(dropped), engine=router.ENGINE_SQL)
+        if not df.empty:
+            df = df[~df['track_uri'].astype(str).isin(dropped)].head(top_k)
+    if df.empty:
+        return df
+    df = df[['track_uri', 'track_title', 'artist_name', 'score']].reset_index(drop=True)
+    df['rank'] = range(1, len(df) + 1)
+    return df[RESULT_COLUMNS]
+
+
+def _compute_recommendations(seed_track_ids, playlist_id, model_l: str, top_k: int,
+                             decision: Optional[router.Decision] = None) -> pd.DataFrame:
+    engine = decision.engine if decision is not None else None
+    if engine == router.ENGINE_BUDGETED:
+        return _budgeted_cooccurrence(decision, top_k)
 
     # Playlist-based seed: avoid huge IN (...) lists for large playlists.
     if playlist_id and not seed_track_ids:
         if model_l.startswith('pop'):
             return recommend_by_popularity_excluding_playlist(playlist_id, top_k)
-        return recommend_by_cooccurrence_from_playlist(playlist_id, top_k)
+        return recommend_by_cooccurrence_from_playlist(playlist_id, top_k, engine=engine)
 
     # Track-based seed
     if model_l.startswith('pop'):
         return recommend_by_popularity(seed_track_ids or [], top_k)
+    return recommend_by_cooccurrence(seed_track_ids, top_k, engine=engine)
 
-    if not seed_track_ids:
+
+def _route(seed_track_ids, playlist_id, model_l: str, deadline: Optional[float]) -> Optional[router.Decision]:
+    """Routing decision for a co-occurrence request (None for popularity or with routing off)."""
+    if model_l.startswith('pop') or not router.enabled():
+        return None
+    seeds = seed_track_ids if seed_track_ids else _playlist_tracks_from_store(playlist_id)
+    return router.route(seeds, deadline)
+
+
+def get_recommendations(seed_track_ids: Optional[List[str]] = None,
+                        playlist_id: Optional[str] = None,
+                        model: str = 'co-occurrence',
+                        top_k: int = 10,
+                        deadline: Optional[float] = None) -> pd.DataFrame:
+    """Ranked recommendations for a seed set or a playlist.
+
+    `deadline` is an absolute `time.monotonic()` timestamp. Every query gets the
+    remaining budget as its timeout; if the budget runs out the result falls back,
+    in order, to a cached result for the same seeds, the resident popularity head,
+    or a partial local result. `df.attrs['served_by']` names the tier.
+
+    Co-occurrence requests go through recommender/router.py, which picks the
+    posting store, SQL or, when both are predicted to miss the deadline, an
+    approximate result ('approximate' tier) within the budget.
+    """
+    model_l = (model or '').lower()
+
+    if not (playlist_id and not seed_track_ids) and not model_l.startswith('pop') and not seed_track_ids:
         raise ValueError('Co-occurrence model requires at least one seed track URI')
-    return recommend_by_cooccurrence(seed_track_ids, top_k)
+
+    decision = _route(seed_track_ids, playlist_id, model_l, deadline)
+    started = time.monotonic()
+    try:
+        with deadline_scope(deadline):
+            df = _compute_recommendations(seed_track_ids, playlist_id, model_l, top_k, decision)
+    except DeadlineExceeded:
+        df = _degraded_recommendations(seed_track_ids, playlist_id, model_l, top_k)
+        if decision is not None:
+            router.record(decision, time.monotonic() - started, df.attrs['served_by'], timed_out=True,
+                          top_k=top_k, playlist=not seed_track_ids)
+        return df
+
+    approximate = decision is not None and decision.engine == router.ENGINE_BUDGETED
+    if not df.empty and not approximate:
+        _remember_result(_result_key(seed_track_ids, playlist_id, model_l), df)
+    df.attrs['served_by'] = SERVED_APPROXIMATE if approximate else SERVED_EXACT
+    if decision is not None:
+        router.record(decision, time.monotonic() - started, df.attrs['served_by'], top_k=top_k,
+                      playlist=not seed_track_ids)
+    return df
+
+
+# --- Ranked runs: compute a candidate pool once, page through it ---
+#
+# A run over-fetches by the number of excluded tracks in the same backend call,
+# so every page is full after exclusion, and later pages ("next 50") are served
+# from the retained pool without touching the backend.
+
+RANKED_POOL_SIZE = int(os.environ.get('RECOMMENDER_RANKED_POOL', '200'))
+_RUNS_NS = 'ranked_runs'
+_RUNS_MAX = 512
+frame_store.STORE.limits.setdefault(_RUNS_NS, _RUNS_MAX)
+
+
+def ranked_candidates(seed_track_ids: Optional[List[str]] = None,
+                      playlist_id: Optional[str] = None,
+                      model: str = 'co-occurrence',
+                      pool_size: int = RANKED_POOL_SIZE,
+                      exclude: Optional[Iterable[str]] = None,
+                      deadline: Optional[float] = None) -> pd.DataFrame:
+    """Top `pool_size` recommendations after dropping `exclude`, in one backend call."""
+    excluded = {str(u) for u in (exclude or [])}
+    df = get_recommendations(seed_track_ids, playlist_id, model, int(pool_size) + len(excluded), deadline=deadline)
+    served_by = df.attrs.get('served_by', SERVED_EXACT)
+    if excluded and not df.empty:
+        df = df[~df['track_uri'].astype(str).isin(excluded)]
+    df = df.head(int(pool_size)).reset_index(drop=True)
+    if not df.empty:
+        df['rank'] = range(1, len(df) + 1)
+    df.attrs['served_by'] = served_by
+    return df
+
+
+def start_ranked_run(seed_track_ids: Optional[List[str]] = None,
+                     playlist_id: Optional[str] = None,
+                     model: str = 'co-occurrence',
+                     pool_size: int = RANKED_POOL_SIZE,
+                     exclude: Optional[Iterable[str]] = None,
+                     deadline: Optional[float] = None) -> Tuple[str, pd.DataFrame]:
+    """Compute and retain a ranked pool; returns (run_id, pool)."""
+    pool = ranked_candidates(seed_track_ids, playlist_id, model, pool_size, exclude, deadline)
+    run_id = uuid.uuid4().hex
+    frame_store.STORE.put(_RUNS_NS, run_id, pool)
+    return run_id, pool
+
+
+def page_ranked_run(run_id: str, cursor: int = 0, limit: int = 50) -> Tuple[pd.DataFrame, Optional[int]]:
+    """Rows [cursor, cursor + limit) of a retained run, and the next cursor (None at the end).
+
+    Raises KeyError when the run has expired.
+    """
+    pool = frame_store.STORE.get(_RUNS_NS, run_id)
+    if pool is None:
+        raise KeyError(run_id)
+    cursor = max(0, int(cursor))
+    end = cursor + max(1, int(limit))
+    page = pool.iloc[cursor:end].reset_index(drop=True)
+    page.attrs = dict(pool.attrs)
+    return page, (end if end < len(pool) else None)
+
@@ -0,0 +1,294 @@
+"""Build the gold tables the recommender reads on its fast paths.
+
+Tables:
+- gold_track_summary: per-track playlist counts (popularity fast path)
+- gold_artist_top_tracks: per-artist top tracks by playlist count
+- gold_artist_neighbors: top-N co-occurring artists per artist (shared playlists)
+- gold_dataset_stats: one-row dataset badges (tracks / playlists / artists)
+- gold_track_neighbors: top-N co-occurring tracks per track
+
+Two targets are supported:
+- warehouse: CREATE OR REPLACE TABLE statements run on Databricks, with the
+  neighbor table filled by hash partitions in parallel.
+- local: raw fact data is read from Parquet, neighbor counts are built by
+  recommender.cooccurrence (playlist chunks in a process pool over
+  shared-memory arrays), and tables are written to `<data_dir>/gold/*.parquet`.
+
+Both targets write a manifest that the app checks at startup.
+
+Usage:
+    python -m recommender.materialize --target local
+    python -m recommender.materialize --target warehouse --partitions 16
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+from db import execute_sql, get_backend, local_data_dir, open_local_connection
+from queries import (
+    gold_track_summary_create_sql,
+    gold_artist_top_tracks_create_sql,
+    gold_artist_neighbors_create_sql,
+    gold_dataset_stats_create_sql,
+    gold_track_neighbors_create_sql,
+    gold_track_neighbors_insert_sql,
+    gold_manifest_create_sql,
+    gold_manifest_sql,
+)
+
+
+# Bump when the layout/columns of any gold table change; the app refuses stale builds.
+GOLD_SCHEMA_VERSION = "2"
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def gold_dir(data_dir: Optional[str] = None) -> str:
+    return os.path.join(data_dir or local_data_dir(), "gold")
+
+
+# --- Manifest ---
+
+def _manifest(target: str, tables: Dict[str, int], params: dict) -> dict:
+    return {
+        "schema_version": GOLD_SCHEMA_VERSION,
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": target,
+        "tables": tables,
+        "params": params,
+    }
+
+
+def read_gold_manifest(data_dir: Optional[str] = None) -> Optional[dict]:
+    """Return the manifest for the active backend, or None if nothing was built."""
+    if get_backend() == "local" or data_dir:
+        path = os.path.join(gold_dir(data_dir), MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    try:
+        df = execute_sql(gold_manifest_sql())
+    except Exception:
+        return None
+    if df.empty:
+        return None
+    row = df.iloc[0]
+    details = json.loads(row["details"]) if row.get("details") else {}
+    details["schema_version"] = str(row["version"])
+    details["built_at"] = str(row["built_at"])
+    return details
+
+
+def gold_manifest_status(data_dir: Optional[str] = None) -> Tuple[bool, str]:
+    """Check that gold tables exist and match this code's schema version.
+
+    Returns (ok: bool, message: str).
+    """
+    m = read_gold_manifest(data_dir)
+    if m is None:
+        return False, "No gold manifest found; run `python -m recommender.materialize`."
+    version = str(m.get("schema_version"))
+    if version != GOLD_SCHEMA_VERSION:
+        return False, f"Gold tables are schema v{version}, expected v{GOLD_SCHEMA_VERSION}; re-run the materializer."
+    return True, f"Gold tables v{version} built {m.get('built_at', '?')}"
+
+
+# --- Warehouse target ---
+
+def materialize_warehouse(
+    top_n: int = 100,
+    per_artist: int = 50,
+    artist_top_n: int = 50,
+    partitions: int = 8,
+    workers: int = 4,
+) -> dict:
+    """Build gold tables on the warehouse and record a `default.gold_manifest` row."""
+    started = time.perf_counter()
+
+    # Independent CTAS statements run concurrently; the warehouse parallelizes each one.
+    ctas = {
+        "gold_track_summary": gold_track_summary_create_sql(),
+        "gold_artist_top_tracks": gold_artist_top_tracks_create_sql(per_artist=per_artist),
+        "gold_artist_neighbors": gold_artist_neighbors_create_sql(top_n=artist_top_n),
+        "gold_dataset_stats": gold_dataset_stats_create_sql(),
+    }
+    execute_sql(gold_track_neighbors_create_sql())
+    neighbor_parts = [gold_track_neighbors_insert_sql(i, partitions, top_n=top_n) for i in range(int(partitions))]
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        futures = {name: pool.submit(execute_sql, q) for name, q in ctas.items()}
+        part_futures = [pool.submit(execute_sql, q) for q in neighbor_parts]
+        for i, f in enumerate(part_futures, start=1):
+            f.result()
+            print(f"gold_track_neighbors: partition {i}/{len(part_futures)} done")
+        for name, f in futures.items():
+            f.result()
+            print(f"{name}: done")
+
+    tables = {}
+    for name in list(ctas) + ["gold_track_neighbors"]:
+        df = execute_sql(f"SELECT COUNT(*) AS n FROM default.{name}")
+        tables[name] = int(df.iloc[0]["n"]) if not df.empty else 0
+
+    params = {
+        "top_n": int(top_n),
+        "per_artist": int(per_artist),
+        "artist_top_n": int(artist_top_n),
+        "partitions": int(partitions),
+    }
+    manifest = _manifest("warehouse", tables, params)
+    manifest["elapsed_s"] = round(time.perf_counter() - started, 2)
+    details = {k: v for k, v in manifest.items() if k not in ("schema_version", "built_at")}
+    execute_sql(gold_manifest_create_sql(GOLD_SCHEMA_VERSION, manifest["built_at"], json.dumps(details)))
+    return manifest
+
+
+# --- Local target ---
+
+def _top_n_per_key(df: pd.DataFrame, key: str, score: str, tiebreak: str, n: int, rank_col: str) -> pd.DataFrame:
+    df = df.sort_values([key, score, tiebreak], ascending=[True, False, True])
+    df = df.groupby(key, sort=False).head(int(n)).copy()
+    df[rank_col] = df.groupby(key, sort=False).cumcount() + 1
+    return df.reset_index(drop=True)
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def materialize_local(
+    data_dir: Optional[str] = None,
+    top_n: int = 100,
+    per_artist: int = 50,
+    artist_top_n: int = 50,
+    partitions: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> dict:
+    """Build gold tables as Parquet from the raw local star schema."""
+    # Imported here: the app imports this module for the manifest check only.
+    import pandas as pd
+
+    from recommender import cooccurrence
+
+    started = time.perf_counter()
+    data_dir = data_dir or local_data_dir()
+    workers = int(workers or os.cpu_count() or 1)
+    partitions = int(partitions or workers * 4)
+
+    conn = open_local_connection(data_dir)
+    try:
+        fact = conn.execute('SELECT playlist_id, track_uri FROM "default".fact_playlist_track').df()
+        dim = conn.execute('SELECT DISTINCT track_uri, track_title, artist_name FROM "default".dim_track').df()
+    finally:
+        conn.close()
+    print(f"Loaded {len(fact):,} fact rows and {len(dim):,} tracks from {data_dir}")
+
+    fact = fact.drop_duplicates()
+    counts = fact.groupby("track_uri").size().rename("playlists_count").reset_index()
+    n_playlists = int(fact["playlist_id"].nunique())
+    neighbors, report = cooccurrence.neighbors_frame(
+        fact["playlist_id"], fact["track_uri"], "track_uri", top_n, workers=workers, chunks=partitions
+    )
+    print(f"Track neighbors: {report}")
+
+    # Artist layer: the same build over distinct (playlist, artist) rows.
+    playlist_artists = fact.merge(dim[["track_uri", "artist_name"]].dropna(), on="track_uri", how="inner")
+    artist_neighbors, report = cooccurrence.neighbors_frame(
+        playlist_artists["playlist_id"], playlist_artists["artist_name"], "artist_name", artist_top_n,
+        workers=workers, chunks=partitions,
+    )
+    print(f"Artist neighbors: {report}")
+
+    summary = counts.merge(dim, on="track_uri", how="inner")
+    summary = summary[["track_uri", "track_title", "artist_name", "playlists_count"]]
+    summary["playlists_count"] = summary["playlists_count"].astype("int64")
+
+    artist_top = _top_n_per_key(
+        summary.dropna(subset=["artist_name"]), "artist_name", "playlists_count", "track_uri", per_artist, "artist_rank"
+    )[["artist_name", "track_uri", "track_title", "playlists_count", "artist_rank"]]
+
+    stats = pd.DataFrame(
+        [{
+            "tracks": int(dim["track_uri"].nunique()),
+            "playlists": int(n_playlists),
+            "artists": int(dim["artist_name"].nunique()),
+        }]
+    )
+
+    out_dir = gold_dir(data_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = {
+        "gold_track_summary": summary,
+        "gold_artist_top_tracks": artist_top,
+        "gold_artist_neighbors": artist_neighbors,
+        "gold_dataset_stats": stats,
+        "gold_track_neighbors": neighbors,
+    }
+    for name, df in outputs.items():
+        _write_parquet(df, os.path.join(out_dir, f"{name}.parquet"))
+        print(f"{name}: {len(df):,} rows")
+
+    params = {
+        "top_n": int(top_n),
+        "per_artist": int(per_artist),
+        "artist_top_n": int(artist_top_n),
+        "partitions": int(partitions),
+        "workers": workers,
+    }
+    manifest = _manifest("local", {k: int(len(v)) for k, v in outputs.items()}, params)
+    manifest["elapsed_s"] = round(time.perf_counter() - started, 2)
+    tmp = os.path.join(out_dir, MANIFEST_FILENAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_FILENAME))
+    return manifest
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Materialize recommender gold tables.")
+    p.add_argument("--target", choices=["warehouse", "local"], default=None,
+                   help="Defaults to the configured backend (RECOMMENDER_BACKEND).")
+    p.add_argument("--data-dir", default=None, help="Local data directory (local target).")
+    p.add_argument("--top-n", type=int, default=100, help="Neighbors kept per track.")
+    p.add_argument("--per-artist", type=int, default=50, help="Top tracks kept per artist.")
+    p.add_argument("--artist-top-n", type=int, default=50, help="Neighbor artists kept per artist.")
+    p.add_argument("--partitions", type=int, default=None, help="Playlist chunks for the neighbor build (local) or hash partitions (warehouse).")
+    p.add_argument("--workers", type=int, default=None, help="Parallel workers.")
+    args = p.parse_args(argv)
+
+    target = args.target or ("local" if get_backend() == "local" else "warehouse")
+    if target == "local":
+        manifest = materialize_local(
+            data_dir=args.data_dir,
+            top_n=args.top_n,
+            per_artist=args.per_artist,
+            artist_top_n=args.artist_top_n,
+            partitions=args.partitions,
+            workers=args.workers,
+        )
+    else:
+        manifest = materialize_warehouse(
+            top_n=args.top_n,
+            per_artist=args.per_artist,
+            artist_top_n=args.artist_top_n,
+            partitions=args.partitions or 8,
+            workers=args.workers or 4,
+        )
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
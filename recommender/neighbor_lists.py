@@ -0,0 +1,190 @@
+"""Multi-seed co-occurrence top-k by a threshold-algorithm merge of per-seed lists.
+
+The exact scorer counts, for every track, the distinct playlists it shares with
+any seed and then keeps the top k, so its work grows with the seeds' whole
+neighborhoods. Here each seed has a neighbor list (co-occurring tracks sorted
+by playlists shared with that seed, RECOMMENDER_NEIGHBOR_LIST_DEPTH deep,
+default 1000), and a request merges the lists in the style of Fagin's
+threshold algorithm:
+
+- all lists are read in parallel, a block of entries at a time (the block
+  starts at top_k and doubles per round);
+- each newly seen candidate is scored exactly by random access: its posting
+  list checked against the union of the seeds' playlists;
+- a track not seen yet shares at most next_s playlists with seed s (the next
+  unread score of list s), hence at most T = sum(next_s) with the seed set;
+- the merge stops once the k-th best exact score exceeds T.
+
+The result equals the exact scorer's, ties included (score desc, track code
+asc). If truncated lists run out before the top k is final, or random access
+has touched as many entries as the exact scorer would, `threshold_topk`
+returns None and the caller runs the exact scorer. Lists are built from the
+posting store on first use and cached per seed in a byte-bounded LRU
+(RECOMMENDER_NEIGHBOR_LISTS_MB, default 128). RECOMMENDER_TA=0 turns the
+merge off.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from recommender.postings import PostingStore, gather_ranges
+from recommender.seed_cache import PieceCache
+
+
+DEPTH = int(os.environ.get("RECOMMENDER_NEIGHBOR_LIST_DEPTH", "1000"))
+_MIN_BLOCK = 32
+_LONG_POSTINGS_RATIO = 8
+_LONG_CALL_COST = 4000   # per-candidate overhead of the long-postings path, in entries
+
+_lists = PieceCache(int(float(os.environ.get("RECOMMENDER_NEIGHBOR_LISTS_MB", "128")) * 1024 * 1024))
+_stats = {"requests": 0, "early_stops": 0, "exhausted": 0, "fallbacks": 0, "entries_read": 0, "candidates_scored": 0}
+_stats_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.environ.get("RECOMMENDER_TA", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["lists"] = _lists.stats()
+    return out
+
+
+def clear():
+    _lists.clear()
+
+
+def _count(early_stop: bool, entries: int, scored: int, fallback: bool = False):
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["entries_read"] += int(entries)
+        _stats["candidates_scored"] += int(scored)
+        if fallback:
+            _stats["fallbacks"] += 1
+        elif early_stop:
+            _stats["early_stops"] += 1
+        else:
+            _stats["exhausted"] += 1
+
+
+def _build_list(store: PostingStore, code: int) -> tuple:
+    """(neighbor codes, shared counts, [bound past the list]) for one seed, best first."""
+    tracks = gather_ranges(store.playlist_offsets, store.playlist_tracks, np.asarray(store.postings(code)))
+    codes, counts = np.unique(tracks, return_counts=True)
+    keep = codes != code
+    codes, counts = codes[keep], counts[keep]
+    tail = 0
+    if len(codes) > DEPTH:
+        part = np.argpartition(-counts, DEPTH)
+        # Every track left out shares at most this many playlists with the seed.
+        tail = int(counts[part[DEPTH]])
+        codes, counts = codes[part[:DEPTH]], counts[part[:DEPTH]]
+    order = np.lexsort((codes, -counts))
+    return codes[order].astype(np.int32), counts[order].astype(np.int32), np.array([tail], dtype=np.int32)
+
+
+def neighbor_list(store: PostingStore, code: int) -> tuple:
+    key = (store.path, int(code))
+    cached = _lists.get(key)
+    if cached is None:
+        cached = _build_list(store, int(code))
+        _lists.put(key, cached)
+    return cached
+
+
+def _is_long(degrees: np.ndarray, n_seed_playlists: int) -> np.ndarray:
+    return degrees > _LONG_POSTINGS_RATIO * n_seed_playlists
+
+
+def _access_cost(degrees: np.ndarray, n_seed_playlists: int) -> int:
+    """Estimated cost of scoring candidates, in entries the exact scorer would touch."""
+    long = _is_long(degrees, n_seed_playlists)
+    per_long = n_seed_playlists * max(int(np.log2(max(int(degrees.max(initial=1)), 2))), 1) + _LONG_CALL_COST
+    return int(degrees[~long].sum()) + int(np.count_nonzero(long)) * per_long
+
+
+def _exact_scores(store: PostingStore, cand: np.ndarray, degrees: np.ndarray,
+                  seed_mask: np.ndarray, seed_playlists: np.ndarray) -> np.ndarray:
+    """Distinct playlists shared with the seed set, per candidate (random access).
+
+    Posting lists are checked against a boolean mask of the seed playlists;
+    for lists much longer than the seed playlists (popular tracks), the seed
+    playlists are looked up in the posting list instead.
+    """
+    out = np.zeros(len(cand), dtype=np.int64)
+    if len(cand) == 0 or len(seed_playlists) == 0:
+        return out
+    long = _is_long(degrees, len(seed_playlists))
+    for i in np.flatnonzero(long):
+        postings = store.postings(int(cand[i]))
+        pos = np.minimum(np.searchsorted(postings, seed_playlists), len(postings) - 1)
+        out[i] = np.count_nonzero(postings[pos] == seed_playlists)
+    short = np.flatnonzero(~long)
+    if len(short):
+        hits = np.r_[0, np.cumsum(seed_mask[gather_ranges(store.track_offsets, store.track_playlists, cand[short])])]
+        ends = np.cumsum(degrees[short])
+        out[short] = hits[ends] - hits[np.r_[0, ends[:-1]]]
+    return out
+
+
+def _top(codes: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.lexsort((codes, -scores))[:int(top_k)]
+    return codes[order], scores[order]
+
+
+def threshold_topk(store: PostingStore, seed_codes: Sequence[int], top_k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Top-k (track codes, scores) for a seed set, or None when the lists cannot prove it."""
+    seeds = np.unique(np.asarray([c for c in seed_codes if c >= 0], dtype=np.int64))
+    if len(seeds) == 0 or top_k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lists = [neighbor_list(store, int(c)) for c in seeds]
+    if len(lists) == 1:
+        # One seed: its list scores are the exact scores.
+        codes, counts, tail = lists[0]
+        keep = ~np.isin(codes, seeds)
+        if int(tail[0]) == 0 or (np.count_nonzero(keep) >= top_k and int(counts[keep][top_k - 1]) > int(tail[0])):
+            _count(early_stop=True, entries=min(len(codes), int(top_k)), scored=0)
+            return codes[keep][:top_k].astype(np.int64), counts[keep][:top_k].astype(np.int64)
+        _count(early_stop=False, entries=len(codes), scored=0, fallback=True)
+        return None
+    seed_mask = np.zeros(store.n_playlists, dtype=bool)
+    seed_mask[gather_ranges(store.track_offsets, store.track_playlists, seeds)] = True
+    seed_playlists = np.flatnonzero(seed_mask)
+    longest = max(len(codes) for codes, _, _ in lists)
+    # What the exact scorer would touch; the merge hands over before exceeding it.
+    budget = 2 * store.n_tracks + int(np.sum(
+        np.asarray(store.playlist_offsets[seed_playlists + 1]) - np.asarray(store.playlist_offsets[seed_playlists])
+    ))
+    work = 0
+
+    seen = np.zeros(0, dtype=np.int64)
+    scores = np.zeros(0, dtype=np.int64)
+    depth, block = 0, max(int(top_k), _MIN_BLOCK)
+    while True:
+        nxt = depth + block
+        fresh = np.unique(np.concatenate([codes[depth:nxt] for codes, _, _ in lists]).astype(np.int64))
+        fresh = fresh[~np.isin(fresh, seeds) & ~np.isin(fresh, seen)]
+        degrees = store.degrees(fresh)
+        work += _access_cost(degrees, len(seed_playlists))
+        if work > budget:
+            _count(early_stop=False, entries=sum(min(depth, len(codes)) for codes, _, _ in lists),
+                   scored=len(seen), fallback=True)
+            return None
+        seen = np.concatenate([seen, fresh])
+        scores = np.concatenate([scores, _exact_scores(store, fresh, degrees, seed_mask, seed_playlists)])
+        depth = nxt
+        # Upper bound on the score of any track no list has shown yet.
+        threshold = sum(int(counts[depth]) if depth < len(counts) else int(tail[0]) for _, counts, tail in lists)
+        idx, vals = _top(seen, scores, top_k)
+        done = threshold == 0 or (len(idx) >= top_k and int(vals[-1]) > threshold)
+        if done or depth >= longest:
+            _count(early_stop=done and depth < longest, entries=sum(min(depth, len(codes)) for codes, _, _ in lists),
+                   scored=len(seen), fallback=not done)
+            return (idx, vals) if done else None
+        block *= 2
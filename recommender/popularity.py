@@ -0,0 +1,125 @@
+"""Resident per-track popularity, indexed by track code.
+
+Per-track playlist counts only change on data loads, so they are fetched once
+per process into an int32 array indexed by the process-wide track codes
+(recommender/encoding.py), together with a 1001-point quantile table. Lookups
+and percentiles for any set of tracks are then NumPy indexing, with no backend
+calls.
+
+Sources, in order: the posting store (no query at all), the gold track
+summary, then one aggregation over the fact table.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from db import execute_sql, iter_sql_chunks
+from queries import track_popularity_all_sql
+from recommender.encoding import TRACKS
+from recommender.postings import get_posting_store
+
+
+QUANTILE_POINTS = 1001   # percentile resolution 0.1%
+_ABSENT = -1             # code known to the dictionary but not in any playlist
+
+
+class PopularityTable:
+    def __init__(self, popularity: np.ndarray, source: str):
+        self.popularity = popularity
+        self.source = source
+        played = popularity[popularity > 0]
+        self.n_tracks = int(played.size)
+        self.quantiles = (
+            np.quantile(played, np.linspace(0.0, 1.0, QUANTILE_POINTS)) if played.size else np.zeros(QUANTILE_POINTS)
+        )
+
+    def lookup(self, codes) -> np.ndarray:
+        """Playlist count per track code; -1 for tracks not in any playlist."""
+        codes = np.asarray(codes, dtype=np.int64)
+        out = np.full(codes.shape, _ABSENT, dtype=np.int32)
+        ok = (codes >= 0) & (codes < len(self.popularity))
+        out[ok] = self.popularity[codes[ok]]
+        out[out == 0] = _ABSENT
+        return out
+
+    def percentiles(self, values) -> np.ndarray:
+        """Share of played tracks (0..100) with popularity at or below each value, from the quantile table."""
+        values = np.asarray(values, dtype=np.float64)
+        rank = np.searchsorted(self.quantiles, values, side="right") - 1
+        return np.clip(rank, 0, QUANTILE_POINTS - 1) * (100.0 / (QUANTILE_POINTS - 1))
+
+    def quantile(self, q: float) -> float:
+        return float(np.interp(q, np.linspace(0.0, 1.0, QUANTILE_POINTS), self.quantiles))
+
+
+def _from_frame(df: pd.DataFrame, source: str) -> PopularityTable:
+    codes = TRACKS.encode(df["track_uri"])
+    pop = np.zeros(len(TRACKS), dtype=np.int32)
+    pop[codes] = df["popularity"].to_numpy(dtype=np.int32)
+    return PopularityTable(pop, source)
+
+
+def _build() -> PopularityTable:
+    store = get_posting_store()
+    if store is not None:
+        all_codes = np.arange(store.n_tracks)
+        df = pd.DataFrame({"track_uri": store.decode_tracks(all_codes), "popularity": store.degrees(all_codes)})
+        return _from_frame(df, "posting_store")
+    for table in ("gold_track_summary", "default.gold_track_summary"):
+        try:
+            df = execute_sql(track_popularity_all_sql(table))
+        except Exception:
+            continue
+        if not df.empty:
+            return _from_frame(df, "gold")
+    chunks = list(iter_sql_chunks(track_popularity_all_sql()))
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=["track_uri", "popularity"])
+    return _from_frame(df, "fact_scan")
+
+
+_table: Optional[PopularityTable] = None
+_lock = threading.Lock()
+
+
+def get_table(refresh: bool = False) -> PopularityTable:
+    """The resident table, built on first use (warm-up does this at start)."""
+    global _table
+    with _lock:
+        if refresh or _table is None:
+            _table = _build()
+        return _table
+
+
+def loaded() -> bool:
+    return _table is not None
+
+
+def popularity_for_uris(track_uris: Iterable) -> pd.DataFrame:
+    """(track_uri, popularity) for tracks in at least one playlist, like track_popularity_for_uris_sql."""
+    uris = list(dict.fromkeys(str(u) for u in (track_uris or [])))
+    if not uris:
+        return pd.DataFrame({"track_uri": pd.Series([], dtype=object), "popularity": pd.Series([], dtype=np.int64)})
+    pop = get_table().lookup(TRACKS.lookup(uris))
+    found = pop >= 0
+    return pd.DataFrame({"track_uri": np.asarray(uris, dtype=object)[found], "popularity": pop[found].astype(np.int64)})
+
+
+def popularity_summary(track_uris: Iterable) -> dict:
+    """Mean popularity and popularity percentiles of the tracks of a set that are in any playlist."""
+    table = get_table()
+    uris = list(dict.fromkeys(str(u) for u in (track_uris or [])))
+    pop = table.lookup(TRACKS.lookup(uris)) if uris else np.zeros(0, dtype=np.int32)
+    pop = pop[pop >= 0]
+    if pop.size == 0:
+        return {"n": 0, "mean": 0.0, "median_percentile": None, "mean_percentile": None}
+    pct = table.percentiles(pop)
+    return {
+        "n": int(pop.size),
+        "mean": float(pop.mean()),
+        "median_percentile": float(np.median(pct)),
+        "mean_percentile": float(pct.mean()),
+    }
@@ -0,0 +1,444 @@
+"""Per-track posting lists: sorted playlist-ID arrays and their intersections.
+
+Build the on-disk store with:
+    python -m recommender.postings
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Upper bound on (seed, candidate) pairs expanded at once in intersection_counts.
+_CHUNK_PAIRS = 4_000_000
+
+# Use a direct code -> position table when playlist codes stay below this bound.
+_DENSE_LOOKUP_MAX = 16_000_000
+
+
+def postings_from_frame(df: pd.DataFrame, track_col: str = "track_uri", playlist_col: str = "playlist_id") -> Dict[str, np.ndarray]:
+    """Group (track, playlist) rows into {track: sorted unique int32 playlist codes}.
+
+    Playlist IDs are dictionary-encoded per call, so codes are only comparable
+    between postings built from the same frame.
+    """
+    if df is None or df.empty:
+        return {}
+    codes, _ = pd.factorize(df[playlist_col].astype(str))
+    tracks = df[track_col].astype(str).to_numpy()
+    order = np.lexsort((codes, tracks))
+    tracks = tracks[order]
+    codes = codes[order].astype(np.int32)
+
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (tracks[1:] != tracks[:-1]) | (codes[1:] != codes[:-1])
+    tracks, codes = tracks[keep], codes[keep]
+
+    starts = np.flatnonzero(np.r_[True, tracks[1:] != tracks[:-1]])
+    ends = np.r_[starts[1:], len(tracks)]
+    return {tracks[s]: codes[s:e] for s, e in zip(starts, ends)}
+
+
+def intersection_counts(seed_postings: Sequence[np.ndarray], cand_postings: Sequence[np.ndarray]) -> np.ndarray:
+    """|P_seed ∩ P_cand| for every seed/candidate pair, as an int32 matrix.
+
+    Candidate postings are inverted into a playlist -> candidates CSR over the
+    union U of their playlists. Each seed's postings are located in U with a
+    dense lookup table (or `searchsorted` for sparse codes); every hit expands to the candidates of that playlist, and the
+    (seed, candidate) pairs are counted with `bincount`. Cost is
+    O(sum |P_seed| + matched pairs), with no per-pair Python loop.
+    """
+    n_s, n_c = len(seed_postings), len(cand_postings)
+    out = np.zeros((n_s, n_c), dtype=np.int32)
+    if n_s == 0 or n_c == 0:
+        return out
+
+    cand_lens = np.fromiter((len(p) for p in cand_postings), dtype=np.int64, count=n_c)
+    seed_lens = np.fromiter((len(p) for p in seed_postings), dtype=np.int64, count=n_s)
+    if cand_lens.sum() == 0 or seed_lens.sum() == 0:
+        return out
+
+    cand_all = np.concatenate([np.asarray(p, dtype=np.int32) for p in cand_postings])
+    cand_ids = np.repeat(np.arange(n_c, dtype=np.int64), cand_lens)
+    order = np.argsort(cand_all, kind="stable")
+    cand_all, cand_ids = cand_all[order], cand_ids[order]
+    universe, u_start, u_len = np.unique(cand_all, return_index=True, return_counts=True)
+
+    seed_all = np.concatenate([np.asarray(p, dtype=np.int32) for p in seed_postings])
+    seed_ids = np.repeat(np.arange(n_s, dtype=np.int64), seed_lens)
+    max_code = int(max(universe[-1], seed_all.max()))
+    if max_code < _DENSE_LOOKUP_MAX:
+        # Playlist codes are dense, so a direct lookup table beats binary search.
+        lut = np.full(max_code + 1, -1, dtype=np.int64)
+        lut[universe] = np.arange(len(universe))
+        pos = lut[seed_all]
+        hit = pos >= 0
+    else:
+        pos = np.minimum(np.searchsorted(universe, seed_all), len(universe) - 1)
+        hit = universe[pos] == seed_all
+    seed_ids, pos = seed_ids[hit], pos[hit]
+    if len(pos) == 0:
+        return out
+
+    counts = np.zeros(n_s * n_c, dtype=np.int64)
+    lens = u_len[pos]
+    cum = np.cumsum(lens)
+    # Expand hits in chunks so the (seed, candidate) pair buffer stays bounded.
+    lo = 0
+    while lo < len(pos):
+        base = cum[lo - 1] if lo else 0
+        hi = max(int(np.searchsorted(cum, base + _CHUNK_PAIRS, side="right")), lo + 1)
+        ln = lens[lo:hi]
+        total = int(ln.sum())
+        within = np.arange(total) - np.repeat(np.cumsum(ln) - ln, ln)
+        cands = cand_ids[np.repeat(u_start[pos[lo:hi]], ln) + within]
+        counts += np.bincount(np.repeat(seed_ids[lo:hi], ln) * n_c + cands, minlength=n_s * n_c)
+        lo = hi
+    out[:] = counts.reshape(n_s, n_c)
+    return out
+
+
+def intersection_frame(
+    seed_keys: List[str],
+    cand_keys: List[str],
+    postings: Dict[str, np.ndarray],
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Long-format non-zero pairs plus the dense matrix for the given keys."""
+    empty = np.zeros(0, dtype=np.int32)
+    mat = intersection_counts(
+        [postings.get(k, empty) for k in seed_keys],
+        [postings.get(k, empty) for k in cand_keys],
+    )
+    si, ci = np.nonzero(mat)
+    df = pd.DataFrame(
+        {
+            "seed_track_uri": np.asarray(seed_keys, dtype=object)[si],
+            "candidate_track_uri": np.asarray(cand_keys, dtype=object)[ci],
+            "shared_playlists": mat[si, ci].astype(np.int64),
+        }
+    )
+    return df, mat
+
+
+# --- On-disk, memory-mapped posting store ---
+#
+# A store directory holds one subdirectory per build and a CURRENT file naming
+# the live one. A rebuild writes a new build directory and then replaces
+# CURRENT atomically, so readers see either the old or the new build, never a
+# missing or half-written one. Processes notice the change on their next
+# lookup (one stat of CURRENT). Stores from before this layout (the arrays
+# directly in the store directory) are still opened.
+#
+# Layout of a build directory (all arrays are .npy, opened with mmap_mode='r'):
+#   track_uris.npy        sorted fixed-width bytes; track code = row index
+#   playlist_ids.npy      sorted fixed-width bytes; playlist code = row index
+#   track_offsets.npy     int64 [n_tracks + 1]
+#   track_playlists.npy   int32 sorted playlist codes per track (CSR values)
+#   playlist_offsets.npy  int64 [n_playlists + 1]
+#   playlist_tracks.npy   int32 sorted track codes per playlist (CSR values)
+#   meta.json             format version, counts, build time
+#
+# Sorted dictionaries make URI -> code a binary search on the mapped array, so
+# opening a store reads no data up front and worker processes share page cache.
+
+POSTINGS_FORMAT_VERSION = 1
+
+_ARRAYS = (
+    "track_uris",
+    "playlist_ids",
+    "track_offsets",
+    "track_playlists",
+    "playlist_offsets",
+    "playlist_tracks",
+)
+
+
+def top_counts(counts: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and values of the top-k positive counts, highest first (ties by index)."""
+    k = min(int(top_k), int(np.count_nonzero(counts)))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=counts.dtype)
+    kth = counts[np.argpartition(-counts, k - 1)[k - 1]]
+    # Tracks tied at the cut are taken by index too, so the result is canonical.
+    above = np.flatnonzero(counts > kth)
+    idx = np.concatenate([above, np.flatnonzero(counts == kth)[:k - len(above)]])
+    idx = idx[np.lexsort((idx, -counts[idx]))]
+    return idx, counts[idx]
+
+
+def gather_ranges(offsets: np.ndarray, values: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """Concatenate CSR rows `idx` without a Python loop."""
+    idx = np.asarray(idx, dtype=np.int64)
+    if len(idx) == 0:
+        return np.zeros(0, dtype=values.dtype)
+    starts = np.asarray(offsets[idx], dtype=np.int64)
+    lens = np.asarray(offsets[idx + 1], dtype=np.int64) - starts
+    total = int(lens.sum())
+    if total == 0:
+        return np.zeros(0, dtype=values.dtype)
+    flat = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(total)
+    return np.asarray(values[flat])
+
+
+def _lookup_sorted(dictionary: np.ndarray, keys: Sequence[str]) -> np.ndarray:
+    """Codes of `keys` in a sorted fixed-width bytes array; -1 when absent."""
+    if len(keys) == 0 or len(dictionary) == 0:
+        return np.full(len(keys), -1, dtype=np.int32)
+    width = dictionary.dtype.itemsize
+    enc = [str(k).encode("utf-8") for k in keys]
+    too_long = np.fromiter((len(b) > width for b in enc), dtype=bool, count=len(enc))
+    probe = np.array(enc, dtype=f"S{width}")
+    pos = np.minimum(np.searchsorted(dictionary, probe), len(dictionary) - 1)
+    found = (dictionary[pos] == probe) & ~too_long
+    return np.where(found, pos, -1).astype(np.int32)
+
+
+class PostingStore:
+    """Read-only view over a posting store directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        if int(self.meta.get("format_version", 0)) != POSTINGS_FORMAT_VERSION:
+            raise ValueError(f"Unsupported posting store format in {path}: {self.meta.get('format_version')}")
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    @property
+    def n_tracks(self) -> int:
+        return len(self.track_uris)
+
+    @property
+    def n_playlists(self) -> int:
+        return len(self.playlist_ids)
+
+    def track_codes(self, track_uris: Sequence[str]) -> np.ndarray:
+        return _lookup_sorted(self.track_uris, track_uris)
+
+    def playlist_codes(self, playlist_ids: Sequence[str]) -> np.ndarray:
+        return _lookup_sorted(self.playlist_ids, playlist_ids)
+
+    def decode_tracks(self, codes: Sequence[int]) -> List[str]:
+        return [b.decode("utf-8") for b in self.track_uris[np.asarray(codes, dtype=np.int64)]]
+
+    def postings(self, code: int) -> np.ndarray:
+        """Sorted playlist codes containing track `code` (a view into the map)."""
+        return self.track_playlists[self.track_offsets[code]:self.track_offsets[code + 1]]
+
+    def playlist_tracks_of(self, code: int) -> np.ndarray:
+        return self.playlist_tracks[self.playlist_offsets[code]:self.playlist_offsets[code + 1]]
+
+    def postings_for_uris(self, track_uris: Sequence[str]) -> Dict[str, np.ndarray]:
+        """{uri: sorted playlist codes}; unknown URIs are omitted."""
+        codes = self.track_codes(track_uris)
+        return {str(u): self.postings(int(c)) for u, c in zip(track_uris, codes) if c >= 0}
+
+    def degrees(self, codes: Sequence[int]) -> np.ndarray:
+        """Number of playlists containing each track code (0 for -1)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        out = np.zeros(len(codes), dtype=np.int64)
+        ok = codes >= 0
+        out[ok] = np.asarray(self.track_offsets[codes[ok] + 1]) - np.asarray(self.track_offsets[codes[ok]])
+        return out
+
+    def cooccurrence_counts(self, seed_codes: Sequence[int]) -> np.ndarray:
+        """Distinct playlists shared with any seed, per track code (seeds zeroed)."""
+        seed_codes = np.asarray([c for c in seed_codes if c >= 0], dtype=np.int64)
+        counts = np.zeros(self.n_tracks, dtype=np.int64)
+        if len(seed_codes) == 0:
+            return counts
+        pls = np.unique(gather_ranges(self.track_offsets, self.track_playlists, seed_codes))
+        tracks = gather_ranges(self.playlist_offsets, self.playlist_tracks, pls)
+        counts += np.bincount(tracks, minlength=self.n_tracks)
+        counts[seed_codes] = 0
+        return counts
+
+    def sampled_cooccurrence_counts(self, seed_codes: Sequence[int], max_playlists: int) -> Tuple[np.ndarray, int]:
+        """Estimated `cooccurrence_counts` from at most `max_playlists` seed playlists.
+
+        The playlists are a uniform sample (the same one for the same seed set)
+        and the counts are scaled back up to the full set. Also returns how many
+        playlists were read.
+        """
+        seed_codes = np.asarray([c for c in seed_codes if c >= 0], dtype=np.int64)
+        pls = np.unique(gather_ranges(self.track_offsets, self.track_playlists, seed_codes))
+        n = max(int(max_playlists), 1)
+        if len(pls) <= n:
+            return self.cooccurrence_counts(seed_codes), len(pls)
+        rng = np.random.default_rng(int(seed_codes.sum()) + len(seed_codes))
+        sample = np.sort(rng.choice(pls, n, replace=False))
+        counts = np.bincount(gather_ranges(self.playlist_offsets, self.playlist_tracks, sample), minlength=self.n_tracks)
+        counts = np.rint(counts * (len(pls) / n)).astype(np.int64)
+        counts[seed_codes] = 0
+        return counts, n
+
+
+def default_postings_dir() -> str:
+    from db import _get_credential, local_data_dir
+
+    return _get_credential("RECOMMENDER_POSTINGS_DIR") or os.path.join(local_data_dir(), "postings")
+
+
+_CURRENT = "CURRENT"
+_KEEP_BUILDS = 2   # the live build and the one before it (still mapped by slow readers)
+
+# path -> (signature of CURRENT / meta.json, opened store)
+_store_cache: Dict[str, Tuple[tuple, PostingStore]] = {}
+_store_lock = threading.Lock()
+
+
+def _signature(path: str) -> Optional[tuple]:
+    """Identity of the live build: changes whenever CURRENT (or a legacy meta.json) is replaced."""
+    for name in (_CURRENT, "meta.json"):
+        try:
+            st = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        return (name, st.st_ino, st.st_mtime_ns, st.st_size)
+    return None
+
+
+def _live_build(path: str) -> Optional[str]:
+    """Directory holding the live build's arrays, or None if no store is built."""
+    try:
+        with open(os.path.join(path, _CURRENT), "r", encoding="utf-8") as fh:
+            return os.path.join(path, fh.read().strip())
+    except OSError:
+        pass
+    return path if os.path.exists(os.path.join(path, "meta.json")) else None
+
+
+def store_exists(path: Optional[str] = None) -> bool:
+    return _signature(os.path.abspath(path or default_postings_dir())) is not None
+
+
+def get_posting_store(path: Optional[str] = None) -> Optional[PostingStore]:
+    """Process-wide store for `path` (default location), or None if not built.
+
+    The opened store is kept until the store directory points at a new build;
+    a missing store is looked up again on the next call. If the new build
+    cannot be opened (replaced again mid-open), the previous one keeps serving.
+    """
+    path = os.path.abspath(path or default_postings_dir())
+    sig = _signature(path)
+    if sig is None:
+        return None
+    with _store_lock:
+        cached = _store_cache.get(path)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        for _ in range(3):
+            build = _live_build(path)
+            try:
+                store = PostingStore(build) if build else None
+            except Exception:
+                store = None
+            if store is not None:
+                _store_cache[path] = (sig, store)
+                return store
+            sig = _signature(path)
+            if sig is None:
+                break
+        return cached[1] if cached is not None else None
+
+
+def build_posting_store(out_dir: Optional[str] = None, df: Optional[pd.DataFrame] = None) -> dict:
+    """Build a posting store from fact_playlist_track (or a given membership frame).
+
+    Arrays are written to a new build directory and CURRENT is then replaced
+    atomically, so readers never observe a missing or half-written store.
+    """
+    from db import execute_sql
+
+    out_dir = os.path.abspath(out_dir or default_postings_dir())
+    if df is None:
+        df = execute_sql("SELECT DISTINCT track_uri, playlist_id FROM default.fact_playlist_track")
+
+    track_keys = df["track_uri"].astype(str).to_numpy()
+    playlist_keys = df["playlist_id"].astype(str).to_numpy()
+    t_codes, t_uniques = pd.factorize(track_keys, sort=True)
+    p_codes, p_uniques = pd.factorize(playlist_keys, sort=True)
+    t_codes = t_codes.astype(np.int32)
+    p_codes = p_codes.astype(np.int32)
+
+    # Dedup (track, playlist) pairs, then lay out CSR in both directions.
+    pair = np.unique(t_codes.astype(np.int64) * len(p_uniques) + p_codes)
+    t_codes = (pair // len(p_uniques)).astype(np.int32)
+    p_codes = (pair % len(p_uniques)).astype(np.int32)
+    track_offsets = np.zeros(len(t_uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(t_codes, minlength=len(t_uniques)), out=track_offsets[1:])
+    by_playlist = np.lexsort((t_codes, p_codes))
+    playlist_offsets = np.zeros(len(p_uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(p_codes, minlength=len(p_uniques)), out=playlist_offsets[1:])
+
+    arrays = {
+        "track_uris": np.array([u.encode("utf-8") for u in t_uniques], dtype="S"),
+        "playlist_ids": np.array([p.encode("utf-8") for p in p_uniques], dtype="S"),
+        "track_offsets": track_offsets,
+        "track_playlists": p_codes,
+        "playlist_offsets": playlist_offsets,
+        "playlist_tracks": t_codes[by_playlist],
+    }
+    # UTF-8 byte order equals code point order, so the dictionaries stay sorted.
+    meta = {
+        "format_version": POSTINGS_FORMAT_VERSION,
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "n_tracks": int(len(t_uniques)),
+        "n_playlists": int(len(p_uniques)),
+        "n_pairs": int(len(pair)),
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".build-", dir=out_dir)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), arr)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+    build_id = "build-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f") + "-" + os.path.basename(tmp)[-6:]
+    os.replace(tmp, os.path.join(out_dir, build_id))
+    pointer = os.path.join(out_dir, f".{_CURRENT}.{os.getpid()}.tmp")
+    with open(pointer, "w", encoding="utf-8") as fh:
+        fh.write(build_id)
+    os.replace(pointer, os.path.join(out_dir, _CURRENT))
+    meta["build_id"] = build_id
+    _remove_old_builds(out_dir, build_id)
+    return meta
+
+
+def _remove_old_builds(out_dir: str, live: str):
+    """Keep the newest _KEEP_BUILDS builds; drop a legacy flat store once CURRENT exists."""
+    builds = sorted((n for n in os.listdir(out_dir) if n.startswith("build-") and n != live), reverse=True)
+    for name in builds[_KEEP_BUILDS - 1:]:
+        # Processes still mapping an old build keep their pages (POSIX); on Windows
+        # the files stay until they are unmapped and are retried on the next build.
+        shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+    for name in _ARRAYS:
+        try:
+            os.remove(os.path.join(out_dir, f"{name}.npy"))
+        except OSError:
+            pass
+    try:
+        os.remove(os.path.join(out_dir, "meta.json"))
+    except OSError:
+        pass
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Build the memory-mapped per-track posting store.")
+    p.add_argument("--out", default=None, help="Output directory (default: <data dir>/postings).")
+    args = p.parse_args(argv)
+    print(json.dumps(build_posting_store(args.out), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""Opt-in profiling of Streamlit page runs and recommender.logic calls.
+
+Switch it on with RECOMMENDER_PROFILE=1 (every session) or `?profile=1` in the
+page URL (that session). Each page run is then sampled, and the public
+functions of recommender.logic record a timed span per call:
+
+- a sampler thread reads the script thread's stack every
+  RECOMMENDER_PROFILE_INTERVAL_MS (default 5) with sys._current_frames(), so
+  time spent waiting on the warehouse shows up next to Python time; samples
+  inside db's execution and wait functions are counted as "backend";
+- the run ends when the page script leaves the stack (including st.stop() and
+  errors), and the profile is saved as JSON with its run metadata under
+  RECOMMENDER_PROFILE_DIR (default `<data dir>/profiles`); only the newest
+  RECOMMENDER_PROFILE_MAX (default 200) are kept.
+
+Saved profiles export to speedscope (https://www.speedscope.app) or collapsed
+stacks (flamegraph.pl, inferno):
+
+    python -m recommender.profiling list
+    python -m recommender.profiling prune --keep 50
+    python -m recommender.profiling export <profile.json> --format speedscope -o out.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextvars
+import functools
+import glob
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+
+# db functions whose samples are "waiting on the backend" rather than Python work.
+_BACKEND_FRAMES = {
+    "_execute_sql", "_execute_local", "iter_sql_chunks", "wait_or_raise",
+    "_single_flight", "_cross_process_flight", "databricks_preflight",
+}
+_MAX_RUN_S = 300
+_RECENT = 50
+
+_active: contextvars.ContextVar = contextvars.ContextVar("recommender_profile", default=None)
+_recent: "deque[dict]" = deque(maxlen=_RECENT)
+_recent_lock = threading.Lock()
+_instrumented = set()
+
+
+def enabled(query_params=None) -> bool:
+    env = (os.environ.get("RECOMMENDER_PROFILE") or "").strip().lower()
+    if env in ("1", "true", "yes", "on"):
+        return True
+    if query_params is not None:
+        v = query_params.get("profile")
+        return str(v).lower() in ("1", "true", "yes", "on")
+    return False
+
+
+def profile_dir() -> str:
+    from db import _get_credential, local_data_dir
+
+    return _get_credential("RECOMMENDER_PROFILE_DIR") or os.path.join(local_data_dir(), "profiles")
+
+
+def _max_profiles() -> int:
+    try:
+        return max(int(os.environ.get("RECOMMENDER_PROFILE_MAX", "200")), 1)
+    except ValueError:
+        return 200
+
+
+def _interval_s() -> float:
+    try:
+        return max(float(os.environ.get("RECOMMENDER_PROFILE_INTERVAL_MS", "5")), 0.5) / 1000.0
+    except ValueError:
+        return 0.005
+
+
+def _label(code) -> str:
+    path = code.co_filename
+    parts = path.replace("\\", "/").split("/")
+    short = "/".join(parts[-2:]) if len(parts) > 1 else path
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+class Run:
+    """One profiled page run: stack samples from a sampler thread plus logic-call spans."""
+
+    def __init__(self, name: str, anchor_file: str, meta: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.anchor_file = os.path.abspath(anchor_file)
+        self.meta = dict(meta or {})
+        self.interval_s = _interval_s()
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self.duration_s = 0.0
+        self.stacks: Counter = Counter()
+        self.backend_samples = 0
+        self.spans: List[dict] = []
+        self.done = False
+        self._spans_lock = threading.Lock()
+        self._thread_id = threading.get_ident()
+
+    def add_span(self, name: str, started: float, seconds: float, error: Optional[str] = None):
+        span = {
+            "name": name,
+            "start_s": round(started - self._t0, 6),
+            "seconds": round(seconds, 6),
+            "thread": threading.current_thread().name,
+        }
+        if error:
+            span["error"] = error
+        with self._spans_lock:
+            self.spans.append(span)
+
+    def _sample(self) -> bool:
+        """Record one sample; False once the script has left the page file."""
+        frame = sys._current_frames().get(self._thread_id)
+        stack, in_page = [], False
+        while frame is not None:
+            code = frame.f_code
+            if os.path.abspath(code.co_filename) == self.anchor_file:
+                in_page = True
+                stack.append(code)
+                break
+            stack.append(code)
+            frame = frame.f_back
+        if not in_page:
+            return False
+        stack.reverse()
+        self.stacks[tuple(_label(c) for c in stack)] += 1
+        if any(c.co_name in _BACKEND_FRAMES and c.co_filename.endswith("db.py") for c in stack):
+            self.backend_samples += 1
+        return True
+
+    def _loop(self):
+        seen = False
+        while time.perf_counter() - self._t0 < _MAX_RUN_S:
+            if self._sample():
+                seen = True
+            elif seen or time.perf_counter() - self._t0 > 1.0:
+                break
+            time.sleep(self.interval_s)
+        self.finish()
+
+    def start(self):
+        _active.set(self)
+        threading.Thread(target=self._loop, name=f"recommender-profiler-{self.id[:6]}", daemon=True).start()
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        self.duration_s = time.perf_counter() - self._t0
+        record = self.to_dict()
+        with _recent_lock:
+            _recent.append(record)
+        try:
+            save(record)
+        except OSError:
+            pass
+
+    def to_dict(self) -> dict:
+        with self._spans_lock:
+            spans = list(self.spans)
+        total = sum(self.stacks.values())
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_s": round(self.duration_s, 4),
+            "interval_ms": round(self.interval_s * 1000, 3),
+            "samples": total,
+            "backend_samples": self.backend_samples,
+            "meta": self.meta,
+            "stacks": [list(s) + [n] for s, n in self.stacks.most_common()],
+            "spans": spans,
+        }
+
+
+def start_page(name: str, anchor_file: str, meta: Optional[dict] = None) -> Run:
+    """Profile the current script run of `anchor_file` until it leaves the stack."""
+    from db import get_backend
+
+    meta = {"backend": get_backend(), "pid": os.getpid(), **(meta or {})}
+    run = Run(name, anchor_file, meta)
+    run.start()
+    return run
+
+
+def _record_call(fn):
+    name = f"{fn.__module__}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = _active.get()
+        if run is None or run.done:
+            return fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            run.add_span(name, started, time.perf_counter() - started, type(e).__name__)
+            raise
+        run.add_span(name, started, time.perf_counter() - started)
+        return result
+
+    wrapper._recommender_profiled = True
+    return wrapper
+
+
+def instrument(module):
+    """Wrap the module's public functions so calls made during a profiled run record spans."""
+    if module.__name__ in _instrumented:
+        return
+    for attr, obj in list(vars(module).items()):
+        if attr.startswith("_") or not inspect.isfunction(obj) or obj.__module__ != module.__name__:
+            continue
+        if not getattr(obj, "_recommender_profiled", False):
+            setattr(module, attr, _record_call(obj))
+    _instrumented.add(module.__name__)
+
+
+# --- Persistence and export ---
+
+def save(record: dict) -> str:
+    out_dir = profile_dir()
+    os.makedirs(out_dir, exist_ok=True)
+    slug = "".join(ch if ch.isalnum() else "_" for ch in record["name"]).strip("_")[:40] or "run"
+    stamp = record["started_at"].replace(":", "").replace("-", "")[:15]
+    path = os.path.join(out_dir, f"{stamp}_{slug}_{record['id'][:6]}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(record, fh)
+    os.replace(path + ".tmp", path)
+    prune()
+    return path
+
+
+def prune(keep: Optional[int] = None) -> int:
+    """Delete all but the `keep` most recently saved profiles; returns how many were removed."""
+    keep = _max_profiles() if keep is None else int(keep)
+    paths = glob.glob(os.path.join(profile_dir(), "*.json"))
+    if len(paths) <= keep:
+        return 0
+    # File names start with the run's start time, which breaks mtime ties.
+    paths.sort(key=lambda p: (os.path.getmtime(p), os.path.basename(p)), reverse=True)
+    removed = 0
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def recent(name: Optional[str] = None) -> List[dict]:
+    """Completed runs in this process, newest first (optionally for one page)."""
+    with _recent_lock:
+        runs = list(_recent)
+    return [r for r in reversed(runs) if name is None or r["name"] == name]
+
+
+def to_collapsed(record: dict) -> str:
+    """Collapsed stacks (`frame;frame;frame count`), one line per distinct stack."""
+    return "\n".join(";".join(s[:-1]) + f" {s[-1]}" for s in record["stacks"]) + "\n"
+
+
+def to_speedscope(record: dict) -> dict:
+    frames: Dict[str, int] = {}
+    samples, weights = [], []
+    for s in record["stacks"]:
+        samples.append([frames.setdefault(f, len(frames)) for f in s[:-1]])
+        weights.append(s[-1] * record["interval_ms"])
+    shared = []
+    for label in frames:
+        name, _, loc = label.rpartition(" (")
+        file, _, line = loc.rstrip(")").rpartition(":")
+        shared.append({"name": name, "file": file, "line": int(line) if line.isdigit() else None})
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{record['name']} {record['started_at']}",
+        "exporter": "recommender.profiling",
+        "activeProfileIndex": 0,
+        "shared": {"frames": shared},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": record["name"],
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+    }
+
+
+def hotspots(record: dict, n: int = 15) -> pd.DataFrame:
+    """Top-N functions by self samples, with inclusive share and time."""
+    import pandas as pd
+
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    for s in record["stacks"]:
+        frames, count = s[:-1], s[-1]
+        self_counts[frames[-1]] += count
+        for f in set(frames):
+            total_counts[f] += count
+    total = max(record["samples"], 1)
+    ms = record["interval_ms"]
+    rows = [
+        {
+            "function": f,
+            "self_pct": round(100.0 * c / total, 1),
+            "total_pct": round(100.0 * total_counts[f] / total, 1),
+            "self_ms": round(c * ms, 1),
+            "total_ms": round(total_counts[f] * ms, 1),
+        }
+        for f, c in self_counts.most_common(n)
+    ]
+    return pd.DataFrame(rows, columns=["function", "self_pct", "total_pct", "self_ms", "total_ms"])
+
+
+def span_summary(record: dict) -> pd.DataFrame:
+    """recommender.logic calls aggregated by function."""
+    import pandas as pd
+
+    if not record["spans"]:
+        return pd.DataFrame(columns=["call", "calls", "total_ms", "max_ms"])
+    df = pd.DataFrame(record["spans"])
+    out = df.groupby("name")["seconds"].agg(calls="count", total_ms="sum", max_ms="max").reset_index()
+    out[["total_ms", "max_ms"]] = (out[["total_ms", "max_ms"]] * 1000).round(1)
+    return out.rename(columns={"name": "call"}).sort_values("total_ms", ascending=False, ignore_index=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="List or export saved page profiles.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="List saved profiles.")
+    pr = sub.add_parser("prune", help="Keep only the most recent profiles.")
+    pr.add_argument("--keep", type=int, default=None, help="Profiles to keep (default: RECOMMENDER_PROFILE_MAX).")
+    ex = sub.add_parser("export", help="Export a saved profile.")
+    ex.add_argument("path")
+    ex.add_argument("--format", choices=["speedscope", "collapsed"], default="speedscope")
+    ex.add_argument("-o", "--output", default=None, help="Output file (default: stdout).")
+    args = p.parse_args(argv)
+
+    if args.cmd == "list":
+        for path in sorted(glob.glob(os.path.join(profile_dir(), "*.json"))):
+            r = load(path)
+            backend_pct = 100.0 * r["backend_samples"] / max(r["samples"], 1)
+            print(f"{path}\t{r['name']}\t{r['duration_s']:.2f}s\tbackend {backend_pct:.0f}%")
+        return
+    if args.cmd == "prune":
+        print(f"Removed {prune(args.keep)} profile(s) from {profile_dir()}")
+        return
+
+    record = load(args.path)
+    text = json.dumps(to_speedscope(record)) if args.format == "speedscope" else to_collapsed(record)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
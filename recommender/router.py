@@ -0,0 +1,368 @@
+"""Cost-based routing of co-occurrence requests between engines.
+
+Before a co-occurrence request runs, its fan-out is estimated: the playlists
+containing each seed, summed over the seeds, read from the resident per-track
+popularity (recommender/popularity.py) or the posting store's degrees, so the
+estimate costs no query. The router then picks an engine:
+
+- `local`: the in-process posting store (threshold merge or exact count);
+- `sql`: the exact query on the configured backend (warehouse or DuckDB);
+- `budgeted`: when the cheapest exact engine is predicted to overrun the
+  request's deadline, an approximate result that reads only as many seed
+  playlists as fit the budget (a uniform sample from the posting store, or
+  the rarest seeds on SQL).
+
+Each engine has a linear latency model, seconds = a + b * fan-out, fitted to
+the latencies recorded for it on this backend. Built-in priors count as a few
+pseudo-observations, so a cold start behaves like the fixed precedence
+(posting store first) and the crossover fan-out moves as samples arrive. A
+small share of requests (RECOMMENDER_ROUTER_EXPLORE, default 0.05) goes to
+another exact engine that is predicted to be at most twice as slow, so every
+model keeps getting samples.
+
+Every decision is appended, with its estimate, predictions and measured
+latency, to `<data dir>/router/decisions.jsonl` (override the directory with
+RECOMMENDER_ROUTER_DIR; rotated past RECOMMENDER_ROUTER_LOG_MB, default 16).
+The models are re-fitted from the tail of that log on start.
+RECOMMENDER_ROUTER=0 turns routing off.
+
+Usage:
+    python -m recommender.router show
+    python -m recommender.router tail [-n 20]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import db
+from db import deadline_scope, remaining_budget
+from recommender import popularity
+from recommender.encoding import TRACKS
+from recommender.postings import get_posting_store
+
+
+ENGINE_LOCAL = "local"
+ENGINE_SQL = "sql"
+ENGINE_BUDGETED = "budgeted"
+
+_LOG = "decisions.jsonl"
+_SAMPLES = 512            # latencies kept per model
+_LOAD_TAIL_BYTES = 2 * 1024 * 1024
+_SAFETY = 0.8             # share of the remaining budget an exact engine may be predicted to use
+_EXPLORE_RATIO = 2.0
+
+# (engine, substrate) -> prior (fixed seconds, seconds per seed playlist).
+# Measured on a 1M-track posting store and on DuckDB; the warehouse is a guess.
+_PRIORS = {
+    (ENGINE_LOCAL, "postings"): (0.005, 1e-6),
+    (ENGINE_BUDGETED, "postings"): (0.005, 1e-6),
+    (ENGINE_SQL, "local"): (0.02, 5e-6),
+    (ENGINE_BUDGETED, "local"): (0.02, 5e-6),
+    (ENGINE_SQL, "databricks"): (1.5, 2e-7),
+    (ENGINE_BUDGETED, "databricks"): (1.5, 2e-7),
+}
+_DEFAULT_PRIOR = (0.5, 1e-6)
+_PRIOR_WEIGHT = 4.0
+_PRIOR_FANOUTS = (10.0, 10_000.0)
+
+
+def enabled() -> bool:
+    return os.environ.get("RECOMMENDER_ROUTER", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def router_dir() -> str:
+    return db._get_credential("RECOMMENDER_ROUTER_DIR") or os.path.join(db.local_data_dir(), "router")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+class CostModel:
+    """Latency = a + b * fan-out, least squares over recent samples plus the prior."""
+
+    def __init__(self, prior: tuple):
+        self.prior = (float(prior[0]), float(prior[1]))
+        self.samples: "deque[tuple]" = deque(maxlen=_SAMPLES)
+        self._fit: Optional[tuple] = None
+
+    def add(self, fanout: float, seconds: float):
+        self.samples.append((float(fanout), float(seconds)))
+        self._fit = None
+
+    def coefficients(self) -> tuple:
+        if self._fit is None:
+            a0, b0 = self.prior
+            x = np.array([f for f, _ in self.samples] + list(_PRIOR_FANOUTS), dtype=np.float64)
+            y = np.array([s for _, s in self.samples] + [a0 + b0 * f for f in _PRIOR_FANOUTS], dtype=np.float64)
+            w = np.r_[np.ones(len(self.samples)), np.full(len(_PRIOR_FANOUTS), _PRIOR_WEIGHT)]
+            mx, my = np.average(x, weights=w), np.average(y, weights=w)
+            var = float(np.sum(w * (x - mx) ** 2))
+            b = float(np.sum(w * (x - mx) * (y - my)) / var) if var > 0 else b0
+            a = my - b * mx
+            if b < 0:
+                a, b = my, 0.0
+            if a < 0:
+                a, b = 0.0, float(np.sum(w * x * y) / np.sum(w * x * x))
+            self._fit = (float(a), float(b))
+        return self._fit
+
+    def predict(self, fanout: float) -> float:
+        a, b = self.coefficients()
+        return a + b * float(fanout)
+
+    def max_fanout(self, seconds: float) -> int:
+        """Largest fan-out predicted to finish within `seconds` (0 if not even the fixed cost fits)."""
+        a, b = self.coefficients()
+        if b <= 0:
+            return 1 << 62 if a <= seconds else 0
+        return max(int((float(seconds) - a) / b), 0)
+
+
+class Decision:
+    """One routing decision; `record` completes it with the outcome."""
+
+    def __init__(self, engine: str, substrate: str, reason: str, seeds: Optional[List[str]], fanout: Optional[int],
+                 predicted: Dict[str, float], budget_s: Optional[float], max_fanout: Optional[int], explored: bool):
+        self.engine = engine
+        self.substrate = substrate
+        self.reason = reason
+        self.seeds = seeds
+        self.fanout = fanout
+        self.fanout_used = fanout
+        self.predicted = predicted
+        self.budget_s = budget_s
+        self.max_fanout = max_fanout
+        self.explored = explored
+
+
+_models: Dict[tuple, CostModel] = {}
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+_loaded = False
+_recent: "deque[dict]" = deque(maxlen=256)
+_counts: Dict[str, int] = {}
+_rng = random.Random()
+
+
+def _model(engine: str, substrate: str) -> CostModel:
+    key = (engine, substrate)
+    if key not in _models:
+        _models[key] = CostModel(_PRIORS.get(key, _DEFAULT_PRIOR))
+    return _models[key]
+
+
+def _ensure_loaded():
+    """Re-fit the models from the tail of the decision log (once per process)."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    path = os.path.join(router_dir(), _LOG)
+    try:
+        with open(path, "rb") as fh:
+            start = max(fh.seek(0, os.SEEK_END) - _LOAD_TAIL_BYTES, 0)
+            fh.seek(start)
+            lines = fh.read().splitlines()
+    except OSError:
+        return
+    if start:
+        lines = lines[1:]   # first line is cut
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        if rec.get("fanout_used") is not None and rec.get("seconds") is not None:
+            _model(rec["engine"], rec["substrate"]).add(rec["fanout_used"], rec["seconds"])
+
+
+def seed_degrees(seed_track_uris: Sequence[str]) -> Optional[np.ndarray]:
+    """Playlists per seed from resident degrees, or None when none are loaded yet."""
+    uris = [str(u) for u in seed_track_uris]
+    if popularity.loaded():
+        return np.maximum(popularity.get_table().lookup(TRACKS.lookup(uris)), 0).astype(np.int64)
+    store = get_posting_store()
+    if store is not None:
+        return store.degrees(store.track_codes(uris))
+    return None
+
+
+def estimate_fanout(seed_track_uris: Optional[Sequence[str]]) -> Optional[int]:
+    if seed_track_uris is None:
+        return None
+    degrees = seed_degrees(list(dict.fromkeys(seed_track_uris)))
+    return None if degrees is None else int(degrees.sum())
+
+
+def _substrate(engine: str, has_store: bool, backend: str) -> str:
+    if engine == ENGINE_LOCAL or (engine == ENGINE_BUDGETED and has_store):
+        return "postings"
+    return backend
+
+
+def route(seed_track_uris: Optional[Sequence[str]], deadline: Optional[float] = None) -> Decision:
+    """Pick the engine for a co-occurrence request.
+
+    `seed_track_uris` is None when the seeds are not known up front (a playlist
+    seed without the posting store); such requests go to SQL unestimated.
+    """
+    backend = db.get_backend()
+    has_store = get_posting_store() is not None
+    exact = ([ENGINE_LOCAL] if has_store else []) + [ENGINE_SQL]
+    seeds = list(seed_track_uris) if seed_track_uris is not None else None
+    fanout = estimate_fanout(seeds)
+    with deadline_scope(deadline):
+        budget = remaining_budget()
+
+    with _lock:
+        _ensure_loaded()
+        if fanout is None:
+            engine = exact[0]
+            return Decision(engine, _substrate(engine, has_store, backend), "no_estimate", seeds, None, {}, budget, None, False)
+
+        predicted = {e: _model(e, _substrate(e, has_store, backend)).predict(fanout) for e in exact}
+        engine = min(exact, key=lambda e: predicted[e])
+        reason, cap, explored = "cheapest", None, False
+        limit = budget * _SAFETY if budget is not None else None
+        if limit is not None and predicted[engine] > limit and seeds and fanout > 1:
+            cap = _model(ENGINE_BUDGETED, _substrate(ENGINE_BUDGETED, has_store, backend)).max_fanout(limit)
+            if 0 < cap < fanout:
+                engine, reason = ENGINE_BUDGETED, "over_budget"
+            else:
+                cap = None
+        if engine != ENGINE_BUDGETED:
+            others = [e for e in exact if e != engine and predicted[e] <= _EXPLORE_RATIO * predicted[engine]
+                      and (limit is None or predicted[e] <= limit)]
+            if others and _rng.random() < _env_float("RECOMMENDER_ROUTER_EXPLORE", 0.05):
+                engine, reason, explored = _rng.choice(others), "explore", True
+    return Decision(engine, _substrate(engine, has_store, backend), reason, seeds, fanout, predicted, budget, cap, explored)
+
+
+def _append_log(rec: dict):
+    root = router_dir()
+    path = os.path.join(root, _LOG)
+    max_bytes = _env_float("RECOMMENDER_ROUTER_LOG_MB", 16) * 1024 * 1024
+    with _log_lock:
+        try:
+            os.makedirs(root, exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(rec) + "\n")
+        except OSError:
+            pass
+
+
+def record(decision: Decision, seconds: float, served_by: str, timed_out: bool = False, top_k: Optional[int] = None,
+           playlist: bool = False):
+    """Log a decision with its outcome and feed the latency to the engine's model.
+
+    A timed-out request is recorded with the time it ran, a lower bound on
+    what the engine would have needed.
+    """
+    rec = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "backend": db.get_backend(),
+        "engine": decision.engine,
+        "substrate": decision.substrate,
+        "reason": decision.reason,
+        "seeds": len(decision.seeds) if decision.seeds is not None else None,
+        "playlist": bool(playlist),
+        "top_k": top_k,
+        "fanout": decision.fanout,
+        "fanout_used": decision.fanout_used,
+        "max_fanout": decision.max_fanout,
+        "budget_s": None if decision.budget_s is None else round(decision.budget_s, 4),
+        "predicted_s": {e: round(s, 6) for e, s in decision.predicted.items()},
+        "seconds": round(float(seconds), 6),
+        "served_by": served_by,
+        "timed_out": bool(timed_out),
+    }
+    with _lock:
+        if decision.fanout_used is not None:
+            _model(decision.engine, decision.substrate).add(decision.fanout_used, seconds)
+        _counts[decision.engine] = _counts.get(decision.engine, 0) + 1
+        _recent.append(rec)
+    _append_log(rec)
+
+
+def models() -> pd.DataFrame:
+    """Fitted latency model per (engine, substrate) with its sample count."""
+    with _lock:
+        _ensure_loaded()
+        rows = []
+        for (engine, substrate), m in sorted(_models.items()):
+            a, b = m.coefficients()
+            rows.append({"engine": engine, "substrate": substrate, "samples": len(m.samples),
+                         "fixed_ms": round(a * 1000, 3), "us_per_playlist": round(b * 1e6, 4)})
+    return pd.DataFrame(rows, columns=["engine", "substrate", "samples", "fixed_ms", "us_per_playlist"])
+
+
+def thresholds() -> Dict[str, Optional[int]]:
+    """Learned crossover fan-out per backend: past it SQL is predicted faster than the posting store."""
+    out = {}
+    with _lock:
+        _ensure_loaded()
+        local = _model(ENGINE_LOCAL, "postings").coefficients()
+        for backend in ("local", "databricks"):
+            a, b = _model(ENGINE_SQL, backend).coefficients()
+            out[backend] = int((a - local[0]) / (local[1] - b)) if local[1] > b and a > local[0] else None
+    return out
+
+
+def recent(limit: int = 50) -> pd.DataFrame:
+    with _lock:
+        rows = list(_recent)[-int(limit):]
+    return pd.DataFrame(rows[::-1])
+
+
+def stats() -> dict:
+    with _lock:
+        return {"decisions": dict(_counts), "samples": {f"{e}@{s}": len(m.samples) for (e, s), m in _models.items()}}
+
+
+def _tail(n: int) -> List[dict]:
+    path = os.path.join(router_dir(), _LOG)
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            lines = deque(fh, maxlen=int(n))
+    except OSError:
+        return []
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Show the co-occurrence router's learned models and decisions.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("show", help="Fitted latency models and crossover fan-outs.")
+    tl = sub.add_parser("tail", help="Most recent logged decisions.")
+    tl.add_argument("-n", type=int, default=20)
+    args = p.parse_args(argv)
+
+    if args.cmd == "show":
+        print(f"Decision log: {os.path.join(router_dir(), _LOG)}")
+        print(models().to_string(index=False))
+        for backend, fanout in thresholds().items():
+            print(f"sql@{backend} beats the posting store past: {fanout if fanout is not None else 'never'} seed playlists")
+    else:
+        rows = _tail(args.n)
+        cols = ["ts", "engine", "substrate", "reason", "seeds", "fanout", "fanout_used", "seconds", "served_by"]
+        print(pd.DataFrame(rows, columns=cols).to_string(index=False) if rows else "No decisions logged.")
+
+
+if __name__ == "__main__":
+    main()
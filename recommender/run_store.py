@@ -0,0 +1,214 @@
+"""Recommendation runs persisted on disk and addressed by content.
+
+A run (inputs, ranked pool, seen/explain seeds, which tier served it) is saved
+under `<data dir>/runs/<run_id>/` (or RECOMMENDER_RUN_DIR). The run ID is a
+hash of the inputs and the ranked results, so regenerating the same run maps
+to the same ID and files are never rewritten. Pages 2-4 load a run from
+`?run=<run_id>`, which makes reloads, new tabs and shared links free of
+backend work.
+
+Explanation signals (metadata lookups, seed-candidate edges, artist
+neighbors) are attached to the run the first time a page computes them, keyed
+by name and arguments.
+
+The store keeps the RECOMMENDER_RUN_STORE_MAX (default 1000) most recently
+saved runs.
+
+Usage:
+    python -m recommender.run_store list
+    python -m recommender.run_store prune [--keep N]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import pandas as pd
+
+import db
+
+
+RUN_FORMAT_VERSION = 1
+
+_RUN_ID = re.compile(r"^[0-9a-f]{16}$")
+_META = "run.json"
+_POOL = "pool.parquet"
+_SIGNALS = "signals"
+
+
+def run_dir() -> str:
+    return db._get_credential("RECOMMENDER_RUN_DIR") or os.path.join(db.local_data_dir(), "runs")
+
+
+def _max_runs() -> int:
+    try:
+        return max(int(os.environ.get("RECOMMENDER_RUN_STORE_MAX", "1000")), 1)
+    except ValueError:
+        return 1000
+
+
+def valid_run_id(run_id) -> bool:
+    return isinstance(run_id, str) and bool(_RUN_ID.match(run_id))
+
+
+def _path(run_id: str) -> str:
+    if not valid_run_id(run_id):
+        raise ValueError(f"Invalid run id: {run_id!r}")
+    return os.path.join(run_dir(), run_id)
+
+
+def run_id_for(inputs: dict, pool: pd.DataFrame) -> str:
+    h = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8"))
+    if pool is not None and not pool.empty:
+        h.update(",".join(map(str, pool.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(pool, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def save_run(inputs: dict, pool: pd.DataFrame, state: dict) -> str:
+    """Persist a run; returns its ID. `pool` holds URIs (not process-local codes)."""
+    run_id = run_id_for(inputs, pool)
+    final = _path(run_id)
+    if os.path.exists(os.path.join(final, _META)):
+        return run_id
+    root = run_dir()
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f".tmp-{run_id}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(os.path.join(tmp, _SIGNALS))
+    try:
+        pool.reset_index(drop=True).to_parquet(os.path.join(tmp, _POOL), index=False)
+        meta = {
+            "format_version": RUN_FORMAT_VERSION,
+            "run_id": run_id,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "backend": db.get_backend(),
+            "inputs": inputs,
+            "state": state,
+        }
+        with open(os.path.join(tmp, _META), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            # Another process saved the same run first; its content is identical.
+            if not os.path.exists(os.path.join(final, _META)):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    prune()
+    return run_id
+
+
+def load_run(run_id: str) -> Optional[dict]:
+    """{'run_id', 'created_at', 'backend', 'inputs', 'state', 'pool'} or None if unknown."""
+    if not valid_run_id(run_id):
+        return None
+    path = _path(run_id)
+    try:
+        with open(os.path.join(path, _META), "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        pool = pd.read_parquet(os.path.join(path, _POOL))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format_version") != RUN_FORMAT_VERSION:
+        return None
+    meta["pool"] = pool
+    return meta
+
+
+def _signal_path(run_id: str, name: str, args) -> str:
+    digest = hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+    slug = "".join(ch if ch.isalnum() else "_" for ch in name)[:40]
+    return os.path.join(_path(run_id), _SIGNALS, f"{slug}_{digest}.parquet")
+
+
+def get_signal(run_id: str, name: str, args) -> Optional[pd.DataFrame]:
+    try:
+        return pd.read_parquet(_signal_path(run_id, name, args))
+    except (OSError, ValueError):
+        return None
+
+
+def put_signal(run_id: str, name: str, args, df: pd.DataFrame) -> bool:
+    """Attach a computed signal to a saved run; False if the run is gone."""
+    path = _signal_path(run_id, name, args)
+    if not os.path.isdir(os.path.dirname(path)):
+        return False
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        df.reset_index(drop=True).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except (OSError, ValueError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def list_runs() -> pd.DataFrame:
+    """Saved runs, newest first."""
+    rows = []
+    root = run_dir()
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        if not valid_run_id(name):
+            continue
+        # A run pruned by another process mid-listing is skipped, not an error.
+        try:
+            with open(os.path.join(root, name, _META), "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            signals = len(os.listdir(os.path.join(root, name, _SIGNALS)))
+        except (OSError, ValueError):
+            continue
+        inputs = meta.get("inputs", {})
+        rows.append({
+            "run_id": name,
+            "created_at": meta.get("created_at"),
+            "backend": meta.get("backend"),
+            "model": inputs.get("model"),
+            "seed_mode": inputs.get("seed_mode"),
+            "seeds": len(inputs.get("seed_track_uris") or []),
+            "playlist_id": inputs.get("playlist_id"),
+            "signals": signals,
+        })
+    df = pd.DataFrame(rows, columns=["run_id", "created_at", "backend", "model", "seed_mode", "seeds", "playlist_id", "signals"])
+    return df.sort_values("created_at", ascending=False, ignore_index=True)
+
+
+def prune(keep: Optional[int] = None) -> int:
+    """Delete all but the `keep` most recently saved runs; returns how many were removed."""
+    keep = _max_runs() if keep is None else int(keep)
+    root = run_dir()
+    if not os.path.isdir(root):
+        return 0
+    runs = [os.path.join(root, n) for n in os.listdir(root) if valid_run_id(n)]
+    if len(runs) <= keep:
+        return 0
+    runs.sort(key=lambda p: os.path.getmtime(p), reverse=True)
+    for path in runs[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+    return len(runs) - keep
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="List or prune persisted recommendation runs.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="List saved runs.")
+    pr = sub.add_parser("prune", help="Keep only the most recent runs.")
+    pr.add_argument("--keep", type=int, default=None, help="Runs to keep (default: RECOMMENDER_RUN_STORE_MAX).")
+    args = p.parse_args(argv)
+
+    if args.cmd == "list":
+        print(list_runs().to_string(index=False))
+    else:
+        print(f"Removed {prune(args.keep)} run(s) from {run_dir()}")
+
+
+if __name__ == "__main__":
+    main()
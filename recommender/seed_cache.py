@@ -0,0 +1,212 @@
+"""Per-seed caching for co-occurrence recommendations.
+
+A co-occurrence score is the number of distinct playlists that contain the
+candidate and at least one seed. That is not a sum of per-seed scores, but it
+is a union of per-seed pieces, so each seed's piece is cached on its own and a
+request only fetches the seeds it has not seen before:
+
+- with the posting store, a seed's piece is its posting list, already a
+  memory-mapped slice; multi-seed requests merge cached per-seed neighbor
+  lists with early termination (recommender/neighbor_lists.py) and only fall
+  back to counting the whole neighborhood when the lists cannot prove the
+  top k;
+- on the SQL backends, a seed's piece is its neighborhood: (playlist, track)
+  code pairs for every playlist containing the seed, fetched in one query for
+  all new seeds of a request.
+
+Track metadata (title, artist) is cached per URI the same way.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from db import execute_sql, get_backend
+from queries import seed_neighborhoods_sql, tracks_metadata_sql
+from recommender.encoding import PLAYLISTS, TRACKS
+from recommender.postings import get_posting_store, top_counts
+
+
+# Neighborhood rows pulled for the new seeds of one request; past this the
+# request uses the aggregated co-occurrence SQL instead.
+MAX_NEIGHBORHOOD_ROWS = 2_000_000
+
+_MAX_CACHE_BYTES = int(float(os.environ.get("RECOMMENDER_SEED_CACHE_MB", "256")) * 1024 * 1024)
+_MAX_METADATA_ENTRIES = 200_000
+
+
+def canonical_seeds(seed_track_uris: Optional[Iterable]) -> Tuple[str, ...]:
+    """Order- and duplicate-free form of a seed set."""
+    return tuple(sorted({str(u) for u in (seed_track_uris or []) if u}))
+
+
+class PieceCache:
+    """Thread-safe LRU of numpy array tuples, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: tuple):
+        size = sum(a.nbytes for a in value)
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= sum(a.nbytes for a in old)
+            self._items[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= sum(a.nbytes for a in evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+_pieces = PieceCache(_MAX_CACHE_BYTES)
+
+_metadata: "OrderedDict[str, Tuple[object, object]]" = OrderedDict()
+_metadata_lock = threading.Lock()
+
+
+def cache_stats() -> dict:
+    with _metadata_lock:
+        n_meta = len(_metadata)
+    from recommender import neighbor_lists
+
+    return {"neighborhoods": _pieces.stats(), "metadata_entries": n_meta, "neighbor_lists": neighbor_lists.stats()}
+
+
+def clear_caches():
+    from recommender import neighbor_lists
+
+    _pieces.clear()
+    neighbor_lists.clear()
+    with _metadata_lock:
+        _metadata.clear()
+
+
+def neighborhood_pieces(seeds: Iterable[str]) -> Optional[dict]:
+    """{seed: (playlist codes, track codes)}, fetching only uncached seeds.
+
+    Returns None when the uncached neighborhoods exceed MAX_NEIGHBORHOOD_ROWS.
+    """
+    backend = get_backend()
+    pieces, missing = {}, []
+    for uri in canonical_seeds(seeds):
+        piece = _pieces.get((backend, uri))
+        if piece is None:
+            missing.append(uri)
+        else:
+            pieces[uri] = piece
+
+    if missing:
+        df = execute_sql(seed_neighborhoods_sql(missing, limit=MAX_NEIGHBORHOOD_ROWS + 1))
+        if len(df) > MAX_NEIGHBORHOOD_ROWS:
+            return None
+        empty = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+        fetched = {uri: empty for uri in missing}
+        if not df.empty:
+            pl = PLAYLISTS.encode(df["playlist_id"])
+            tr = TRACKS.encode(df["track_uri"])
+            for uri, idx in df.groupby(df["seed_track_uri"].astype(str)).indices.items():
+                fetched[uri] = (pl[idx], tr[idx])
+        for uri, piece in fetched.items():
+            _pieces.put((backend, uri), piece)
+        pieces.update(fetched)
+    return pieces
+
+
+def _union_counts(pieces: List[tuple], seed_codes: np.ndarray) -> np.ndarray:
+    """Distinct playlists per track over the union of the seed neighborhoods."""
+    n = len(TRACKS)
+    if not pieces:
+        return np.zeros(n, dtype=np.int64)
+    pl = np.concatenate([p for p, _ in pieces]).astype(np.int64)
+    tr = np.concatenate([t for _, t in pieces]).astype(np.int64)
+    pairs = np.unique((pl << 32) | tr)
+    counts = np.bincount(pairs & 0xFFFFFFFF, minlength=n)
+    counts[seed_codes] = 0
+    return counts
+
+
+def assemble_cooccurrence(seeds: Tuple[str, ...], pieces: dict, top_k: int) -> pd.DataFrame:
+    """Top-k (track_uri, score) for canonical `seeds` from their neighborhood pieces."""
+    seed_codes = TRACKS.lookup(seeds)
+    counts = _union_counts([pieces[u] for u in seeds], seed_codes[seed_codes >= 0])
+    idx, scores = top_counts(counts, top_k)
+    return pd.DataFrame({"track_uri": TRACKS.decode_list(idx), "score": np.asarray(scores, dtype=np.int64)})
+
+
+def seed_cooccurrence(seed_track_uris: Iterable, top_k: int, use_postings: bool = True) -> Optional[pd.DataFrame]:
+    """Top-k (track_uri, score) for a seed set; None if the neighborhoods are too large.
+
+    `use_postings=False` skips the posting store and fetches neighborhoods from SQL.
+    """
+    seeds = canonical_seeds(seed_track_uris)
+    if not seeds:
+        return pd.DataFrame(columns=["track_uri", "score"])
+
+    store = get_posting_store() if use_postings else None
+    if store is not None:
+        from recommender import neighbor_lists
+
+        codes = store.track_codes(list(seeds))
+        merged = neighbor_lists.threshold_topk(store, codes, top_k) if neighbor_lists.enabled() else None
+        if merged is not None:
+            idx, scores = merged
+        else:
+            idx, scores = top_counts(store.cooccurrence_counts(codes), top_k)
+        return pd.DataFrame({"track_uri": store.decode_tracks(idx), "score": np.asarray(scores, dtype=np.int64)})
+
+    pieces = neighborhood_pieces(seeds)
+    if pieces is None:
+        return None
+    return assemble_cooccurrence(seeds, pieces, top_k)
+
+
+def tracks_metadata(track_uris: Iterable) -> pd.DataFrame:
+    """(track_uri, track_title, artist_name) rows, querying only uncached URIs."""
+    uris = list(dict.fromkeys(str(u) for u in (track_uris if track_uris is not None else [])))
+    with _metadata_lock:
+        missing = [u for u in uris if u not in _metadata]
+    if missing:
+        df = execute_sql(tracks_metadata_sql(missing))
+        with _metadata_lock:
+            for row in df.drop_duplicates("track_uri").itertuples(index=False):
+                _metadata[str(row.track_uri)] = (row.track_title, row.artist_name)
+            while len(_metadata) > _MAX_METADATA_ENTRIES:
+                _metadata.popitem(last=False)
+    with _metadata_lock:
+        rows = [(u,) + _metadata[u] for u in uris if u in _metadata]
+        for u in uris:
+            if u in _metadata:
+                _metadata.move_to_end(u)
+    return pd.DataFrame(rows, columns=["track_uri", "track_title", "artist_name"])
@@ -0,0 +1,394 @@
+"""Headless JSON API over recommender.logic.
+
+Usage:
+    python -m recommender.service --port 8600
+    python -m recommender.service --backend local --data-dir ./data   # offline, for load tests
+
+Endpoints:
+    GET  /health
+    GET  /metrics                   Prometheus text format
+    GET  /stats?exact=1             dataset stats from the sketch snapshot (exact=1 recomputes)
+    GET  /recommend?seeds=a,b&model=co-occurrence&top_k=10&deadline_ms=2000
+    GET  /recommend?playlist_id=...&model=popularity&exclude=a,b
+    GET  /recommend/page?run_id=...&cursor=50&limit=50
+    GET  /search/tracks?q=...&limit=10
+    GET  /search/artists?q=...&limit=10
+    GET  /search/playlists?q=...&limit=10
+    POST /explain                   {"seeds": [...], "candidates": [...]}
+
+Row sets are streamed in chunks: a JSON object with a `rows` array by default,
+or one object per line with `format=ndjson`. Backend work runs on the shared
+query pool (db.submit), with the same process-level caches as the app; when a
+client disconnects its query is cancelled.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import db
+from recommender import logic as rlogic
+from recommender import batching, frame_store, router, seed_cache, stats_snapshot, warmup
+
+
+STREAM_CHUNK_ROWS = 200
+_DISCONNECT_POLL_SECONDS = 0.25
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# --- Metrics ---
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.seconds = {}
+        self.buckets = {}
+        self.served_by = {}
+        self.in_flight = 0
+
+    def observe(self, route: str, status: int, seconds: float):
+        with self._lock:
+            key = (route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.seconds[route] = self.seconds.get(route, 0.0) + seconds
+            counts = self.buckets.setdefault(route, [0] * len(_LATENCY_BUCKETS))
+            for i, le in enumerate(_LATENCY_BUCKETS):
+                if seconds <= le:
+                    counts[i] += 1
+
+    def count_served(self, tier: str):
+        with self._lock:
+            self.served_by[tier] = self.served_by.get(tier, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            lines.append("# TYPE recommender_requests_total counter")
+            for (route, status), n in sorted(self.requests.items()):
+                lines.append(f'recommender_requests_total{{route="{route}",status="{status}"}} {n}')
+            lines.append("# TYPE recommender_request_seconds histogram")
+            for route, counts in sorted(self.buckets.items()):
+                total = sum(n for (r, _), n in self.requests.items() if r == route)
+                for le, n in zip(_LATENCY_BUCKETS, counts):
+                    lines.append(f'recommender_request_seconds_bucket{{route="{route}",le="{le}"}} {n}')
+                lines.append(f'recommender_request_seconds_bucket{{route="{route}",le="+Inf"}} {total}')
+                lines.append(f'recommender_request_seconds_sum{{route="{route}"}} {self.seconds[route]:.6f}')
+                lines.append(f'recommender_request_seconds_count{{route="{route}"}} {total}')
+            lines.append("# TYPE recommender_served_by_total counter")
+            for tier, n in sorted(self.served_by.items()):
+                lines.append(f'recommender_served_by_total{{tier="{tier}"}} {n}')
+            lines.append("# TYPE recommender_requests_in_flight gauge")
+            lines.append(f"recommender_requests_in_flight {self.in_flight}")
+
+        flights = db.single_flight_stats()
+        lines.append("# TYPE recommender_single_flight_total counter")
+        for k in ("executed", "coalesced", "cross_process_hits"):
+            lines.append(f'recommender_single_flight_total{{outcome="{k}"}} {flights[k]}')
+        batch = batching.stats()
+        lines.append("# TYPE recommender_batch gauge")
+        for k in ("batches", "requests", "mean_batch_size", "throughput_rps", "latency_p50_ms", "latency_p95_ms"):
+            if k in batch:
+                lines.append(f'recommender_batch{{stat="{k}"}} {batch[k]}')
+        caches = seed_cache.cache_stats()
+        nb = caches["neighborhoods"]
+        lines.append("# TYPE recommender_seed_cache gauge")
+        for k in ("entries", "bytes", "hits", "misses"):
+            lines.append(f'recommender_seed_cache{{stat="{k}"}} {nb[k]}')
+        lines.append(f'recommender_seed_cache{{stat="metadata_entries"}} {caches["metadata_entries"]}')
+        ta = caches["neighbor_lists"]
+        lines.append("# TYPE recommender_threshold_merge_total counter")
+        for k in ("requests", "early_stops", "exhausted", "fallbacks", "entries_read", "candidates_scored"):
+            lines.append(f'recommender_threshold_merge_total{{stat="{k}"}} {ta[k]}')
+        routes = router.stats()
+        lines.append("# TYPE recommender_route_total counter")
+        for engine, n in sorted(routes["decisions"].items()):
+            lines.append(f'recommender_route_total{{engine="{engine}"}} {n}')
+        frames = frame_store.stats()
+        lines.append("# TYPE recommender_frame_store gauge")
+        lines.append(f'recommender_frame_store{{stat="bytes"}} {frames["bytes"]}')
+        lines.append(f'recommender_frame_store{{stat="max_bytes"}} {frames["max_bytes"]}')
+        for ns, d in frames["namespaces"].items():
+            for k in ("entries", "bytes", "hits", "misses", "evictions"):
+                lines.append(f'recommender_frame_store{{namespace="{ns}",stat="{k}"}} {d.get(k, 0)}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = _Metrics()
+
+
+class _BadRequest(ValueError):
+    pass
+
+
+def _list_param(request: Request, name: str) -> List[str]:
+    values = []
+    for v in request.query_params.getlist(name):
+        values.extend(p.strip() for p in v.split(",") if p.strip())
+    return values
+
+
+def _int_param(request: Request, name: str, default: int, lo: int = 1, hi: int = 1000) -> int:
+    raw = request.query_params.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise _BadRequest(f"`{name}` must be an integer")
+    return max(lo, min(hi, value))
+
+
+async def _run(request: Request, fn, *args, **kwargs):
+    """Run blocking `fn` on the query pool; cancel it if the client goes away."""
+    handle = db.submit(fn, *args, **kwargs)
+    fut = asyncio.wrap_future(handle.future)
+    try:
+        while True:
+            done, _ = await asyncio.wait({fut}, timeout=_DISCONNECT_POLL_SECONDS)
+            if done:
+                return fut.result()
+            if await request.is_disconnected():
+                handle.cancel()
+                raise db.QueryCancelled("Client disconnected.")
+    except asyncio.CancelledError:
+        handle.cancel()
+        raise
+
+
+def _stream_rows(df: pd.DataFrame, meta: dict, ndjson: bool) -> StreamingResponse:
+    async def _json_body():
+        yield json.dumps(meta)[:-1] + ', "rows": ['
+        for i in range(0, len(df), STREAM_CHUNK_ROWS):
+            chunk = df.iloc[i:i + STREAM_CHUNK_ROWS].to_json(orient="records")[1:-1]
+            yield ("," if i else "") + chunk
+            await asyncio.sleep(0)
+        yield "]}\n"
+
+    async def _ndjson_body():
+        yield json.dumps({"meta": meta}) + "\n"
+        for i in range(0, len(df), STREAM_CHUNK_ROWS):
+            yield df.iloc[i:i + STREAM_CHUNK_ROWS].to_json(orient="records", lines=True).rstrip("\n") + "\n"
+            await asyncio.sleep(0)
+
+    if ndjson:
+        return StreamingResponse(_ndjson_body(), media_type="application/x-ndjson")
+    return StreamingResponse(_json_body(), media_type="application/json")
+
+
+def _endpoint(route: str):
+    """Shared error mapping and metrics for the JSON endpoints."""
+
+    def wrap(handler):
+        async def _handle(request: Request) -> Response:
+            started = time.perf_counter()
+            with metrics._lock:
+                metrics.in_flight += 1
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except _BadRequest as e:
+                status = 400
+                return JSONResponse({"error": str(e)}, status_code=status)
+            except db.DeadlineExceeded as e:
+                status = 504
+                return JSONResponse({"error": str(e)}, status_code=status)
+            except db.QueryCancelled as e:
+                status = 499
+                return JSONResponse({"error": str(e)}, status_code=status)
+            except Exception as e:
+                return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=status)
+            finally:
+                with metrics._lock:
+                    metrics.in_flight -= 1
+                metrics.observe(route, status, time.perf_counter() - started)
+
+        return _handle
+
+    return wrap
+
+
+def _ndjson(request: Request) -> bool:
+    return request.query_params.get("format") == "ndjson" or "ndjson" in request.headers.get("accept", "")
+
+
+# --- Endpoints ---
+
+async def health(request: Request) -> Response:
+    report = warmup.startup_report()
+    phases = report["phases"]
+    preflight = phases.get("preflight", {}).get("status", "pending")
+    ok = preflight in ("ok", "running", "pending")
+    body = {
+        "status": "ok" if ok else "degraded",
+        "backend": db.get_backend(),
+        "preflight": preflight,
+        "posting_store": phases.get("posting_store", {}).get("status", "pending") == "ok",
+        "warmup": report,
+    }
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@_endpoint("recommend")
+async def recommend(request: Request) -> Response:
+    seeds = _list_param(request, "seeds")
+    playlist_id = request.query_params.get("playlist_id") or None
+    model = (request.query_params.get("model") or "co-occurrence").lower()
+    top_k = _int_param(request, "top_k", 10)
+    deadline_ms = _int_param(request, "deadline_ms", int(_default_deadline_s() * 1000), lo=0, hi=600_000)
+    if not seeds and not playlist_id and not model.startswith("pop"):
+        raise _BadRequest("Pass `seeds` or `playlist_id`")
+
+    exclude = _list_param(request, "exclude")
+
+    deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms > 0 else None
+    started = time.perf_counter()
+    run_id, _ = await _run(
+        request, rlogic.start_ranked_run,
+        seed_track_ids=seeds or None, playlist_id=playlist_id, model=model,
+        pool_size=max(rlogic.RANKED_POOL_SIZE, top_k), exclude=exclude, deadline=deadline,
+    )
+    df, next_cursor = rlogic.page_ranked_run(run_id, 0, top_k)
+    served_by = df.attrs.get("served_by", rlogic.SERVED_EXACT)
+    metrics.count_served(served_by)
+    meta = {
+        "model": model,
+        "top_k": top_k,
+        "served_by": served_by,
+        "run_id": run_id,
+        "next_cursor": next_cursor,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return _stream_rows(df, meta, _ndjson(request))
+
+
+@_endpoint("stats")
+async def stats(request: Request) -> Response:
+    exact = request.query_params.get("exact") in ("1", "true", "yes")
+    snap = stats_snapshot.get_snapshot()
+    if exact or snap is None:
+        snap = await _run(request, stats_snapshot.refresh, exact=exact)
+    return JSONResponse(snap.report())
+
+
+@_endpoint("recommend_page")
+async def recommend_page(request: Request) -> Response:
+    run_id = request.query_params.get("run_id") or ""
+    cursor = _int_param(request, "cursor", 0, lo=0, hi=1_000_000)
+    limit = _int_param(request, "limit", 50)
+    try:
+        df, next_cursor = rlogic.page_ranked_run(run_id, cursor, limit)
+    except KeyError:
+        return JSONResponse({"error": "Unknown or expired run_id; request /recommend again."}, status_code=404)
+    meta = {"run_id": run_id, "cursor": cursor, "next_cursor": next_cursor}
+    return _stream_rows(df, meta, _ndjson(request))
+
+
+def _search(fn):
+    async def handler(request: Request) -> Response:
+        q = (request.query_params.get("q") or "").strip()
+        if not q:
+            raise _BadRequest("`q` is required")
+        limit = _int_param(request, "limit", 10, hi=500)
+        df = await _run(request, fn, q, limit)
+        return _stream_rows(df, {"q": q, "limit": limit}, _ndjson(request))
+
+    return handler
+
+
+search_tracks = _endpoint("search_tracks")(_search(rlogic.search_tracks_by_title))
+search_artists = _endpoint("search_artists")(_search(rlogic.search_artist_top_tracks))
+search_playlists = _endpoint("search_playlists")(_search(rlogic.search_playlists_by_name))
+
+
+@_endpoint("explain")
+async def explain(request: Request) -> Response:
+    try:
+        body = await request.json()
+    except Exception:
+        raise _BadRequest("Body must be JSON")
+    if not isinstance(body, dict):
+        raise _BadRequest("Body must be a JSON object")
+    seeds, cands = body.get("seeds") or [], body.get("candidates") or []
+    if not isinstance(seeds, list) or not isinstance(cands, list):
+        raise _BadRequest("`seeds` and `candidates` must be lists")
+    seeds = [str(u) for u in seeds]
+    cands = [str(u) for u in cands]
+    if not seeds or not cands:
+        raise _BadRequest("Pass non-empty `seeds` and `candidates`")
+    df = await _run(request, rlogic.explain_seed_candidates, seeds, cands)
+    return _stream_rows(df, {"seeds": len(seeds), "candidates": len(cands)}, _ndjson(request))
+
+
+def _default_deadline_s() -> float:
+    return float(os.environ.get("RECOMMENDER_DEADLINE_S", "20"))
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    warmup.start_warmup()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/metrics", metrics_endpoint),
+        Route("/stats", stats),
+        Route("/recommend", recommend, methods=["GET"]),
+        Route("/recommend/page", recommend_page, methods=["GET"]),
+        Route("/search/tracks", search_tracks),
+        Route("/search/artists", search_artists),
+        Route("/search/playlists", search_playlists),
+        Route("/explain", explain, methods=["POST"]),
+    ],
+    lifespan=_lifespan,
+)
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Serve recommendations over HTTP.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8600)
+    p.add_argument("--backend", choices=["databricks", "local"], default=None,
+                   help="Overrides RECOMMENDER_BACKEND.")
+    p.add_argument("--data-dir", default=None, help="Local backend data directory.")
+    p.add_argument("--query-workers", type=int, default=None,
+                   help="Threads in the backend query pool (RECOMMENDER_QUERY_WORKERS).")
+    p.add_argument("--processes", type=int, default=1, help="Server processes.")
+    args = p.parse_args(argv)
+
+    # Environment is set before anything touches the backend, and inherited by worker processes.
+    if args.backend:
+        os.environ["RECOMMENDER_BACKEND"] = args.backend
+    if args.data_dir:
+        os.environ["RECOMMENDER_LOCAL_DIR"] = os.path.abspath(args.data_dir)
+    if args.query_workers:
+        os.environ["RECOMMENDER_QUERY_WORKERS"] = str(args.query_workers)
+
+    import uvicorn
+
+    target = "recommender.service:app" if args.processes > 1 else app
+    uvicorn.run(target, host=args.host, port=args.port, workers=args.processes, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
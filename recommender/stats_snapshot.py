@@ -0,0 +1,430 @@
+"""Dataset stats and top artists served from a persisted sketch snapshot.
+
+stats_sql runs three COUNT(DISTINCT) scans and top_artists_sql a distinct join
+over the fact table. The snapshot instead keeps:
+
+- HyperLogLog distinct counts of tracks, playlists and artists;
+- a Space-Saving heavy-hitters summary of distinct played tracks per artist,
+  with the 64-bit hashes of tracks already counted so updates never count a
+  track twice.
+
+It lives in `<data dir>/stats` (or RECOMMENDER_STATS_DIR), is served from
+memory, and is refreshed by a background thread. On the local backend a
+refresh folds in only Parquet files added since the last one (both sketches
+merge exactly under union); changed or removed files, or the warehouse
+backend, mean a full rebuild. `refresh(exact=True)` also runs the exact SQL and
+records the observed sketch error.
+
+Usage:
+    python -m recommender.stats_snapshot [--full] [--exact]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import db
+from queries import (
+    dim_track_artists_sql,
+    distinct_playlists_sql,
+    played_track_artists_sql,
+    stats_sql,
+    top_artists_sql,
+)
+
+
+HLL_PRECISION = 14            # 16384 registers, ~0.81% standard error
+HEAVY_HITTERS_CAPACITY = 2000
+SNAPSHOT_FORMAT_VERSION = 1
+_CHUNK_ROWS = 500_000
+
+
+def _hash64(values) -> np.ndarray:
+    s = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    return pd.util.hash_pandas_object(s.astype(str), index=False).to_numpy(dtype=np.uint64)
+
+
+class HyperLogLog:
+    """HyperLogLog over 64-bit hashes (no large-range correction needed)."""
+
+    def __init__(self, p: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.p = int(p)
+        self.m = 1 << self.p
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add_hashes(self, h: np.ndarray):
+        h = np.asarray(h, dtype=np.uint64)
+        if h.size == 0:
+            return
+        idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        # Top 52 bits of the remaining bits are exact in float64; frexp gives their bit length.
+        rest = ((h << np.uint64(self.p)) >> np.uint64(12)).astype(np.float64)
+        _, bitlen = np.frexp(rest)
+        rho = np.minimum(53 - bitlen, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rho)
+
+    def add(self, values):
+        self.add_hashes(_hash64(values))
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> float:
+        m = float(self.m)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if est <= 2.5 * m and zeros:
+            est = m * math.log(m / zeros)
+        return est
+
+
+class SpaceSaving:
+    """Mergeable Space-Saving summary: `count - error <= true count <= count`."""
+
+    def __init__(self, capacity: int = HEAVY_HITTERS_CAPACITY):
+        self.capacity = int(capacity)
+        self.counts = pd.Series(dtype="int64")
+        self.errors = pd.Series(dtype="int64")
+
+    @property
+    def floor(self) -> int:
+        """Upper bound on the count of any item not in the summary."""
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def update(self, increments: pd.Series):
+        """Add exact per-item counts from a batch of new data."""
+        if increments.empty:
+            return
+        inc = increments.groupby(level=0).sum().astype("int64")
+        floor = self.floor
+        counts = self.counts.add(inc, fill_value=0).astype("int64")
+        new = ~counts.index.isin(self.counts.index)
+        counts[new] += floor
+        errors = self.errors.reindex(counts.index).fillna(floor).astype("int64")
+        keep = counts.sort_values(ascending=False, kind="mergesort").index[:self.capacity]
+        self.counts, self.errors = counts[keep], errors[keep]
+
+    def top(self, k: int) -> pd.DataFrame:
+        c = self.counts.sort_values(ascending=False, kind="mergesort").head(int(k))
+        return pd.DataFrame({"item": c.index, "count": c.to_numpy(), "error": self.errors[c.index].to_numpy()})
+
+    def guaranteed_top(self, k: int) -> bool:
+        """True when the reported top-k is provably the true top-k (as a set)."""
+        c = self.counts.sort_values(ascending=False, kind="mergesort")
+        if len(c) <= k:
+            return self.floor == 0
+        kth_lower = int(c.iloc[k - 1] - self.errors[c.index[k - 1]])
+        return kth_lower >= int(c.iloc[k])
+
+
+class StatsSnapshot:
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.tracks = HyperLogLog()
+        self.playlists = HyperLogLog()
+        self.artists = HyperLogLog()
+        self.artist_tracks = SpaceSaving()
+        self.seen_tracks = np.zeros(0, dtype=np.uint64)
+        self.sources: Optional[Dict[str, Dict[str, list]]] = None
+        self.built_at: Optional[str] = None
+        self.updated_at: Optional[str] = None
+        self.exact: Optional[dict] = None
+
+    # --- folding data in ---
+
+    def fold_dim(self, chunks):
+        for df in chunks:
+            self.tracks.add(df["track_uri"])
+            self.artists.add(df["artist_name"].dropna())
+
+    def fold_playlists(self, chunks):
+        for df in chunks:
+            self.playlists.add(df["playlist_id"])
+
+    def fold_played_tracks(self, chunks):
+        for df in chunks:
+            h = _hash64(df["track_uri"])
+            _, first = np.unique(h, return_index=True)
+            h, artists = h[first], df["artist_name"].to_numpy()[first]
+            pos = np.searchsorted(self.seen_tracks, h)
+            pos = np.minimum(pos, max(len(self.seen_tracks) - 1, 0))
+            new = (self.seen_tracks[pos] != h) if len(self.seen_tracks) else np.ones(len(h), dtype=bool)
+            if not new.any():
+                continue
+            self.artist_tracks.update(pd.Series(artists[new]).value_counts())
+            self.seen_tracks = np.union1d(self.seen_tracks, h[new])
+
+    # --- serving ---
+
+    def is_exact(self) -> bool:
+        return bool(self.exact) and self.exact.get("as_of") == self.updated_at
+
+    def stats(self) -> dict:
+        if self.is_exact():
+            return {k: int(self.exact[k]) for k in ("tracks", "playlists", "artists")}
+        return {
+            "tracks": int(round(self.tracks.count())),
+            "playlists": int(round(self.playlists.count())),
+            "artists": int(round(self.artists.count())),
+        }
+
+    def top_artists(self, limit: int = 10) -> pd.DataFrame:
+        top = self.artist_tracks.top(limit)
+        df = pd.DataFrame({"artist_name": top["item"], "n_tracks": top["count"].astype("int64")})
+        df.attrs["max_overcount"] = int(top["error"].max()) if not top.empty else 0
+        return df
+
+    def report(self) -> dict:
+        out = {
+            "backend": self.backend,
+            "built_at": self.built_at,
+            "updated_at": self.updated_at,
+            "method": "exact" if self.is_exact() else "sketch",
+            "stats": self.stats(),
+            "sketch_estimates": {
+                "tracks": round(self.tracks.count(), 1),
+                "playlists": round(self.playlists.count(), 1),
+                "artists": round(self.artists.count(), 1),
+            },
+            "hll_relative_standard_error": round(self.tracks.relative_error, 5),
+            "heavy_hitters": {
+                "capacity": self.artist_tracks.capacity,
+                "max_overcount": self.artist_tracks.floor,
+                "top10_guaranteed": self.artist_tracks.guaranteed_top(10),
+            },
+        }
+        if self.exact:
+            out["exact"] = self.exact
+        return out
+
+    # --- persistence ---
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        arrays = os.path.join(path, "sketches.npz")
+        with open(arrays + ".tmp", "wb") as fh:
+            np.savez(
+                fh,
+                tracks=self.tracks.registers,
+                playlists=self.playlists.registers,
+                artists=self.artists.registers,
+                seen_tracks=self.seen_tracks,
+            )
+        os.replace(arrays + ".tmp", arrays)
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "backend": self.backend,
+            "built_at": self.built_at,
+            "updated_at": self.updated_at,
+            "sources": self.sources,
+            "exact": self.exact,
+            "heavy_hitters": {
+                "capacity": self.artist_tracks.capacity,
+                "items": self.artist_tracks.counts.index.tolist(),
+                "counts": self.artist_tracks.counts.tolist(),
+                "errors": self.artist_tracks.errors.tolist(),
+            },
+        }
+        meta_path = os.path.join(path, "snapshot.json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["StatsSnapshot"]:
+        meta_path = os.path.join(path, "snapshot.json")
+        arrays = os.path.join(path, "sketches.npz")
+        if not (os.path.exists(meta_path) and os.path.exists(arrays)):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if int(meta.get("format_version", 0)) != SNAPSHOT_FORMAT_VERSION:
+            return None
+        snap = cls(meta["backend"])
+        with np.load(arrays) as z:
+            snap.tracks.registers = z["tracks"].copy()
+            snap.playlists.registers = z["playlists"].copy()
+            snap.artists.registers = z["artists"].copy()
+            snap.seen_tracks = z["seen_tracks"].copy()
+        hh = meta["heavy_hitters"]
+        snap.artist_tracks = SpaceSaving(hh["capacity"])
+        snap.artist_tracks.counts = pd.Series(hh["counts"], index=hh["items"], dtype="int64")
+        snap.artist_tracks.errors = pd.Series(hh["errors"], index=hh["items"], dtype="int64")
+        snap.sources = meta.get("sources")
+        snap.built_at = meta.get("built_at")
+        snap.updated_at = meta.get("updated_at")
+        snap.exact = meta.get("exact")
+        return snap
+
+
+# --- Building and refreshing ---
+
+def stats_dir() -> str:
+    return db._get_credential("RECOMMENDER_STATS_DIR") or os.path.join(db.local_data_dir(), "stats")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _local_sources() -> Dict[str, Dict[str, list]]:
+    out = {}
+    for name in ("fact_playlist_track", "dim_track"):
+        src = db.local_table_source(name)
+        files = sorted(glob.glob(src, recursive=True)) if src else []
+        out[name] = {f: [os.stat(f).st_mtime_ns, os.stat(f).st_size] for f in files}
+    return out
+
+
+def _parquet_source(files: List[str]) -> str:
+    quoted = ", ".join("'" + f.replace("'", "''") + "'" for f in files)
+    return f"read_parquet([{quoted}])"
+
+
+def _build_full(backend: str) -> StatsSnapshot:
+    snap = StatsSnapshot(backend)
+    snap.fold_dim(db.iter_sql_chunks(dim_track_artists_sql(), _CHUNK_ROWS))
+    snap.fold_playlists(db.iter_sql_chunks(distinct_playlists_sql(), _CHUNK_ROWS))
+    snap.fold_played_tracks(db.iter_sql_chunks(played_track_artists_sql(), _CHUNK_ROWS))
+    snap.built_at = snap.updated_at = _now()
+    return snap
+
+
+def _fold_new_files(snap: StatsSnapshot, current: Dict[str, Dict[str, list]]) -> bool:
+    """Fold files added since `snap.sources`; False if anything else changed."""
+    old = snap.sources or {}
+    new_files = {}
+    for name, files in current.items():
+        prev = old.get(name, {})
+        if any(f not in files or files[f] != meta for f, meta in prev.items()):
+            return False
+        new_files[name] = [f for f in files if f not in prev]
+
+    if new_files.get("dim_track"):
+        snap.fold_dim(db.iter_sql_chunks(dim_track_artists_sql(_parquet_source(new_files["dim_track"])), _CHUNK_ROWS))
+    if new_files.get("fact_playlist_track"):
+        fact = _parquet_source(new_files["fact_playlist_track"])
+        snap.fold_playlists(db.iter_sql_chunks(distinct_playlists_sql(fact), _CHUNK_ROWS))
+        snap.fold_played_tracks(db.iter_sql_chunks(played_track_artists_sql(fact), _CHUNK_ROWS))
+    if any(new_files.values()):
+        snap.updated_at = _now()
+    return True
+
+
+def _exact_pass(snap: StatsSnapshot) -> dict:
+    df = db.execute_sql(stats_sql())
+    row = {k: int(v) for k, v in df.iloc[0].to_dict().items()} if not df.empty else {}
+    top = db.execute_sql(top_artists_sql(10))
+    est = {
+        "tracks": snap.tracks.count(),
+        "playlists": snap.playlists.count(),
+        "artists": snap.artists.count(),
+    }
+    observed = {k: round(abs(est[k] - row[k]) / row[k], 5) if row.get(k) else None for k in est}
+    sketch_top = snap.top_artists(10)["artist_name"].tolist()
+    return {
+        **row,
+        "as_of": snap.updated_at,
+        "computed_at": _now(),
+        "observed_relative_error": observed,
+        "top_artists": top.to_dict(orient="records"),
+        "top10_overlap": len(set(sketch_top) & set(top["artist_name"].tolist())) if not top.empty else None,
+    }
+
+
+_snapshot: Optional[StatsSnapshot] = None
+_snapshot_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+
+
+def get_snapshot() -> Optional[StatsSnapshot]:
+    """In-memory snapshot for the active backend, loaded from disk on first use."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            try:
+                _snapshot = StatsSnapshot.load(stats_dir())
+            except Exception:
+                _snapshot = None
+        snap = _snapshot
+    if snap is None or snap.backend != db.get_backend():
+        return None
+    return snap
+
+
+def refresh(exact: bool = False, full: bool = False) -> StatsSnapshot:
+    """Bring the snapshot up to date (incrementally when possible) and persist it."""
+    global _snapshot
+    with _refresh_lock:
+        backend = db.get_backend()
+        snap = None if full else get_snapshot()
+        current = _local_sources() if backend == "local" else None
+        if snap is None or current is None or not _fold_new_files(snap, current):
+            snap = _build_full(backend)
+        snap.sources = current
+        if exact:
+            snap.exact = _exact_pass(snap)
+        snap.save(stats_dir())
+        with _snapshot_lock:
+            _snapshot = snap
+        return snap
+
+
+def _refresh_due(interval: float) -> bool:
+    """Local snapshots refresh cheaply (only new files are read); warehouse ones when stale."""
+    snap = get_snapshot()
+    if snap is None or db.get_backend() == "local" or not snap.updated_at:
+        return True
+    age = (datetime.now(timezone.utc) - datetime.fromisoformat(snap.updated_at)).total_seconds()
+    return age >= interval
+
+
+def start_background_refresh(interval_s: Optional[float] = None) -> bool:
+    """Refresh now and then every `interval_s` (RECOMMENDER_STATS_REFRESH_S, default 3600) in a daemon thread."""
+    global _refresher
+    interval = float(interval_s or db._get_credential("RECOMMENDER_STATS_REFRESH_S") or 3600)
+    with _snapshot_lock:
+        if _refresher is not None:
+            return False
+
+        def _loop():
+            while True:
+                try:
+                    if _refresh_due(interval):
+                        refresh()
+                except Exception:
+                    pass
+                time.sleep(interval)
+
+        _refresher = threading.Thread(target=_loop, name="recommender-stats-refresh", daemon=True)
+        _refresher.start()
+        return True
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Build or refresh the dataset stats sketch snapshot.")
+    p.add_argument("--full", action="store_true", help="Rebuild from scratch instead of folding in new files.")
+    p.add_argument("--exact", action="store_true", help="Also run the exact COUNT(DISTINCT) queries and report the error.")
+    args = p.parse_args(argv)
+    snap = refresh(exact=args.exact, full=args.full)
+    print(json.dumps(snap.report(), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,26 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FuturesTimeout
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 from typing import List, Optional, Tuple
 
+import db
 from recommender import logic as rlogic
+from recommender import frame_store, profiling, run_store
+from recommender.encoding import (
+    decode_frame,
+    decode_playlist,
+    decode_tracks,
+    encode_frame,
+    encode_playlist,
+    encode_tracks,
+)
 
 
 SESSION_KEYS = {
@@ -14,28 +32,116 @@ SESSION_KEYS = {
     'top_k': 'top_k',
     'seen': 'seen_track_uris',
     'explain_seeds': 'explain_seed_track_uris',
-    'recs': 'recommendations_df',
+    'recs': 'recommendations_key',
+    'served_by': 'served_by',
+    'shown': 'recommendations_shown',
+    'run_id': 'run_id',
 }
 
+# Time budget for one Generate click, in seconds; past it the recommender
+# answers from a cheaper tier (see rlogic.get_recommendations).
+DEFAULT_DEADLINE_S = float(os.environ.get('RECOMMENDER_DEADLINE_S', '20'))
+
+
+# Internally, tracks and playlists are int32 codes (recommender/encoding.py):
+# cached results and session state hold codes, and the getters below decode
+# them for the pages.
+
+
+@st.cache_data(ttl=900, max_entries=4096, show_spinner=False)
+def _cached_playlist_track_codes(playlist_id: str) -> np.ndarray:
+    df = rlogic.fetch_playlist_seed_tracks(playlist_id)
+    if df.empty:
+        return np.zeros(0, dtype=np.int32)
+    return encode_tracks(df['track_uri'])
 
-@st.cache_data(ttl=900, show_spinner=False)
-def _cached_fetch_playlist_seed_tracks(playlist_id: str) -> pd.DataFrame:
-    return rlogic.fetch_playlist_seed_tracks(playlist_id)
 
+# Result frames live in the process-wide, byte-bounded frame store
+# (recommender/frame_store.py) as Arrow IPC, not in st.cache_data or as
+# DataFrames in session_state. A session keeps only the key of its run.
+_RECS_NS = 'recommendations'
+_SESSION_RECS_NS = 'session_recs'
+_RECS_TTL_S = 900
 
-@st.cache_data(ttl=900, show_spinner=False)
-def _cached_get_recommendations(
-    seed_track_uris: Tuple[str, ...],
+
+def _get_recommendations_within(
+    deadline: Optional[float],
+    seed_track_codes: Tuple[int, ...],
     playlist_id: Optional[str],
     model: str,
     top_k: int,
 ) -> pd.DataFrame:
-    return rlogic.get_recommendations(
-        seed_track_ids=list(seed_track_uris) if seed_track_uris else None,
+    key = (seed_track_codes, playlist_id, (model or '').lower(), int(top_k))
+    cached = frame_store.STORE.get(_RECS_NS, key)
+    if cached is not None:
+        return cached
+    recs = rlogic.get_recommendations(
+        seed_track_ids=decode_tracks(seed_track_codes) if seed_track_codes else None,
         playlist_id=playlist_id or None,
         model=(model or '').lower(),
         top_k=int(top_k),
+        deadline=deadline,
     )
+    served_by = recs.attrs.get('served_by', rlogic.SERVED_EXACT)
+    out = encode_frame(recs)
+    out.attrs['served_by'] = served_by
+    # Fallback results are not shared: the next click should try for an exact one.
+    if served_by == rlogic.SERVED_EXACT:
+        frame_store.STORE.put(_RECS_NS, key, out, ttl_s=_RECS_TTL_S)
+    return out
+
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except Exception:  # pragma: no cover
+    add_script_run_ctx = get_script_run_ctx = None
+
+
+def _with_script_ctx(fn):
+    # Let cached functions called from the worker thread see this session's context.
+    ctx = get_script_run_ctx() if get_script_run_ctx is not None else None
+    if ctx is None:
+        return fn
+
+    def _wrapped(*args, **kwargs):
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            add_script_run_ctx(thread, None)
+
+    return _wrapped
+
+
+def run_superseding(slot: str, fn, *args, poll_seconds: float = 0.1, **kwargs):
+    """Run `fn` off the script thread; newer work in the same slot cancels it.
+
+    While waiting, the script thread pings a placeholder every `poll_seconds`.
+    That is a Streamlit yield point, so a rerun triggered by the user (edited
+    search box, another Generate click) interrupts the wait, and the abandoned
+    backend query is cancelled instead of running to completion.
+    """
+    key = f"_inflight__{slot}"
+    prev = st.session_state.get(key)
+    if prev is not None and not prev.done():
+        prev.cancel()
+
+    handle = db.submit(_with_script_ctx(fn), *args, **kwargs)
+    st.session_state[key] = handle
+    placeholder = st.empty()
+    try:
+        while True:
+            try:
+                return handle.result(timeout=poll_seconds)
+            except FuturesTimeout:
+                placeholder.empty()
+    except BaseException:
+        handle.cancel()
+        raise
+    finally:
+        if st.session_state.get(key) is handle:
+            del st.session_state[key]
 
 
 def save_inputs_to_session(
@@ -46,23 +152,35 @@ def save_inputs_to_session(
     model: str,
     top_k: int,
 ):
-    st.session_state[SESSION_KEYS['seeds']] = seed_track_uris or []
-    st.session_state[SESSION_KEYS['playlist_id']] = playlist_id
+    st.session_state[SESSION_KEYS['seeds']] = encode_tracks(seed_track_uris or [])
+    st.session_state[SESSION_KEYS['playlist_id']] = encode_playlist(playlist_id) if playlist_id else None
     st.session_state[SESSION_KEYS['playlist_name']] = playlist_name
     st.session_state[SESSION_KEYS['seed_mode']] = seed_mode
     st.session_state[SESSION_KEYS['model']] = model
     st.session_state[SESSION_KEYS['top_k']] = int(top_k)
 
     # Clear any previous run outputs.
-    for k in (SESSION_KEYS['seen'], SESSION_KEYS['explain_seeds'], SESSION_KEYS['recs']):
+    if st.session_state.get(SESSION_KEYS['recs']) is not None:
+        frame_store.STORE.discard(_SESSION_RECS_NS, st.session_state[SESSION_KEYS['recs']])
+    for k in (SESSION_KEYS['seen'], SESSION_KEYS['explain_seeds'], SESSION_KEYS['recs'], SESSION_KEYS['served_by'],
+              SESSION_KEYS['shown'], SESSION_KEYS['run_id']):
         if k in st.session_state:
             del st.session_state[k]
 
 
+def _session_seed_codes() -> np.ndarray:
+    return np.asarray(st.session_state.get(SESSION_KEYS['seeds'], []), dtype=np.int32)
+
+
+def _session_playlist_id() -> Optional[str]:
+    code = st.session_state.get(SESSION_KEYS['playlist_id'], None)
+    return decode_playlist(code) if code is not None else None
+
+
 def load_inputs_from_session() -> Tuple[List[str], Optional[str], Optional[str], str, str, int]:
     return (
-        st.session_state.get(SESSION_KEYS['seeds'], []),
-        st.session_state.get(SESSION_KEYS['playlist_id'], None),
+        decode_tracks(_session_seed_codes()),
+        _session_playlist_id(),
         st.session_state.get(SESSION_KEYS['playlist_name'], None),
         st.session_state.get(SESSION_KEYS['seed_mode'], 'Track name'),
         st.session_state.get(SESSION_KEYS['model'], 'Co-occurrence'),
@@ -76,57 +194,214 @@ def clear_session_inputs():
             del st.session_state[k]
 
 
-def run_recommender_and_store(max_explain_seeds: int = 8):
-    seed_track_uris, playlist_id, _, _, model, top_k = load_inputs_from_session()
+def run_recommender_and_store(max_explain_seeds: Optional[int] = None, deadline_s: Optional[float] = None):
+    _, _, _, _, model, top_k = load_inputs_from_session()
+    budget = DEFAULT_DEADLINE_S if deadline_s is None else float(deadline_s)
+    deadline = time.monotonic() + budget if budget > 0 else None
+    seed_codes = _session_seed_codes()
+    playlist_id = _session_playlist_id()
 
     # Resolve "seen" tracks so we can guarantee they never appear in results.
-    seen: set[str] = set([str(u) for u in (seed_track_uris or [])])
-    explain_seeds: List[str] = []
+    # Sorted unique codes: membership is a vectorized np.isin.
+    seen = np.unique(seed_codes)
 
     if playlist_id:
-        seeds_df = _cached_fetch_playlist_seed_tracks(playlist_id)
-        playlist_tracks = seeds_df['track_uri'].astype(str).tolist() if not seeds_df.empty else []
-        seen.update(playlist_tracks)
-        explain_seeds = playlist_tracks[:max_explain_seeds]
+        playlist_codes = run_superseding('playlist_tracks', _cached_playlist_track_codes, playlist_id)
+        seen = np.union1d(seen, playlist_codes)
+        explain_seeds = playlist_codes[:max_explain_seeds]
     else:
-        explain_seeds = [str(u) for u in (seed_track_uris or [])][:max_explain_seeds]
-
-    recs = _cached_get_recommendations(
-        seed_track_uris=tuple([str(u) for u in (seed_track_uris or [])]),
+        explain_seeds = seed_codes[:max_explain_seeds]
+    # Explanations are computed locally from posting lists, so by default the
+    # whole seed set is explained (max_explain_seeds=None).
+
+    # Retain a ranked pool larger than one page so "show more" needs no recompute.
+    # Over-fetching by the seen count keeps the pool full after exclusion, and a
+    # pool size independent of the slider keeps the cache key stable across top_k.
+    pool_size = max(rlogic.RANKED_POOL_SIZE, int(top_k))
+    recs = run_superseding(
+        'recommend',
+        _get_recommendations_within,
+        deadline,
+        # Canonical seed set: order and duplicates do not change the cache key.
+        seed_track_codes=tuple(int(c) for c in np.unique(seed_codes)),
         playlist_id=playlist_id or None,
         model=model,
-        top_k=int(top_k),
+        top_k=pool_size + len(seen),
+    )
+
+    st.session_state[SESSION_KEYS['seen']] = seen.astype(np.int32)
+    st.session_state[SESSION_KEYS['explain_seeds']] = np.asarray(explain_seeds, dtype=np.int32)
+    st.session_state[SESSION_KEYS['served_by']] = (
+        recs.attrs.get('served_by', rlogic.SERVED_EXACT) if recs is not None else rlogic.SERVED_EXACT
     )
 
     if recs is None or recs.empty:
-        st.session_state[SESSION_KEYS['recs']] = pd.DataFrame()
-        st.session_state[SESSION_KEYS['seen']] = list(seen)
-        st.session_state[SESSION_KEYS['explain_seeds']] = explain_seeds
+        _store_session_recs(pd.DataFrame())
         return
 
     # Defensive filtering: exclude any already-seen tracks.
-    recs = recs[~recs['track_uri'].astype(str).isin(seen)].copy()
-    recs = recs.reset_index(drop=True)
-    recs['rank'] = range(1, len(recs) + 1)
-
-    st.session_state[SESSION_KEYS['recs']] = recs
-    st.session_state[SESSION_KEYS['seen']] = list(seen)
-    st.session_state[SESSION_KEYS['explain_seeds']] = explain_seeds
+    recs = recs[~np.isin(recs['track_code'].to_numpy(), seen)].head(pool_size).reset_index(drop=True)
+    recs['rank'] = np.arange(1, len(recs) + 1, dtype=np.int32)
+
+    _store_session_recs(recs)
+    st.session_state[SESSION_KEYS['shown']] = int(top_k)
+    _persist_run(recs)
+
+
+# Runs are also persisted (recommender/run_store.py) under a content-addressed
+# ID that pages 2-4 carry as ?run=, so a reload, new tab or shared link is
+# served from disk instead of regenerating.
+
+def _persist_run(recs: pd.DataFrame):
+    seeds, playlist_id, playlist_name, seed_mode, model, top_k = load_inputs_from_session()
+    inputs = {
+        'seed_track_uris': seeds,
+        'playlist_id': playlist_id,
+        'playlist_name': playlist_name,
+        'seed_mode': seed_mode,
+        'model': model,
+        'top_k': int(top_k),
+    }
+    state = {
+        'seen_track_uris': get_seen_track_uris(),
+        'explain_seed_track_uris': get_explain_seed_track_uris(),
+        'served_by': get_served_by(),
+    }
+    try:
+        st.session_state[SESSION_KEYS['run_id']] = run_store.save_run(inputs, decode_frame(recs), state)
+    except OSError:
+        # The session still works without a shareable run.
+        st.session_state[SESSION_KEYS['run_id']] = None
+
+
+def _hydrate_run(run: dict):
+    inputs, state = run['inputs'], run['state']
+    save_inputs_to_session(
+        seed_track_uris=inputs['seed_track_uris'],
+        playlist_id=inputs['playlist_id'],
+        playlist_name=inputs['playlist_name'],
+        seed_mode=inputs['seed_mode'],
+        model=inputs['model'],
+        top_k=inputs['top_k'],
+    )
+    st.session_state[SESSION_KEYS['seen']] = encode_tracks(state['seen_track_uris'])
+    st.session_state[SESSION_KEYS['explain_seeds']] = encode_tracks(state['explain_seed_track_uris'])
+    st.session_state[SESSION_KEYS['served_by']] = state['served_by']
+    _store_session_recs(encode_frame(run['pool']))
+    st.session_state[SESSION_KEYS['shown']] = min(int(inputs['top_k']), len(run['pool']))
+    st.session_state[SESSION_KEYS['run_id']] = run['run_id']
+
+
+def hydrate_run_from_url() -> Optional[str]:
+    """Load the run named by ?run= into this session, or put this session's run in the URL.
+
+    Returns the session's run ID (None if it has no persisted run).
+    """
+    requested = st.query_params.get('run')
+    current = st.session_state.get(SESSION_KEYS['run_id'])
+    if requested and requested != current:
+        run = run_store.load_run(requested)
+        if run is None:
+            st.warning(f"Run `{requested}` was not found in the run store.")
+        else:
+            _hydrate_run(run)
+            current = requested
+    if current and requested != current:
+        st.query_params['run'] = current
+    return current
+
+
+def run_signal(name: str, fn, *args):
+    """`fn(*args)` for this session's run, saved with the run so revisits and shared links reuse it."""
+    run_id = st.session_state.get(SESSION_KEYS['run_id'])
+    if not run_id:
+        return fn(*args)
+    cached = run_store.get_signal(run_id, name, args)
+    if cached is not None:
+        return cached
+    out = fn(*args)
+    if isinstance(out, pd.DataFrame):
+        run_store.put_signal(run_id, name, args, out)
+    return out
+
+
+def _store_session_recs(recs: pd.DataFrame):
+    prev = st.session_state.get(SESSION_KEYS['recs'])
+    if prev is not None:
+        frame_store.STORE.discard(_SESSION_RECS_NS, prev)
+    key = uuid.uuid4().hex
+    frame_store.STORE.put(_SESSION_RECS_NS, key, recs)
+    st.session_state[SESSION_KEYS['recs']] = key
+
+
+def _session_recs() -> Optional[pd.DataFrame]:
+    """This session's ranked pool (encoded), reloaded from the run store or recomputed if evicted."""
+    key = st.session_state.get(SESSION_KEYS['recs'])
+    if key is None:
+        return None
+    df = frame_store.STORE.get(_SESSION_RECS_NS, key)
+    if df is None and st.session_state.get(SESSION_KEYS['run_id']):
+        run = run_store.load_run(st.session_state[SESSION_KEYS['run_id']])
+        if run is not None:
+            df = encode_frame(run['pool'])
+            frame_store.STORE.put(_SESSION_RECS_NS, key, df)
+    if df is None and (len(_session_seed_codes()) or _session_playlist_id()):
+        shown = st.session_state.get(SESSION_KEYS['shown'])
+        run_recommender_and_store()
+        if shown is not None:
+            st.session_state[SESSION_KEYS['shown']] = shown
+        df = frame_store.STORE.get(_SESSION_RECS_NS, st.session_state.get(SESSION_KEYS['recs']))
+    return df
 
 
 def get_cached_recommendations() -> pd.DataFrame:
-    df = st.session_state.get(SESSION_KEYS['recs'], None)
+    """The recommendations shown so far (first page plus any "show more")."""
+    df = _session_recs()
     if df is None:
         return pd.DataFrame()
-    return df
+    shown = int(st.session_state.get(SESSION_KEYS['shown'], len(df)))
+    return decode_frame(df.head(shown))
+
+
+def get_ranked_pool_size() -> int:
+    key = st.session_state.get(SESSION_KEYS['recs'])
+    if key is None:
+        return 0
+    n = frame_store.STORE.rows(_SESSION_RECS_NS, key)
+    if n is not None:
+        return n
+    df = _session_recs()
+    return 0 if df is None else len(df)
+
+
+def show_more_recommendations(n: int) -> int:
+    """Reveal the next `n` ranked candidates from the retained pool; returns the new count."""
+    shown = int(st.session_state.get(SESSION_KEYS['shown'], 0)) + int(n)
+    shown = min(shown, get_ranked_pool_size())
+    st.session_state[SESSION_KEYS['shown']] = shown
+    return shown
+
+
+def get_served_by() -> str:
+    """Which tier answered the last run: 'exact', 'cache', 'popularity_head' or 'partial'."""
+    return st.session_state.get(SESSION_KEYS['served_by'], rlogic.SERVED_EXACT)
+
+
+def get_run_id() -> Optional[str]:
+    """ID of this session's persisted run (pages 2-4 open it with ?run=)."""
+    return st.session_state.get(SESSION_KEYS['run_id'])
+
+
+def get_seen_count() -> int:
+    return len(st.session_state.get(SESSION_KEYS['seen'], []))
 
 
 def get_seen_track_uris() -> List[str]:
-    return st.session_state.get(SESSION_KEYS['seen'], [])
+    return decode_tracks(st.session_state.get(SESSION_KEYS['seen'], []))
 
 
 def get_explain_seed_track_uris() -> List[str]:
-    return st.session_state.get(SESSION_KEYS['explain_seeds'], [])
+    return decode_tracks(st.session_state.get(SESSION_KEYS['explain_seeds'], []))
 
 
 def generate_recommendations(seed_track_uris: List[str], playlist_id: Optional[str], model: str, top_k: int) -> pd.DataFrame:
@@ -156,3 +431,49 @@ def cooccurrence_matrix(seed_track_uris: List[str], neighbor_k: int = 50) -> pd.
     if not rows:
         return pd.DataFrame()
     return pd.DataFrame(rows)
+
+
+def profile_page(page_file: str, name: str):
+    """Profile this page run when enabled (RECOMMENDER_PROFILE=1 or ?profile=1) and show the last profile.
+
+    The current run is still in progress while the page renders, so the sidebar
+    shows the most recent completed run of the same page.
+    """
+    if not profiling.enabled(st.query_params):
+        return
+    profiling.instrument(rlogic)
+    profiling.start_page(name, page_file, {'model': st.session_state.get(SESSION_KEYS['model'])})
+
+    with st.sidebar.expander("Profile (last run of this page)", expanded=False):
+        runs = profiling.recent(name)
+        if not runs:
+            st.caption("No completed run yet; rerun the page.")
+            return
+        r = runs[0]
+        backend_pct = 100.0 * r['backend_samples'] / max(r['samples'], 1)
+        st.caption(
+            f"{r['started_at']} — {r['duration_s']:.2f}s, {r['samples']} samples, "
+            f"{backend_pct:.0f}% waiting on the backend"
+        )
+        st.dataframe(profiling.hotspots(r, 15), width="stretch", hide_index=True)
+        spans = profiling.span_summary(r)
+        if not spans.empty:
+            st.dataframe(spans, width="stretch", hide_index=True)
+        st.download_button(
+            "speedscope JSON", json.dumps(profiling.to_speedscope(r)),
+            file_name=f"profile_{r['id'][:8]}.speedscope.json", mime="application/json",
+        )
+        st.download_button(
+            "Collapsed stacks", profiling.to_collapsed(r),
+            file_name=f"profile_{r['id'][:8]}.folded", mime="text/plain",
+        )
+
+
+def cache_memory_report() -> dict:
+    """What the process-level caches hold, for the Metrics page."""
+    pop = rlogic.popularity
+    return {
+        'frame_store': frame_store.stats(),
+        'seed_cache': rlogic.seed_cache.cache_stats(),
+        'popularity_table_bytes': int(pop.get_table().popularity.nbytes) if pop.loaded() else 0,
+    }
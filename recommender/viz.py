@@ -1,24 +1,60 @@
 from __future__ import annotations
 
+import hashlib
+import importlib
+import json
 import math
-from typing import Dict, Iterable, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
 
-import altair as alt
+import numpy as np
 import pandas as pd
 
-try:
-    import networkx as nx
-except Exception:  # pragma: no cover
-    nx = None
+# altair, networkx and plotly are imported on first use: they dominate import
+# time, and pages that never draw a chart should not pay for them.
+_MISSING = object()
+_modules: Dict[str, object] = {}
+_modules_lock = threading.Lock()
 
-try:
-    import plotly.graph_objects as go
-except Exception:  # pragma: no cover
-    go = None
+
+def _optional_module(name: str):
+    mod = _modules.get(name, _MISSING)
+    if mod is _MISSING:
+        with _modules_lock:
+            mod = _modules.get(name, _MISSING)
+            if mod is _MISSING:
+                try:
+                    mod = importlib.import_module(name)
+                except Exception:  # pragma: no cover
+                    mod = None
+                _modules[name] = mod
+    return mod
+
+
+def _alt():
+    alt = _optional_module("altair")
+    if alt is None:
+        raise RuntimeError("altair is not installed.")
+    return alt
+
+
+def _nx():
+    return _optional_module("networkx")
+
+
+def _go():
+    return _optional_module("plotly.graph_objects")
+
+
+def preload_deps():
+    """Import the chart libraries now (e.g. from a background warm-up thread)."""
+    for name in ("altair", "networkx", "plotly.graph_objects"):
+        _optional_module(name)
 
 
 def network_deps_available() -> bool:
-    return (nx is not None) and (go is not None)
+    return (_nx() is not None) and (_go() is not None)
 
 
 def network_deps_hint() -> str:
@@ -31,6 +67,85 @@ def network_deps_hint() -> str:
     )
 
 
+# Default upper bound for the inline data embedded in a heatmap spec.
+HEATMAP_MAX_PAYLOAD_BYTES = 250_000
+
+
+def _keep_top(labels: pd.Series, mass: pd.Series, n: int, other_label: str) -> Tuple[pd.Series, list]:
+    """Map labels outside the top-`n` by mass to a single "other" bucket.
+
+    Returns (mapped labels, ordered label list) with the list ordered by mass.
+    """
+    order = mass.sort_values(ascending=False, kind="stable")
+    if len(order) <= n:
+        return labels, order.index.tolist()
+    keep = order.index[: max(n - 1, 1)]
+    n_other = len(order) - len(keep)
+    other = f"{other_label} ({n_other})"
+    mapped = labels.where(labels.isin(keep), other)
+    return mapped, keep.tolist() + [other]
+
+
+def compact_heatmap_data(
+    df_long: pd.DataFrame,
+    x: str,
+    y: str,
+    value: str,
+    max_rows: int = 40,
+    max_cols: int = 40,
+    bins: Optional[int] = None,
+    other_label: str = "Other",
+    drop_zeros: bool = True,
+    max_payload_bytes: int = HEATMAP_MAX_PAYLOAD_BYTES,
+) -> Tuple[pd.DataFrame, list, list]:
+    """Aggregate a long-format matrix into a bounded, integer-coded payload.
+
+    Rows/columns beyond the top-N by total value are folded into an "other"
+    bucket, and values can be quantized into `bins` equal-width bins. The result
+    has columns `xi`, `yi`, `v` (codes into the returned x/y label lists), and
+    N is shrunk until the JSON estimate fits `max_payload_bytes`.
+    """
+    d = pd.DataFrame(
+        {
+            "x": df_long[x].astype(str),
+            "y": df_long[y].astype(str),
+            "v": pd.to_numeric(df_long[value], errors="coerce").fillna(0),
+        }
+    )
+    d = d.groupby(["x", "y"], as_index=False, sort=False)["v"].sum()
+    x_mass = d.groupby("x", sort=False)["v"].sum()
+    y_mass = d.groupby("y", sort=False)["v"].sum()
+
+    n_rows, n_cols = max(int(max_rows), 1), max(int(max_cols), 1)
+    while True:
+        xs, x_labels = _keep_top(d["x"], x_mass, n_cols, other_label)
+        ys, y_labels = _keep_top(d["y"], y_mass, n_rows, other_label)
+        out = pd.DataFrame({"x": xs, "y": ys, "v": d["v"]}).groupby(["x", "y"], as_index=False, sort=False)["v"].sum()
+        if drop_zeros:
+            out = out[out["v"] != 0]
+        out = pd.DataFrame(
+            {
+                "xi": pd.Categorical(out["x"], categories=x_labels).codes.astype("int32"),
+                "yi": pd.Categorical(out["y"], categories=y_labels).codes.astype("int32"),
+                "v": out["v"].to_numpy(),
+            }
+        )
+        if bins and len(out):
+            lo, hi = float(out["v"].min()), float(out["v"].max())
+            width = (hi - lo) / int(bins) or 1.0
+            idx = np.minimum(((out["v"] - lo) // width).astype(int), int(bins) - 1)
+            out["v"] = np.round(lo + (idx + 0.5) * width, 2)
+        if pd.api.types.is_float_dtype(out["v"]) and (out["v"] % 1 == 0).all():
+            out["v"] = out["v"].astype("int64")
+
+        # ~ {"xi":12,"yi":34,"v":5678}, per row, plus the label dictionaries.
+        est = len(out) * 32 + sum(len(l) + 3 for l in x_labels) + sum(len(l) + 3 for l in y_labels)
+        if est <= max_payload_bytes or (n_rows <= 2 and n_cols <= 2):
+            return out.reset_index(drop=True), x_labels, y_labels
+        n_rows = max(2, int(n_rows * 0.75))
+        n_cols = max(2, int(n_cols * 0.75))
+
+
 def heatmap_rect(
     df_long: pd.DataFrame,
     x: str,
@@ -38,16 +153,48 @@ def heatmap_rect(
     value: str,
     title: str,
     height: int = 420,
+    max_rows: int = 40,
+    max_cols: int = 40,
+    bins: Optional[int] = None,
+    other_label: str = "Other",
+    max_payload_bytes: int = HEATMAP_MAX_PAYLOAD_BYTES,
 ):
+    """Rect heatmap whose embedded data stays bounded as the matrix grows.
+
+    The spec carries integer codes plus one copy of each label; labels are
+    resolved client-side, so payload size scales with non-zero cells, not text.
+    """
     if df_long is None or df_long.empty:
         return None
 
+    data, x_labels, y_labels = compact_heatmap_data(
+        df_long,
+        x,
+        y,
+        value,
+        max_rows=max_rows,
+        max_cols=max_cols,
+        bins=bins,
+        other_label=other_label,
+        max_payload_bytes=max_payload_bytes,
+    )
+    if data.empty:
+        return None
+
+    alt = _alt()
     chart = (
-        alt.Chart(df_long)
+        alt.Chart(data)
+        .transform_calculate(
+            **{
+                x: f"{json.dumps(x_labels)}[datum.xi]",
+                y: f"{json.dumps(y_labels)}[datum.yi]",
+                value: "datum.v",
+            }
+        )
         .mark_rect()
         .encode(
-            x=alt.X(f"{x}:N", title=None),
-            y=alt.Y(f"{y}:N", title=None, sort='-x'),
+            x=alt.X(f"{x}:N", title=None, sort=alt.EncodingSortField(field="xi", op="min")),
+            y=alt.Y(f"{y}:N", title=None, sort=alt.EncodingSortField(field="yi", op="min")),
             color=alt.Color(f"{value}:Q", title="Shared playlists"),
             tooltip=[alt.Tooltip(f"{x}:N"), alt.Tooltip(f"{y}:N"), alt.Tooltip(f"{value}:Q")],
         )
@@ -56,6 +203,106 @@ def heatmap_rect(
     return chart
 
 
+def score_bar(df: pd.DataFrame, label: str, value: str, x_title: str, tooltip: Iterable[str], height: int = 460):
+    """Horizontal bars of `value` per `label`, largest first."""
+    alt = _alt()
+    return (
+        alt.Chart(df)
+        .mark_bar()
+        .encode(
+            y=alt.Y(f"{label}:N", sort='-x', title=None),
+            x=alt.X(f"{value}:Q", title=x_title),
+            tooltip=list(tooltip),
+        )
+        .properties(height=height)
+    )
+
+
+# Layout cache shared across Streamlit reruns/sessions in this process.
+# Keyed by a fingerprint of the graph (node ids + weighted edges).
+_LAYOUT_CACHE: "OrderedDict[str, Dict[str, Tuple[float, float]]]" = OrderedDict()
+_LAYOUT_CACHE_MAX = 64
+_LAYOUT_LOCK = threading.Lock()
+
+# Above this many edges, render with WebGL (Scattergl) instead of SVG.
+WEBGL_EDGE_THRESHOLD = 1000
+
+
+def graph_fingerprint(node_ids: np.ndarray, src: np.ndarray, dst: np.ndarray, weight: np.ndarray) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(np.sort(node_ids.astype(str))).encode("utf-8"))
+    order = np.lexsort((dst, src))
+    h.update("\x1f".join(src[order]).encode("utf-8"))
+    h.update("\x1f".join(dst[order]).encode("utf-8"))
+    h.update(np.ascontiguousarray(weight[order], dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _warm_start_positions(node_ids: np.ndarray) -> Optional[Dict[str, Tuple[float, float]]]:
+    """Initial positions from the cached layout sharing the most nodes, if any."""
+    wanted = set(node_ids.tolist())
+    best, best_overlap = None, 0
+    with _LAYOUT_LOCK:
+        for cached in reversed(_LAYOUT_CACHE.values()):
+            overlap = len(wanted.intersection(cached))
+            if overlap > best_overlap:
+                best, best_overlap = cached, overlap
+    if best is None or best_overlap < max(2, len(wanted) // 2):
+        return None
+    known = {n: best[n] for n in wanted if n in best}
+    cx = float(np.mean([p[0] for p in known.values()]))
+    cy = float(np.mean([p[1] for p in known.values()]))
+    rng = np.random.default_rng(7)
+    for n in wanted - set(known):
+        known[n] = (cx + rng.normal(scale=0.1), cy + rng.normal(scale=0.1))
+    return known
+
+
+def cached_spring_layout(
+    node_ids: np.ndarray,
+    src: np.ndarray,
+    dst: np.ndarray,
+    weight: np.ndarray,
+    warm_start: bool = True,
+) -> Dict[str, Tuple[float, float]]:
+    """Spring layout cached by graph fingerprint.
+
+    On a cache miss, a previous layout covering most of the same nodes seeds the
+    positions, so a small change in candidates needs only a few refinement
+    iterations instead of a full layout.
+    """
+    key = graph_fingerprint(node_ids, src, dst, weight)
+    with _LAYOUT_LOCK:
+        pos = _LAYOUT_CACHE.get(key)
+        if pos is not None:
+            _LAYOUT_CACHE.move_to_end(key)
+            return pos
+
+    nx = _nx()
+    g = nx.Graph()
+    g.add_nodes_from(node_ids.tolist())
+    g.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), weight.tolist()))
+
+    init = _warm_start_positions(node_ids) if warm_start else None
+    k = 0.85 / math.sqrt(max(g.number_of_nodes(), 1))
+    if init is not None:
+        raw = nx.spring_layout(g, pos=init, seed=7, k=k, iterations=15)
+    else:
+        raw = nx.spring_layout(g, seed=7, k=k)
+    pos = {n: (float(p[0]), float(p[1])) for n, p in raw.items()}
+
+    with _LAYOUT_LOCK:
+        _LAYOUT_CACHE[key] = pos
+        _LAYOUT_CACHE.move_to_end(key)
+        while len(_LAYOUT_CACHE) > _LAYOUT_CACHE_MAX:
+            _LAYOUT_CACHE.popitem(last=False)
+    return pos
+
+
+def _truncate_labels(labels: pd.Series, n: int = 26) -> pd.Series:
+    return labels.where(labels.str.len() <= n, labels.str.slice(0, n - 3) + "…")
+
+
 def network_figure(
     nodes: pd.DataFrame,
     edges: pd.DataFrame,
@@ -67,8 +314,10 @@ def network_figure(
     weight_col: str = "weight",
     title: str = "Relationship network",
     max_edges: int = 120,
+    warm_start: bool = True,
 ):
-    if nx is None or go is None:
+    go = _go()
+    if not network_deps_available():
         # Optional dependency: allow the rest of the explanation page (heatmaps/tables)
         # to work even if the environment doesn't have graph libs installed.
         return None
@@ -76,52 +325,62 @@ def network_figure(
     if nodes is None or nodes.empty or edges is None or edges.empty:
         return None
 
-    edges = edges.copy()
-    edges[weight_col] = pd.to_numeric(edges[weight_col], errors="coerce").fillna(0)
-    edges = edges.sort_values(weight_col, ascending=False).head(int(max_edges))
+    # Nodes: one row per id, labels/groups as plain strings.
+    node_df = pd.DataFrame({"id": nodes[node_id_col].astype(str)})
+    node_df["label"] = nodes[node_label_col].astype(str) if node_label_col in nodes else node_df["id"]
+    node_df["group"] = nodes[node_group_col].astype(str) if node_group_col in nodes else ""
+    node_df = node_df.drop_duplicates("id", keep="last").reset_index(drop=True)
 
-    g = nx.Graph()
-
-    for _, r in nodes.iterrows():
-        g.add_node(str(r[node_id_col]), label=str(r.get(node_label_col, r[node_id_col])), group=str(r.get(node_group_col, "")))
-
-    for _, r in edges.iterrows():
-        s = str(r[src_col])
-        t = str(r[dst_col])
-        w = float(r.get(weight_col, 0))
-        if w <= 0:
-            continue
-        if s not in g.nodes or t not in g.nodes:
-            continue
-        g.add_edge(s, t, weight=w)
+    # Edges: strongest first, positive weight, both endpoints known, one per unordered pair.
+    e = pd.DataFrame(
+        {
+            "src": edges[src_col].astype(str),
+            "dst": edges[dst_col].astype(str),
+            "weight": pd.to_numeric(edges[weight_col], errors="coerce").fillna(0).astype(float),
+        }
+    )
+    e = e.sort_values("weight", ascending=False, kind="stable").head(int(max_edges))
+    known = node_df["id"]
+    e = e[(e["weight"] > 0) & e["src"].isin(known) & e["dst"].isin(known) & (e["src"] != e["dst"])]
+    s_arr = e["src"].to_numpy(dtype=object)
+    d_arr = e["dst"].to_numpy(dtype=object)
+    swap = s_arr > d_arr
+    pair = pd.DataFrame({"lo": np.where(swap, d_arr, s_arr), "hi": np.where(swap, s_arr, d_arr)})
+    e = e[~pair.duplicated().to_numpy()].reset_index(drop=True)
 
-    if g.number_of_edges() == 0:
+    if e.empty:
         return None
 
-    pos = nx.spring_layout(g, seed=7, k=0.85 / math.sqrt(max(g.number_of_nodes(), 1)))
-
-    # Edge traces
-    edge_x = []
-    edge_y = []
-    edge_text = []
-    edge_width = []
+    pos = cached_spring_layout(
+        node_df["id"].to_numpy(),
+        e["src"].to_numpy(),
+        e["dst"].to_numpy(),
+        e["weight"].to_numpy(),
+        warm_start=warm_start,
+    )
+    xy = np.array([pos[n] for n in node_df["id"]], dtype=float)
+    node_df["x"] = xy[:, 0]
+    node_df["y"] = xy[:, 1]
 
-    for u, v, data in g.edges(data=True):
-        x0, y0 = pos[u]
-        x1, y1 = pos[v]
-        edge_x += [x0, x1, None]
-        edge_y += [y0, y1, None]
-        w = float(data.get("weight", 1.0))
-        edge_text.append(f"{g.nodes[u]['label']} ↔ {g.nodes[v]['label']}\nShared playlists: {int(w)}")
-        edge_width.append(w)
+    # Edge trace: one polyline with NaN breaks, built with array ops.
+    idx = pd.Index(node_df["id"])
+    si = idx.get_indexer(e["src"])
+    di = idx.get_indexer(e["dst"])
+    gap = np.full(len(e), np.nan)
+    edge_x = np.column_stack([xy[si, 0], xy[di, 0], gap]).ravel()
+    edge_y = np.column_stack([xy[si, 1], xy[di, 1], gap]).ravel()
+    labels = node_df["label"].to_numpy()
+    edge_text = (
+        pd.Series(labels[si]) + " ↔ " + pd.Series(labels[di])
+        + "\nShared playlists: " + e["weight"].astype(int).astype(str)
+    ).to_numpy()
+    edge_text = np.repeat(edge_text, 3)
 
-    # Normalize width a bit
-    w_max = max(edge_width) if edge_width else 1.0
-    width_scaled = [1 + 5 * (w / w_max) for w in edge_width]
+    scatter = go.Scattergl if len(e) > WEBGL_EDGE_THRESHOLD else go.Scatter
 
     # Plotly needs a single width, so approximate by duplicating edges per segment not worth it.
     # Keep constant line width + show weight in hover; readability stays fine.
-    edge_trace = go.Scatter(
+    edge_trace = scatter(
         x=edge_x,
         y=edge_y,
         line=dict(width=1, color="#888"),
@@ -132,36 +391,19 @@ def network_figure(
     )
 
     # Node traces (split by group for color)
-    groups = list(dict.fromkeys([str(g.nodes[n].get("group", "")) for n in g.nodes]))
     palette = ["#1DB954", "#3B82F6", "#F59E0B", "#EF4444", "#A855F7", "#14B8A6"]
-    group_to_color = {grp: palette[i % len(palette)] for i, grp in enumerate(groups)}
-
     node_traces = []
-    for grp in groups:
-        xs = []
-        ys = []
-        texts = []
-        labels = []
-        for n in g.nodes:
-            if str(g.nodes[n].get("group", "")) != grp:
-                continue
-            x, y = pos[n]
-            xs.append(x)
-            ys.append(y)
-            label = str(g.nodes[n].get("label", n))
-            labels.append(label)
-            texts.append(label)
-
+    for i, (grp, part) in enumerate(node_df.groupby("group", sort=False)):
         node_traces.append(
-            go.Scatter(
-                x=xs,
-                y=ys,
+            scatter(
+                x=part["x"].to_numpy(),
+                y=part["y"].to_numpy(),
                 mode="markers+text",
-                text=[l if len(l) <= 26 else (l[:23] + "…") for l in labels],
+                text=_truncate_labels(part["label"]).tolist(),
                 textposition="top center",
                 hoverinfo="text",
-                hovertext=texts,
-                marker=dict(size=12, color=group_to_color.get(grp, "#999"), line=dict(width=1, color="#111")),
+                hovertext=part["label"].tolist(),
+                marker=dict(size=12, color=palette[i % len(palette)], line=dict(width=1, color="#111")),
                 name=grp or "Nodes",
             )
         )
@@ -0,0 +1,173 @@
+"""Background warm-up at process start, with measurable startup phases.
+
+The first request after a deploy used to pay for module imports, connection
+setup, the preflight check, the gold-table probe and the popularity query.
+`start_warmup()` runs those once per process in a daemon thread; each phase is
+timed, and `startup_report()` exposes the timings plus time-to-first-interactive.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Wall-clock reference for time-to-first-interactive: the first import of this
+# module, which app.py does before anything heavy.
+PROCESS_STARTED_AT = time.time()
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_phases: Dict[str, dict] = {}
+_interactive_at: Optional[float] = None
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Record the duration and outcome of a startup phase."""
+    started = time.perf_counter()
+    entry = {"status": "running", "started_s": round(time.time() - PROCESS_STARTED_AT, 3)}
+    with _lock:
+        _phases[name] = entry
+    try:
+        yield
+        entry["status"] = "ok"
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = str(e)
+    finally:
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+
+
+def _phase_imports():
+    import db
+    from recommender import viz
+
+    db.preload_modules()
+    viz.preload_deps()
+
+
+def _phase_connect():
+    import db
+
+    if db.get_backend() == "local":
+        db.get_local_connection()
+    else:
+        db.get_connection()
+
+
+def _phase_preflight():
+    import db
+
+    ok, msg = db.databricks_preflight(timeout_seconds=3.0)
+    if not ok:
+        raise RuntimeError(msg)
+
+
+def _phase_gold_probe():
+    from recommender.materialize import gold_manifest_status
+
+    ok, msg = gold_manifest_status()
+    if not ok:
+        raise RuntimeError(msg)
+
+
+def _phase_posting_store():
+    from recommender.postings import get_posting_store
+
+    if get_posting_store() is None:
+        raise RuntimeError("No posting store built; using SQL paths.")
+
+
+def _phase_popularity_head():
+    from recommender import logic
+
+    logic.load_popularity_head()
+
+
+def _phase_popularity_table():
+    from recommender import popularity
+
+    popularity.get_table()
+
+
+def _phase_stats_sketch():
+    from recommender import stats_snapshot
+
+    stats_snapshot.start_background_refresh()
+    if stats_snapshot.get_snapshot() is None:
+        raise RuntimeError("No stats snapshot yet; building it in the background.")
+
+
+def _phase_metadata_snapshot():
+    from recommender import logic
+
+    logic.load_stats_snapshot()
+
+
+# Ordered: a failed preflight skips the phases that need the backend.
+PHASES: List[Tuple[str, Callable[[], None], bool]] = [
+    ("imports", _phase_imports, False),
+    ("preflight", _phase_preflight, False),
+    ("connect", _phase_connect, True),
+    ("gold_probe", _phase_gold_probe, True),
+    ("posting_store", _phase_posting_store, False),
+    ("popularity_head", _phase_popularity_head, True),
+    ("popularity_table", _phase_popularity_table, True),
+    ("stats_sketch", _phase_stats_sketch, True),
+    ("metadata_snapshot", _phase_metadata_snapshot, True),
+]
+
+
+def _run():
+    with timed_phase("warmup_total"):
+        backend_ok = True
+        for name, fn, needs_backend in PHASES:
+            if needs_backend and not backend_ok:
+                with _lock:
+                    _phases[name] = {"status": "skipped"}
+                continue
+            with timed_phase(name):
+                fn()
+            if name == "preflight" and _phases[name]["status"] != "ok":
+                backend_ok = False
+
+
+def start_warmup() -> bool:
+    """Start the warm-up thread once per process. Returns True if it was started now."""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return False
+        _thread = threading.Thread(target=_run, name="recommender-warmup", daemon=True)
+        _thread.start()
+        return True
+
+
+def wait_for_warmup(timeout: Optional[float] = None) -> bool:
+    t = _thread
+    if t is None:
+        return False
+    t.join(timeout)
+    return not t.is_alive()
+
+
+def mark_interactive():
+    """Record the first moment a page finished rendering (first call wins)."""
+    global _interactive_at
+    with _lock:
+        if _interactive_at is None:
+            _interactive_at = time.time()
+
+
+def startup_report() -> dict:
+    with _lock:
+        phases = {k: dict(v) for k, v in _phases.items()}
+        interactive_at = _interactive_at
+    return {
+        "time_to_first_interactive_s": (
+            round(interactive_at - PROCESS_STARTED_AT, 3) if interactive_at is not None else None
+        ),
+        "warmup_running": bool(_thread is not None and _thread.is_alive()),
+        "phases": phases,
+    }
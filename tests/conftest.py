@@ -0,0 +1,44 @@
+"""Shared fixtures: the local DuckDB backend over Parquet written by the test."""
+import pandas as pd
+import pytest
+
+import db
+from recommender import seed_cache
+
+
+@pytest.fixture
+def local_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("RECOMMENDER_BACKEND", "local")
+    monkeypatch.setenv("RECOMMENDER_LOCAL_DIR", str(tmp_path))
+    monkeypatch.setattr(db, "_local_conn", None)
+    monkeypatch.setenv("RECOMMENDER_SINGLE_FLIGHT", "0")
+    seed_cache.clear_caches()
+    yield tmp_path
+    if db._local_conn is not None:
+        db._local_conn.close()
+    seed_cache.clear_caches()
+
+
+@pytest.fixture
+def write_star(local_dir):
+    """Write fact_playlist_track, dim_track and dim_playlist from {playlist_id: [track_uri, ...]}."""
+
+    def write(playlists: dict):
+        fact = pd.DataFrame(
+            [(p, t) for p, tracks in playlists.items() for t in tracks], columns=["playlist_id", "track_uri"]
+        )
+        uris = sorted(set(fact["track_uri"]))
+        dim = pd.DataFrame({
+            "track_uri": uris,
+            "track_title": [f"Title {u}" for u in uris],
+            "artist_name": [f"Artist {u[-1]}" for u in uris],
+        })
+        fact.to_parquet(local_dir / "fact_playlist_track.parquet", index=False)
+        dim.to_parquet(local_dir / "dim_track.parquet", index=False)
+        pd.DataFrame({"playlist_id": list(playlists), "playlist_name": list(playlists)}).to_parquet(
+            local_dir / "dim_playlist.parquet", index=False
+        )
+        db.refresh_local_views()
+        return fact
+
+    return write
@@ -0,0 +1,98 @@
+"""MicroBatcher scatter/gather and batched co-occurrence evaluation."""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from db import DeadlineExceeded, deadline_scope
+from recommender import batching
+from recommender.batching import RESULT_COLUMNS, MicroBatcher
+
+
+def test_results_scatter_back_in_order():
+    seen = []
+
+    def fn(items):
+        seen.append(list(items))
+        return [i * 10 for i in items]
+
+    b = MicroBatcher(fn, window_ms=200, max_batch=8)
+    futs = [b.submit(i) for i in range(8)]
+    assert [f.result(timeout=5) for f in futs] == [i * 10 for i in range(8)]
+    assert seen == [list(range(8))]
+    assert b.stats()["batches"] == 1 and b.stats()["requests"] == 8
+
+
+def test_error_fans_out_to_the_whole_batch():
+    def fn(items):
+        raise ValueError("boom")
+
+    b = MicroBatcher(fn, window_ms=200, max_batch=3)
+    futs = [b.submit(i) for i in range(3)]
+    for f in futs:
+        with pytest.raises(ValueError, match="boom"):
+            f.result(timeout=5)
+    assert b.stats()["errors"] == 1
+
+
+def test_caller_deadline_while_waiting_on_a_batch():
+    release = threading.Event()
+
+    def fn(items):
+        release.wait(5)
+        return list(items)
+
+    b = MicroBatcher(fn, window_ms=0, max_batch=1)
+    started = time.monotonic()
+    try:
+        with deadline_scope(time.monotonic() + 0.2):
+            with pytest.raises(DeadlineExceeded):
+                b("x")
+        assert time.monotonic() - started < 2
+    finally:
+        release.set()
+    assert b("y") == "y"
+
+
+def _expected(playlists, seeds, k):
+    fact = pd.DataFrame([(p, t) for p, ts in playlists.items() for t in ts], columns=["pl", "t"])
+    hit = fact.loc[fact["t"].isin(seeds), "pl"].unique()
+    rows = fact[fact["pl"].isin(hit) & ~fact["t"].isin(seeds)].drop_duplicates()
+    counts = rows.groupby("t").size()
+    top = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+    return {t: int(c) for t, c in top}
+
+
+PLAYLISTS = {
+    "p1": ["a", "b", "c"],
+    "p2": ["a", "b"],
+    "p3": ["b", "c", "d"],
+    "p4": ["lonely"],
+}
+
+
+def test_batch_without_any_cooccurring_track(write_star):
+    write_star(PLAYLISTS)
+    out = batching._evaluate_cooccurrence([(("lonely",), 10), (("lonely",), 3)])
+    assert len(out) == 2
+    for df in out:
+        assert df.empty and list(df.columns) == RESULT_COLUMNS
+
+
+def test_mixed_batch(write_star):
+    write_star(PLAYLISTS)
+    requests = [(("a",), 10), (("lonely",), 10), (("b", "c"), 2)]
+    out = batching._evaluate_cooccurrence(requests)
+    assert out[1].empty and list(out[1].columns) == RESULT_COLUMNS
+    for (seeds, k), df in zip([requests[0], requests[2]], [out[0], out[2]]):
+        assert list(df.columns) == RESULT_COLUMNS
+        assert dict(zip(df["track_uri"], df["score"])) == _expected(PLAYLISTS, seeds, k)
+        assert (df["track_title"] == "Title " + df["track_uri"]).all()
+
+
+def test_cooccurrence_through_the_batcher(write_star, monkeypatch):
+    write_star(PLAYLISTS)
+    monkeypatch.setattr(batching, "_cooccurrence_batcher", None)
+    assert batching.cooccurrence(["lonely"], 5).empty
+    assert list(batching.cooccurrence(["a"], 5)["track_uri"]) == ["b", "c"]
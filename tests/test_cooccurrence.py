@@ -0,0 +1,72 @@
+"""build_topn / neighbors_frame against a brute-force pair count."""
+from collections import Counter
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommender.cooccurrence import build_topn, csr_from_pairs, neighbors_frame
+
+
+def _playlists(seed, n_playlists=300, n_items=60):
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, n_items + 1)
+    weights /= weights.sum()
+    rows = []
+    for p in range(n_playlists):
+        # Duplicates inside a playlist are dropped by csr_from_pairs; single-item playlists add no pairs.
+        for item in rng.choice(n_items, size=int(rng.integers(1, 12)), p=weights):
+            rows.append((f"pl{p}", f"item{int(item):03d}"))
+    return pd.DataFrame(rows, columns=["playlist_id", "item"])
+
+
+def _brute_force(df, top_n):
+    counts = Counter()
+    for _, items in df.groupby("playlist_id")["item"]:
+        counts.update(permutations(sorted(set(items)), 2))
+    rows = sorted(((a, b, c) for (a, b), c in counts.items()), key=lambda r: (r[0], -r[2], r[1]))
+    out, rank, prev = [], 0, None
+    for a, b, c in rows:
+        rank = rank + 1 if a == prev else 1
+        prev = a
+        if rank <= top_n:
+            out.append((a, b, c, rank))
+    return out
+
+
+@pytest.mark.parametrize("workers,chunks,shards", [(1, 1, 1), (1, 7, 5), (2, 9, 3)])
+@pytest.mark.parametrize("top_n", [3, 1000])
+def test_build_topn_matches_brute_force(workers, chunks, shards, top_n):
+    df = _playlists(seed=workers * 10 + chunks)
+    offsets, codes, values = csr_from_pairs(df["playlist_id"], df["item"])
+    out, report = build_topn(offsets, codes, top_n=top_n, workers=workers, chunks=chunks, shards=shards,
+                             progress=None)
+    got = [(values[i], values[n], int(s), int(r)) for i, n, s, r in out.itertuples(index=False)]
+    assert got == _brute_force(df, top_n)
+    assert report["rows"] == len(got)
+    assert (report["chunks"] > 1) == (chunks > 1)
+
+
+def test_ties_break_by_lower_neighbor():
+    # "b", "c" and "d" each share exactly one playlist with "a".
+    df = pd.DataFrame({"playlist_id": ["p1", "p1", "p2", "p2", "p3", "p3"],
+                       "item": ["a", "d", "a", "b", "c", "a"]})
+    frame, _ = neighbors_frame(df["playlist_id"], df["item"], "item", top_n=2, workers=1, progress=None)
+    a = frame[frame["item"] == "a"]
+    assert list(a["neighbor_item"]) == ["b", "c"]
+    assert list(a["shared_playlists"]) == [1, 1] and list(a["neighbor_rank"]) == [1, 2]
+
+
+def test_neighbors_frame_columns_and_values():
+    df = _playlists(seed=4, n_playlists=120)
+    frame, _ = neighbors_frame(df["playlist_id"], df["item"], "artist", top_n=5, workers=2, chunks=6, shards=4,
+                               progress=None)
+    assert list(frame.columns) == ["artist", "neighbor_artist", "shared_playlists", "neighbor_rank"]
+    assert list(frame.itertuples(index=False, name=None)) == _brute_force(df, 5)
+
+
+def test_no_pairs():
+    df = pd.DataFrame({"playlist_id": ["p1", "p2"], "item": ["a", "b"]})
+    frame, report = neighbors_frame(df["playlist_id"], df["item"], "item", top_n=5, workers=1, progress=None)
+    assert frame.empty and report["rows"] == 0
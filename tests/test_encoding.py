@@ -0,0 +1,9 @@
+from recommender.encoding import IdDictionary
+
+
+def test_lookup_does_not_insert():
+    d = IdDictionary("track_uri")
+    codes = d.encode(["a", "b"])
+    assert d.lookup(["b", "zzz", "a"]).tolist() == [int(codes[1]), -1, int(codes[0])]
+    assert len(d) == 2
+    assert d.lookup([]).tolist() == []
@@ -0,0 +1,78 @@
+"""FrameStore namespace caps and LRU order."""
+import pandas as pd
+import pytest
+
+from recommender import frame_store
+from recommender.frame_store import FrameStore
+
+
+def _df(i):
+    return pd.DataFrame({"x": [i]})
+
+
+def _keys(store, ns):
+    return list(store.entries(ns)["key"])[::-1]   # least recently used first
+
+
+def test_namespace_cap_evicts_least_recently_used():
+    store = FrameStore(1 << 30, limits={"runs": 3})
+    for i in range(5):
+        store.put("runs", i, _df(i))
+        store.put("other", i, _df(i))
+    assert _keys(store, "runs") == ["2", "3", "4"]
+    assert len(_keys(store, "other")) == 5
+
+    assert store.get("runs", 2) is not None
+    store.put("runs", 5, _df(5))
+    assert _keys(store, "runs") == ["4", "2", "5"]
+    assert store.stats()["namespaces"]["runs"]["evictions"] == 3
+
+
+def test_replacing_a_key_does_not_count_against_the_cap():
+    store = FrameStore(1 << 30, limits={"runs": 2})
+    store.put("runs", "a", _df(1))
+    store.put("runs", "b", _df(2))
+    store.put("runs", "a", _df(3))
+    assert _keys(store, "runs") == ["'b'", "'a'"]
+    assert store.get("runs", "a")["x"].tolist() == [3]
+
+
+def test_byte_budget_and_clear_keep_namespaces_consistent():
+    store = FrameStore(1 << 30, limits={"a": 10})
+    for i in range(4):
+        store.put("a", i, _df(i))
+        store.put("b", i, _df(i))
+    store.max_bytes = store.stats()["bytes"] // 2
+    store.put("b", 99, _df(99))
+    stats = store.stats()
+    assert stats["bytes"] <= store.max_bytes
+    assert sum(ns["entries"] for ns in stats["namespaces"].values()) == stats["entries"]
+
+    store.clear("b")
+    assert _keys(store, "b") == []
+    store.put("a", 100, _df(100))
+    store.clear()
+    assert store.stats()["entries"] == 0 and store.stats()["bytes"] == 0
+
+
+def test_repetitive_text_is_dictionary_encoded():
+    n = 200
+    df = pd.DataFrame({
+        "track_uri": [f"spotify:track:{i}" for i in range(n)],
+        "artist_name": [f"Artist {i % 5}" for i in range(n)],
+        "score": range(n),
+    })
+    store = FrameStore(1 << 30)
+    store.put("recs", "k", df)
+    out = store.get("recs", "k")
+    assert isinstance(out["artist_name"].dtype, pd.CategoricalDtype)
+    assert not isinstance(out["track_uri"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(out.astype({"artist_name": df["artist_name"].dtype}), df, check_dtype=False)
+
+
+def test_packed_text_is_an_arrow_dictionary():
+    pa = pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"artist_name": ["a", "b"] * 50, "track_title": pd.Series(["x", "y"] * 50, dtype=object)})
+    schema = pa.ipc.open_stream(pa.py_buffer(frame_store.pack(df))).schema
+    assert pa.types.is_dictionary(schema.field("artist_name").type)
+    assert pa.types.is_dictionary(schema.field("track_title").type)
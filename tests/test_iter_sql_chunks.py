@@ -0,0 +1,69 @@
+"""iter_sql_chunks releases what it opened, on both backends."""
+import pandas as pd
+import pytest
+
+import db
+
+
+class _Cursor:
+    description = [("x",)]
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = [(i,) for i in range(5)]
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, n):
+        out, self.rows = self.rows[:n], self.rows[n:]
+        return out
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self.conn.cursor_closed = True
+
+
+class _Connection:
+    def __init__(self):
+        self.closed = self.cursor_closed = False
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def warehouse(monkeypatch):
+    monkeypatch.setenv("RECOMMENDER_BACKEND", "databricks")
+    conns = []
+
+    def get_connection():
+        conns.append(_Connection())
+        return conns[-1]
+
+    monkeypatch.setattr(db, "get_connection", get_connection)
+    return conns
+
+
+def test_closes_the_connection_outside_streamlit(warehouse):
+    chunks = list(db.iter_sql_chunks("SELECT x FROM t", chunk_rows=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert warehouse[0].cursor_closed and warehouse[0].closed
+
+
+def test_closes_the_connection_when_abandoned(warehouse):
+    it = db.iter_sql_chunks("SELECT x FROM t", chunk_rows=2)
+    next(it)
+    it.close()
+    assert warehouse[0].cursor_closed and warehouse[0].closed
+
+
+def test_local_backend(write_star):
+    write_star({"p1": ["a", "b"], "p2": ["c"]})
+    chunks = list(db.iter_sql_chunks("SELECT track_uri FROM default.fact_playlist_track ORDER BY 1", chunk_rows=2))
+    assert pd.concat(chunks)["track_uri"].tolist() == ["a", "b", "c"]
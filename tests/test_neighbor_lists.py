@@ -0,0 +1,104 @@
+"""threshold_topk must equal the exact count (top_counts over cooccurrence_counts), ties included."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommender import neighbor_lists
+from recommender.postings import build_posting_store, get_posting_store, top_counts
+
+
+def _store(tmp_path, rows):
+    build_posting_store(str(tmp_path / "postings"), pd.DataFrame(rows, columns=["track_uri", "playlist_id"]))
+    return get_posting_store(str(tmp_path / "postings"))
+
+
+def _random_store(tmp_path, n_tracks=400, n_playlists=300, seed=0):
+    rng = np.random.default_rng(seed)
+    # Zipf-like popularity, so there are hits, long tails and many tied counts.
+    weights = 1.0 / np.arange(1, n_tracks + 1) ** 0.8
+    weights /= weights.sum()
+    rows = []
+    for p in range(n_playlists):
+        for t in rng.choice(n_tracks, size=int(rng.integers(3, 30)), replace=False, p=weights):
+            rows.append((f"t{t:04d}", f"p{p:04d}"))
+    return _store(tmp_path, rows)
+
+
+def _exact(store, codes, k):
+    idx, scores = top_counts(store.cooccurrence_counts(codes), k)
+    return idx.tolist(), scores.tolist()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_lists():
+    neighbor_lists.clear()
+    yield
+    neighbor_lists.clear()
+
+
+def test_single_seed_matches_exact(tmp_path):
+    store = _random_store(tmp_path)
+    for code in range(0, store.n_tracks, 17):
+        got = neighbor_lists.threshold_topk(store, [code], 10)
+        assert got is not None
+        assert (got[0].tolist(), got[1].tolist()) == _exact(store, [code], 10)
+
+
+@pytest.mark.parametrize("depth", [1000, 40, 8])
+def test_multi_seed_matches_exact_or_falls_back(tmp_path, monkeypatch, depth):
+    monkeypatch.setattr(neighbor_lists, "DEPTH", depth)
+    store = _random_store(tmp_path, seed=depth)
+    rng = np.random.default_rng(depth)
+    answered = 0
+    for _ in range(60):
+        seeds = rng.choice(store.n_tracks, size=int(rng.integers(2, 6)), replace=False).tolist()
+        k = int(rng.integers(1, 25))
+        got = neighbor_lists.threshold_topk(store, seeds, k)
+        if got is None:
+            continue
+        answered += 1
+        assert (got[0].tolist(), got[1].tolist()) == _exact(store, seeds, k)
+    assert answered > 0
+
+
+def test_ties_at_kth_score_are_broken_by_track_code(tmp_path):
+    # s0 and s1 each share one playlist with six tracks; every candidate scores 1.
+    rows = [("s0", "p0"), ("s1", "p1")]
+    rows += [(f"c{i}", "p0") for i in range(3)] + [(f"c{i}", "p1") for i in range(3, 6)]
+    store = _store(tmp_path, rows)
+    seeds = store.track_codes(["s0", "s1"]).tolist()
+    got = neighbor_lists.threshold_topk(store, seeds, 4)
+    assert got is not None
+    assert (got[0].tolist(), got[1].tolist()) == _exact(store, seeds, 4)
+    assert got[1].tolist() == [1, 1, 1, 1]
+
+
+def test_truncated_list_with_tail_bound(tmp_path, monkeypatch):
+    monkeypatch.setattr(neighbor_lists, "DEPTH", 3)
+    # "a" shares 5 playlists with the seed, "b" 4, "c" 3; ten fillers share one each.
+    rows = [("s", f"p{i}") for i in range(5)]
+    rows += [("a", f"p{i}") for i in range(5)] + [("b", f"p{i}") for i in range(4)] + [("c", f"p{i}") for i in range(3)]
+    rows += [(f"f{i}", f"p{i % 5}") for i in range(10)]
+    store = _store(tmp_path, rows)
+    seed = store.track_codes(["s"]).tolist()
+    codes, counts, tail = neighbor_lists.neighbor_list(store, seed[0])
+    assert len(codes) == 3 and int(tail[0]) == 1
+    got = neighbor_lists.threshold_topk(store, seed, 2)
+    assert got is not None
+    assert (got[0].tolist(), got[1].tolist()) == _exact(store, seed, 2)
+
+
+def test_falls_back_when_truncated_list_cannot_prove_top_k(tmp_path, monkeypatch):
+    monkeypatch.setattr(neighbor_lists, "DEPTH", 2)
+    # Every neighbor shares exactly one playlist, so the tail bound ties the list.
+    rows = [("s", "p0")] + [(f"c{i}", "p0") for i in range(6)]
+    store = _store(tmp_path, rows)
+    seed = store.track_codes(["s"]).tolist()
+    assert neighbor_lists.threshold_topk(store, seed, 2) is None
+    assert neighbor_lists.stats()["fallbacks"] >= 1
+
+
+def test_empty_and_unknown_seeds(tmp_path):
+    store = _random_store(tmp_path)
+    idx, scores = neighbor_lists.threshold_topk(store, [-1], 5)
+    assert len(idx) == 0 and len(scores) == 0
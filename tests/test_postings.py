@@ -0,0 +1,71 @@
+"""Posting-list kernels against brute-force set intersections."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommender import postings
+from recommender.postings import build_posting_store, get_posting_store, intersection_counts
+
+
+def _random_postings(rng, n, max_code, max_len):
+    return [np.sort(rng.choice(max_code, size=int(rng.integers(0, max_len)), replace=False)).astype(np.int32)
+            for _ in range(n)]
+
+
+def _brute(seeds, cands):
+    return np.array([[len(set(s.tolist()) & set(c.tolist())) for c in cands] for s in seeds], dtype=np.int32).reshape(
+        len(seeds), len(cands))
+
+
+@pytest.mark.parametrize("max_code", [50, 5_000, postings._DENSE_LOOKUP_MAX + 1_000])
+def test_intersection_counts_matches_brute_force(max_code):
+    rng = np.random.default_rng(max_code)
+    for _ in range(30):
+        seeds = _random_postings(rng, int(rng.integers(0, 6)), max_code, 40)
+        cands = _random_postings(rng, int(rng.integers(0, 12)), max_code, 40)
+        np.testing.assert_array_equal(intersection_counts(seeds, cands), _brute(seeds, cands))
+
+
+def test_intersection_counts_in_chunks(monkeypatch):
+    # Force many small expansion chunks.
+    monkeypatch.setattr(postings, "_CHUNK_PAIRS", 7)
+    rng = np.random.default_rng(1)
+    seeds = _random_postings(rng, 5, 60, 30)
+    cands = _random_postings(rng, 9, 60, 30)
+    np.testing.assert_array_equal(intersection_counts(seeds, cands), _brute(seeds, cands))
+
+
+def test_intersection_counts_empty_postings():
+    empty = np.zeros(0, dtype=np.int32)
+    some = np.array([1, 4, 9], dtype=np.int32)
+    assert intersection_counts([], [some]).shape == (0, 1)
+    assert intersection_counts([some], []).shape == (1, 0)
+    np.testing.assert_array_equal(intersection_counts([empty, some], [some, empty]), [[0, 0], [3, 0]])
+    np.testing.assert_array_equal(intersection_counts([empty], [empty]), [[0]])
+
+
+def test_cooccurrence_counts_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(7)
+    rows = [(f"t{t:03d}", f"p{p:03d}") for p in range(80) for t in rng.choice(150, size=int(rng.integers(1, 20)), replace=False)]
+    df = pd.DataFrame(rows, columns=["track_uri", "playlist_id"])
+    build_posting_store(str(tmp_path / "postings"), df)
+    store = get_posting_store(str(tmp_path / "postings"))
+    members = df.groupby("track_uri")["playlist_id"].apply(set).to_dict()
+    uris = [u.decode() for u in store.track_uris]
+
+    for _ in range(20):
+        seeds = list(rng.choice(uris, size=int(rng.integers(1, 5)), replace=False)) + ["t999-missing"]
+        codes = store.track_codes(seeds)
+        assert codes[-1] == -1
+        counts = store.cooccurrence_counts(codes)
+        seed_playlists = set().union(*(members[s] for s in seeds[:-1]))
+        expected = [0 if u in seeds else len(members[u] & seed_playlists) for u in uris]
+        np.testing.assert_array_equal(counts, expected)
+
+
+def test_cooccurrence_counts_only_missing_seeds(tmp_path):
+    build_posting_store(str(tmp_path / "postings"), pd.DataFrame({"track_uri": ["a", "b"], "playlist_id": ["p", "p"]}))
+    store = get_posting_store(str(tmp_path / "postings"))
+    codes = store.track_codes(["zzz"])
+    assert codes.tolist() == [-1]
+    assert store.cooccurrence_counts(codes).tolist() == [0, 0]
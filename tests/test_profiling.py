@@ -0,0 +1,23 @@
+"""Saved profiles are capped at RECOMMENDER_PROFILE_MAX."""
+import os
+
+from recommender import profiling
+
+
+def _record(i):
+    return {"id": f"{i:06d}abcdef", "name": "Input", "started_at": f"2026-01-01T00:00:{i:02d}"}
+
+
+def test_save_keeps_the_newest_profiles(monkeypatch, tmp_path):
+    monkeypatch.setenv("RECOMMENDER_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("RECOMMENDER_PROFILE_MAX", "3")
+    paths = [profiling.save(_record(i)) for i in range(6)]
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in paths[-3:])
+
+
+def test_prune_keep(monkeypatch, tmp_path):
+    monkeypatch.setenv("RECOMMENDER_PROFILE_DIR", str(tmp_path))
+    paths = [profiling.save(_record(i)) for i in range(4)]
+    assert profiling.prune(keep=1) == 3
+    assert os.listdir(tmp_path) == [os.path.basename(paths[-1])]
+    assert profiling.prune(keep=1) == 0
@@ -0,0 +1,122 @@
+"""Router cost models and decisions, with exploration off."""
+import time
+
+import numpy as np
+import pytest
+
+from recommender import popularity, router
+from recommender.encoding import TRACKS
+
+
+@pytest.fixture
+def fresh_router(monkeypatch, tmp_path):
+    monkeypatch.setenv("RECOMMENDER_BACKEND", "local")
+    monkeypatch.setenv("RECOMMENDER_ROUTER_DIR", str(tmp_path))
+    monkeypatch.setenv("RECOMMENDER_ROUTER_EXPLORE", "0")
+    monkeypatch.setattr(router, "_models", {})
+    monkeypatch.setattr(router, "_loaded", True)
+    monkeypatch.setattr(router, "get_posting_store", lambda: object())
+    # Fan-out of a seed "n<k>" is k playlists.
+    monkeypatch.setattr(router, "seed_degrees", lambda uris: np.array([int(u[1:]) for u in uris], dtype=np.int64))
+    return router
+
+
+def _train(engine, substrate, a, b, fanouts=range(0, 200_001, 2_000)):
+    m = router._model(engine, substrate)
+    for f in fanouts:
+        m.add(f, a + b * f)
+    return m
+
+
+def test_cost_model_recovers_a_line():
+    m = router.CostModel((0.2, 3e-6))
+    for f in range(0, 100_001, 500):
+        m.add(f, 0.2 + 3e-6 * f)
+    assert m.coefficients() == pytest.approx((0.2, 3e-6))
+    assert m.max_fanout(0.2 + 3e-6 * 50_000) == pytest.approx(50_000, abs=1)
+    assert m.max_fanout(0.1) == 0
+
+
+def test_samples_pull_the_fit_away_from_the_prior():
+    m = router.CostModel((0.5, 1e-6))
+    a0, b0 = m.coefficients()
+    for f in range(0, 100_001, 500):
+        m.add(f, 0.2 + 3e-6 * f)
+    a, b = m.coefficients()
+    assert abs(a - 0.2) < abs(a0 - 0.2) and abs(b - 3e-6) < abs(b0 - 3e-6)
+
+
+def test_cost_model_never_predicts_negative_slope():
+    m = router.CostModel((0.01, 1e-6))
+    for f in range(0, 50_001, 1_000):
+        m.add(f, 1.0 - 1e-5 * f)
+    a, b = m.coefficients()
+    assert b >= 0 and a >= 0
+
+
+def test_decision_flips_at_fitted_crossover(fresh_router):
+    # Posting store: cheap fixed cost, steep slope; SQL: expensive fixed cost, flat slope.
+    _train(router.ENGINE_LOCAL, "postings", 0.005, 2e-6)
+    _train(router.ENGINE_SQL, "local", 0.2, 1e-7)
+    crossover = router.thresholds()["local"]
+    a_l, b_l = router._model(router.ENGINE_LOCAL, "postings").coefficients()
+    a_s, b_s = router._model(router.ENGINE_SQL, "local").coefficients()
+    assert crossover == int((a_s - a_l) / (b_l - b_s))
+    assert crossover == pytest.approx((0.2 - 0.005) / (2e-6 - 1e-7), rel=0.1)
+
+    below = router.route([f"n{crossover - 500}"])
+    above = router.route([f"n{crossover + 500}"])
+    assert (below.engine, below.reason) == (router.ENGINE_LOCAL, "cheapest")
+    assert (above.engine, above.reason) == (router.ENGINE_SQL, "cheapest")
+    assert not below.explored and not above.explored
+
+
+def test_recorded_latencies_move_the_crossover(fresh_router):
+    _train(router.ENGINE_LOCAL, "postings", 0.005, 2e-6)
+    _train(router.ENGINE_SQL, "local", 0.2, 1e-7)
+    before = router.thresholds()["local"]
+    for f in range(0, 200_001, 2_000):
+        router.record(router.Decision(router.ENGINE_SQL, "local", "cheapest", ["x"], f, {}, None, None, False),
+                      0.4 + 1e-7 * f, "exact")
+    assert router.thresholds()["local"] > before
+    assert len(router._tail(5)) == 5
+
+
+def test_over_budget_goes_to_budgeted_within_the_budget(fresh_router):
+    _train(router.ENGINE_LOCAL, "postings", 0.005, 2e-6)
+    _train(router.ENGINE_SQL, "local", 0.2, 1e-7)
+    _train(router.ENGINE_BUDGETED, "postings", 0.005, 2e-6)
+    d = router.route(["n100000", "n100000"], deadline=time.monotonic() + 0.1)
+    assert (d.engine, d.reason) == (router.ENGINE_BUDGETED, "over_budget")
+    assert 0 < d.max_fanout < d.fanout
+    assert router._model(router.ENGINE_BUDGETED, "postings").predict(d.max_fanout) <= 0.1 * router._SAFETY
+
+    relaxed = router.route(["n20000", "n20000"], deadline=time.monotonic() + 60)
+    assert relaxed.engine == router.ENGINE_LOCAL
+
+
+def test_unknown_fanout_uses_fixed_precedence(fresh_router):
+    d = router.route(None)
+    assert (d.engine, d.reason) == (router.ENGINE_LOCAL, "no_estimate")
+
+
+def test_exploration_picks_runner_up_only_when_close(fresh_router, monkeypatch):
+    monkeypatch.setenv("RECOMMENDER_ROUTER_EXPLORE", "1")
+    _train(router.ENGINE_LOCAL, "postings", 0.010, 0.0)
+    _train(router.ENGINE_SQL, "local", 0.015, 0.0)
+    d = router.route(["n10"])
+    assert (d.engine, d.reason, d.explored) == (router.ENGINE_SQL, "explore", True)
+    router._models.clear()
+    _train(router.ENGINE_LOCAL, "postings", 0.010, 0.0)
+    _train(router.ENGINE_SQL, "local", 0.5, 0.0)
+    assert router.route(["n10"]).engine == router.ENGINE_LOCAL
+
+
+def test_seed_degrees_does_not_grow_the_track_dictionary(monkeypatch):
+    TRACKS.encode(["known"])
+    pop = np.zeros(len(TRACKS), dtype=np.int32)
+    pop[TRACKS.lookup(["known"])[0]] = 7
+    monkeypatch.setattr(popularity, "_table", popularity.PopularityTable(pop, "test"))
+    n = len(TRACKS)
+    assert router.seed_degrees(["known", "typed-by-a-user"]).tolist() == [7, 0]
+    assert len(TRACKS) == n
@@ -0,0 +1,33 @@
+"""Run store listing while runs are pruned underneath it."""
+import shutil
+
+import pandas as pd
+import pytest
+
+from recommender import run_store
+
+
+@pytest.fixture
+def runs(monkeypatch, tmp_path):
+    monkeypatch.setenv("RECOMMENDER_RUN_DIR", str(tmp_path))
+    ids = []
+    for i in range(3):
+        inputs = {"seed_track_uris": [f"spotify:track:{i}"], "model": "Co-occurrence", "seed_mode": "Track name"}
+        pool = pd.DataFrame({"track_uri": [f"spotify:track:{i + 10}"], "score": [1]})
+        ids.append(run_store.save_run(inputs, pool, {}))
+    return tmp_path, ids
+
+
+def test_list_runs(runs):
+    _, ids = runs
+    listed = run_store.list_runs()
+    assert sorted(listed["run_id"]) == sorted(ids)
+    assert (listed["signals"] == 0).all()
+
+
+@pytest.mark.parametrize("removed", ["signals", "run"])
+def test_list_runs_skips_a_run_removed_mid_listing(runs, removed):
+    root, ids = runs
+    target = root / ids[1] / "signals" if removed == "signals" else root / ids[1]
+    shutil.rmtree(target)
+    assert sorted(run_store.list_runs()["run_id"]) == sorted([ids[0], ids[2]])
@@ -0,0 +1,50 @@
+"""HTTP error mapping of the service endpoints (handlers called directly, no server)."""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("starlette")
+
+from starlette.requests import Request  # noqa: E402
+
+from recommender import service  # noqa: E402
+
+
+def _request(method="GET", path="/", body=b""):
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+    sent = []
+
+    async def receive():
+        if sent:
+            return {"type": "http.disconnect"}
+        sent.append(True)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+def _call(handler, request):
+    response = asyncio.run(handler(request))
+    return response.status_code, json.loads(response.body)
+
+
+def test_bad_request_is_400_and_internal_value_error_is_500():
+    @service._endpoint("t_bad")
+    async def bad(request):
+        raise service._BadRequest("`limit` must be an integer")
+
+    @service._endpoint("t_bug")
+    async def bug(request):
+        raise ValueError("The truth value of an array is ambiguous")
+
+    assert _call(bad, _request()) == (400, {"error": "`limit` must be an integer"})
+    status, body = _call(bug, _request())
+    assert status == 500 and body["error"].startswith("ValueError: ")
+
+
+@pytest.mark.parametrize("body", [b"[1]", b'"seeds"', b"3", b"not json", b'{"seeds": "a", "candidates": ["b"]}',
+                                  b'{"seeds": [], "candidates": ["b"]}'])
+def test_explain_rejects_malformed_bodies(body):
+    status, out = _call(service.explain, _request("POST", "/explain", body))
+    assert status == 400, out
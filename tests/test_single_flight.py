@@ -0,0 +1,125 @@
+"""Single-flight coalescing of identical reads on the local backend."""
+import threading
+import time
+
+import pytest
+
+import db
+
+QUERY = "SELECT playlist_id, track_uri FROM default.fact_playlist_track ORDER BY playlist_id, track_uri"
+
+
+@pytest.fixture
+def star(write_star, monkeypatch):
+    monkeypatch.setenv("RECOMMENDER_SINGLE_FLIGHT", "1")
+    monkeypatch.delenv("RECOMMENDER_SINGLEFLIGHT_DIR", raising=False)
+    write_star({"p1": ["a", "b"], "p2": ["b", "c"]})
+
+
+class _Gated:
+    """Wraps db._execute_sql: counts executions and holds them until released."""
+
+    def __init__(self, monkeypatch, fail=None):
+        self.inner = db._execute_sql
+        self.calls = 0
+        self.gate = threading.Event()
+        self.fail = list(fail or [])
+        self._lock = threading.Lock()
+        monkeypatch.setattr(db, "_execute_sql", self)
+
+    def __call__(self, query, params=None):
+        with self._lock:
+            self.calls += 1
+            error = self.fail.pop(0) if self.fail else None
+        self.gate.wait(5)
+        if error is not None:
+            raise error
+        return self.inner(query, params)
+
+
+def _run(n, queries):
+    out = [None] * n
+
+    def call(i):
+        try:
+            out[i] = db.execute_sql(queries[i])
+        except BaseException as e:
+            out[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return out, threads
+
+
+def _wait_coalesced(before, n):
+    deadline = time.monotonic() + 5
+    while db.single_flight_stats()["coalesced"] - before < n:
+        assert time.monotonic() < deadline, "followers never joined the flight"
+        time.sleep(0.005)
+
+
+def test_concurrent_identical_reads_execute_once(star, monkeypatch):
+    gated = _Gated(monkeypatch)
+    before = db.single_flight_stats()["coalesced"]
+    # Formatting differences still coalesce.
+    queries = [QUERY if i % 2 else "  " + QUERY.replace(" ", "\n  ") for i in range(6)]
+    out, threads = _run(6, queries)
+    _wait_coalesced(before, 5)
+    gated.gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert gated.calls == 1
+    expected = out[0]
+    for df in out:
+        assert list(df.itertuples(index=False)) == list(expected.itertuples(index=False))
+    assert len({id(df) for df in out}) == 6
+    out[1].loc[0, "track_uri"] = "mutated"
+    assert (out[2]["track_uri"] != "mutated").all()
+    assert db.single_flight_stats()["in_flight"] == 0
+
+
+def test_leader_error_reaches_followers(star, monkeypatch):
+    gated = _Gated(monkeypatch, fail=[RuntimeError("warehouse down")])
+    before = db.single_flight_stats()["coalesced"]
+    out, threads = _run(4, [QUERY] * 4)
+    _wait_coalesced(before, 3)
+    gated.gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert gated.calls == 1
+    assert all(isinstance(e, RuntimeError) and "warehouse down" in str(e) for e in out)
+
+
+@pytest.mark.parametrize("error", [db.QueryCancelled("cancelled"), db.DeadlineExceeded("late")])
+def test_followers_rerun_when_the_leader_is_cancelled(star, monkeypatch, error):
+    gated = _Gated(monkeypatch, fail=[error])
+    before = db.single_flight_stats()["coalesced"]
+    out, threads = _run(4, [QUERY] * 4)
+    _wait_coalesced(before, 3)
+    gated.gate.set()
+    for t in threads:
+        t.join(5)
+
+    failed = [e for e in out if isinstance(e, BaseException)]
+    assert failed == [error]
+    assert sum(len(df) == 4 for df in out if not isinstance(df, BaseException)) == 3
+    assert 2 <= gated.calls <= 4
+
+
+def test_disabled_runs_every_read(star, monkeypatch):
+    monkeypatch.setenv("RECOMMENDER_SINGLE_FLIGHT", "0")
+    inner = db._execute_sql
+    barrier = threading.Barrier(4, timeout=5)
+
+    def all_at_once(query, params=None):
+        barrier.wait()   # breaks unless all four execute concurrently
+        return inner(query, params)
+
+    monkeypatch.setattr(db, "_execute_sql", all_at_once)
+    out, threads = _run(4, [QUERY] * 4)
+    for t in threads:
+        t.join(10)
+    assert all(len(df) == 4 for df in out)
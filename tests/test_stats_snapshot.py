@@ -0,0 +1,114 @@
+"""Sketch math of the stats snapshot and incremental folding of new Parquet files."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+from recommender import stats_snapshot
+from recommender.stats_snapshot import HyperLogLog, SpaceSaving
+
+
+@pytest.mark.parametrize("n", [1_000, 50_000, 400_000])
+def test_hll_error_within_bound(n):
+    hll = HyperLogLog()
+    for chunk in np.array_split(np.arange(n), 4):
+        hll.add(pd.Series([f"spotify:track:{i}" for i in chunk]))
+    # Three standard errors; deterministic because the hash is.
+    assert abs(hll.count() - n) / n <= 3 * hll.relative_error
+
+
+def test_hll_merge_equals_union():
+    a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    left = [f"x{i}" for i in range(30_000)]
+    right = [f"x{i}" for i in range(20_000, 60_000)]
+    a.add(left)
+    b.add(right)
+    both.add(left + right)
+    a.merge(b)
+    np.testing.assert_array_equal(a.registers, both.registers)
+
+
+def _zipf_batches(rng, n_batches=6, n_items=400, batch=3_000):
+    weights = 1.0 / np.arange(1, n_items + 1) ** 1.1
+    weights /= weights.sum()
+    for _ in range(n_batches):
+        items = rng.choice(n_items, size=batch, p=weights)
+        yield pd.Series([f"artist{i}" for i in items]).value_counts()
+
+
+def test_space_saving_bounds_after_several_batches():
+    rng = np.random.default_rng(3)
+    ss = SpaceSaving(capacity=50)
+    true = pd.Series(dtype="int64")
+    for inc in _zipf_batches(rng):
+        ss.update(inc)
+        true = true.add(inc, fill_value=0).astype("int64")
+        got = true.reindex(ss.counts.index).fillna(0).astype("int64")
+        assert ((ss.counts - ss.errors) <= got).all()
+        assert (got <= ss.counts).all()
+        missing = true.drop(ss.counts.index, errors="ignore")
+        assert missing.empty or int(missing.max()) <= ss.floor
+
+
+def test_space_saving_guaranteed_top_is_the_true_top():
+    rng = np.random.default_rng(5)
+    ss = SpaceSaving(capacity=60)
+    true = pd.Series(dtype="int64")
+    for inc in _zipf_batches(rng):
+        ss.update(inc)
+        true = true.add(inc, fill_value=0).astype("int64")
+    assert ss.guaranteed_top(5)
+    expected = set(true.sort_values(ascending=False, kind="mergesort").index[:5])
+    assert set(ss.top(5)["item"]) == expected
+
+
+def _write_part(root, name, part, df):
+    d = root / name
+    d.mkdir(exist_ok=True)
+    df.to_parquet(d / f"{part}.parquet", index=False)
+
+
+def _slice(start, n_playlists, rng):
+    fact, dim = [], {}
+    for p in range(start, start + n_playlists):
+        for t in rng.choice(300, size=int(rng.integers(2, 15)), replace=False):
+            t = int(t) + start // 2   # later slices reach new tracks too
+            fact.append((f"pl{p}", f"tr{t}"))
+            dim[f"tr{t}"] = f"artist{t % 37}"
+    return (pd.DataFrame(fact, columns=["playlist_id", "track_uri"]),
+            pd.DataFrame({"track_uri": list(dim), "track_title": list(dim), "artist_name": list(dim.values())}))
+
+
+def test_incremental_fold_equals_full_rebuild(local_dir):
+    rng = np.random.default_rng(11)
+    for part in range(2):
+        fact, dim = _slice(part * 100, 100, rng)
+        _write_part(local_dir, "fact_playlist_track", part, fact)
+        _write_part(local_dir, "dim_track", part, dim)
+    _write_part(local_dir, "dim_playlist", 0, pd.DataFrame({"playlist_id": ["pl0"], "playlist_name": ["x"]}))
+    snap = stats_snapshot._build_full("local")
+    snap.sources = stats_snapshot._local_sources()
+
+    for part in range(2, 4):
+        fact, dim = _slice(part * 100, 100, rng)
+        _write_part(local_dir, "fact_playlist_track", part, fact)
+        _write_part(local_dir, "dim_track", part, dim)
+    db.refresh_local_views()
+    assert stats_snapshot._fold_new_files(snap, stats_snapshot._local_sources())
+
+    full = stats_snapshot._build_full("local")
+    for name in ("tracks", "playlists", "artists"):
+        np.testing.assert_array_equal(getattr(snap, name).registers, getattr(full, name).registers)
+    np.testing.assert_array_equal(snap.seen_tracks, full.seen_tracks)
+    pd.testing.assert_series_equal(snap.artist_tracks.counts.sort_index(), full.artist_tracks.counts.sort_index())
+
+
+def test_changed_file_forces_rebuild(local_dir):
+    rng = np.random.default_rng(2)
+    fact, dim = _slice(0, 20, rng)
+    _write_part(local_dir, "fact_playlist_track", 0, fact)
+    _write_part(local_dir, "dim_track", 0, dim)
+    snap = stats_snapshot._build_full("local")
+    snap.sources = stats_snapshot._local_sources()
+    _write_part(local_dir, "fact_playlist_track", 0, fact.head(5))
+    assert not stats_snapshot._fold_new_files(snap, stats_snapshot._local_sources())